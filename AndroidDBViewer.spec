@@ -1,16 +1,23 @@
 # -*- mode: python ; coding: utf-8 -*-
 
+# Trimmed bundle: the app needs Flask, waitress and (for XLSX exports)
+# openpyxl. Big packages that happen to be installed in the build
+# environment are kept out; they only slow down the unpacking at startup.
+EXCLUDES = [
+    'pandas', 'numpy', 'matplotlib', 'scipy', 'PIL', 'IPython', 'jupyter',
+    'tkinter', '_tkinter', 'tcl', 'tk', 'pytest', 'setuptools', 'pydoc_data', 'lib2to3',
+]
 
 a = Analysis(
     ['app.py'],
     pathex=[],
     binaries=[],
     datas=[('templates', 'templates'), ('static', 'static')],
-    hiddenimports=['engineio.async_drivers.threading'],
+    hiddenimports=['waitress'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    excludes=EXCLUDES,
     noarchive=False,
     optimize=0,
 )
@@ -25,7 +32,7 @@ exe = EXE(
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
+    upx=False,  # UPX-packed binaries are unpacked on every start
     console=True,
     disable_windowed_traceback=False,
     argv_emulation=False,
@@ -38,7 +45,7 @@ coll = COLLECT(
     a.binaries,
     a.datas,
     strip=False,
-    upx=True,
+    upx=False,  # UPX-packed binaries are unpacked on every start
     upx_exclude=[],
     name='AndroidDBViewer',
 )
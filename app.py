@@ -1,11 +1,28 @@
-from flask import Flask, render_template, jsonify, request, send_file
+from flask import Flask, render_template, jsonify, request, send_file, Response, stream_with_context, g
+from flask.json.provider import DefaultJSONProvider
 import os
 import json
 import uuid
 import time
+import queue
+import atexit
+import sqlite3
 from config import Config
 from modules.adb_interface import ADBInterface
-from modules.db_manager import DBManager
+from modules.db_manager import (DBManager, ConnectionPool, QueryControl, indexable_columns, decode_row_key,
+                                decode_cursor, forget_snapshot)
+from modules.delta_sync import DeltaSync
+from modules.snapshot_store import SnapshotStore
+from modules.query_cursors import CursorRegistry, QueryRegistry
+from modules.db_watcher import WatcherHub
+from modules.snapshot_jobs import SnapshotJobRunner
+from modules.exporter import Exporter, ExportRegistry, FORMATS as EXPORT_FORMATS
+from modules.search_index import SearchIndexer
+from modules.table_index import TableIndexer
+from modules.wal_reader import WalTimeline
+from modules.result_cache import ResultCache
+from modules.blobs import blob_stub, sniff_type, mime_type, hex_preview, protobuf_preview
+from modules.metrics import metrics
 
 import sys
 
@@ -21,11 +38,177 @@ else:
 
 app.config.from_object(Config)
 
-adb = ADBInterface()
 
-# Helper to get DB path from token
+class TimedJSONProvider(DefaultJSONProvider):
+    """jsonify() that records how long encoding a response took."""
+
+    def response(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().response(*args, **kwargs)
+        finally:
+            route = request.url_rule.rule if request and request.url_rule else 'unmatched'
+            metrics.observe('json_serialize_seconds', time.perf_counter() - started, route=route)
+
+    @staticmethod
+    def default(o):
+        # BLOBs are sent as stubs (blobs.wire_row); never fail a response on a stray one
+        if isinstance(o, bytes):
+            return blob_stub(o)
+        return DefaultJSONProvider.default(o)
+
+
+app.json = TimedJSONProvider(app)
+
+if app.config['METRICS_LOG']:
+    metrics.configure_log(app.config['LOG_DIR'], max_bytes=app.config['METRICS_LOG_MAX_BYTES'],
+                          backups=app.config['METRICS_LOG_BACKUPS'])
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    # Label with the route pattern (not the URL) to keep the series count bounded.
+    # Streamed responses (SSE, exports) are timed up to their first byte.
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe('http_request_seconds', time.perf_counter() - started,
+                        route=route, method=request.method, status=response.status_code)
+    return response
+
+adb = ADBInterface(
+    adb_path=app.config['ADB_PATH'],
+    command_timeout=app.config['ADB_COMMAND_TIMEOUT'],
+    root_cache_ttl=app.config['ROOT_CACHE_TTL'],
+    hash_batch_blocks=app.config['DELTA_HASH_BATCH_BLOCKS'],
+)
+# Don't leave persistent `adb shell` sessions behind when the server stops
+atexit.register(adb.transport.close_all)
+delta = DeltaSync(adb, app.config['MIRROR_DIR'], block_pages=app.config['DELTA_BLOCK_PAGES'])
+pool = ConnectionPool(
+    max_idle_per_db=app.config['DB_POOL_MAX_IDLE'],
+    idle_timeout=app.config['DB_POOL_IDLE_TIMEOUT'],
+    mmap_size=app.config['DB_MMAP_SIZE'],
+    cache_size_kib=app.config['DB_CACHE_SIZE_KIB'],
+)
+atexit.register(pool.close_all)
+# Results of read-only queries and table pages, per snapshot content
+result_cache = ResultCache(
+    max_bytes=app.config['RESULT_CACHE_MAX_BYTES'],
+    max_entry_bytes=app.config['RESULT_CACHE_MAX_ENTRY_BYTES'],
+)
+
+def close_snapshot_file(path):
+    pool.close_path(path)
+    result_cache.invalidate(path)
+    forget_snapshot(path)
+
+def on_snapshot_evict(path):
+    close_snapshot_file(path)
+    # The object's indexed working copy (see TableIndexer) goes with it
+    key = os.path.splitext(os.path.basename(path))[0]
+    close_snapshot_file(table_indexes.copy_path(key))
+    table_indexes.forget(key)
+    for view_path in wal_timeline.view_paths(key):
+        close_snapshot_file(view_path)
+    wal_timeline.drop(key)
+
+def collect_cache_metrics():
+    cache_stats = result_cache.stats()
+    return [
+        ('result_cache_hits_total', 'counter', cache_stats['hits'], {}),
+        ('result_cache_misses_total', 'counter', cache_stats['misses'], {}),
+        ('result_cache_evictions_total', 'counter', cache_stats['evictions'], {}),
+        ('result_cache_hit_ratio', 'gauge', cache_stats['hit_rate'], {}),
+        ('result_cache_entries', 'gauge', cache_stats['entries'], {}),
+        ('result_cache_bytes', 'gauge', cache_stats['bytes'], {}),
+    ]
+
+metrics.add_collector(collect_cache_metrics)
+
+# Snapshots are checkpointed once on arrival; pooled handles are closed before eviction
+store = SnapshotStore(
+    app.config['SNAPSHOT_DIR'],
+    keep_per_db=app.config['SNAPSHOTS_PER_DB'],
+    max_bytes=app.config['SNAPSHOT_MAX_BYTES'],
+    prepare=DBManager.prepare_snapshot,
+    on_evict=on_snapshot_evict,
+    keep_work=app.config['SNAPSHOT_FORKS'],
+    keep_wal=app.config['SNAPSHOT_KEEP_WAL'],
+    # A database without snapshots does not need its delta sync mirror
+    on_forget=delta.drop,
+)
+delta.prune(store.db_keys())
+
+# Each commit of a pulled WAL as a read-only database (see /api/wal)
+wal_timeline = WalTimeline(store, app.config['WAL_VIEW_DIR'])
+
+# Full-text indexes of snapshots, stored next to them (see /api/search)
+search = SearchIndexer(store, chunk_rows=app.config['SEARCH_INDEX_CHUNK_ROWS'])
+atexit.register(search.shutdown)
+
+# Indexes for repeatedly sorted/filtered columns, in working copies of snapshots
+table_indexes = TableIndexer(
+    store,
+    min_uses=app.config['TABLE_INDEX_MIN_USES'],
+    min_rows=app.config['TABLE_INDEX_MIN_ROWS'],
+    max_indexes=app.config['TABLE_INDEX_MAX_PER_SNAPSHOT'],
+    on_replace=close_snapshot_file,
+)
+atexit.register(table_indexes.shutdown)
+
+def collect_store_metrics():
+    store_stats = store.stats()
+    return [
+        ('snapshot_store_bytes', 'gauge', store_stats['bytes'], {}),
+        ('snapshot_store_objects', 'gauge', store_stats['objects'], {}),
+        ('snapshot_store_tokens', 'gauge', store_stats['tokens'], {}),
+        ('snapshot_store_forks', 'gauge', store_stats['forks'], {}),
+    ]
+
+metrics.add_collector(collect_store_metrics)
+
+# Server-side cursors of running SQL queries (see /api/query mode='cursor')
+cursors = CursorRegistry(idle_timeout=app.config['QUERY_CURSOR_IDLE_TIMEOUT'])
+atexit.register(cursors.close_all)
+# Running queries by client-chosen id, for /api/query/<query_id>/cancel
+queries = QueryRegistry(cursors)
+
+# Recent exports, for /api/export/status/<export_id>
+exports = ExportRegistry()
+
+# Progress of running pulls, keyed by "device_package_dbname"
+pull_progress = {}
+
+# Helper to get DB path from token (None if unknown or evicted)
 def get_db_path(token):
-    return os.path.join(app.config['TEMP_DIR'], token)
+    if wal_timeline.is_view(token):
+        return wal_timeline.resolve(token)
+    return store.resolve(token)
+
+def number_arg(source, name, default=None, kind=int, minimum=None):
+    """source[name] (request args or JSON body) as an int or float, raised to
+    `minimum`; `default` if it is missing. Raises ValueError with a message
+    for the client if it is not a number."""
+    value = (source or {}).get(name)
+    if value is None or value == '':
+        return default
+    try:
+        number = kind(value)
+    except (TypeError, ValueError, OverflowError):
+        number = None
+    if number is None or number != number or number in (float('inf'), float('-inf')):
+        raise ValueError(f"{name} must be {'an integer' if kind is int else 'a number'}")
+    return number if minimum is None else max(minimum, number)
+
+def open_db(token, db_path, cache=None):
+    """DBManager for a token's file: writable forks, immutable snapshots, and
+    WAL commit views."""
+    return DBManager(db_path, pool, cache, writable=store.is_fork(token),
+                     wal_view=wal_timeline.is_view(token))
 
 @app.route('/')
 def index():
@@ -34,12 +217,11 @@ def index():
 @app.route('/api/devices', methods=['GET'])
 def get_devices():
     devices = adb.connect_device()
-    # Check root for each device
+    # Check root on all online devices in parallel (cached per device)
+    online = [device['id'] for device in devices if device['status'] == 'device']
+    root = adb.check_root_many(online)
     for device in devices:
-        if device['status'] == 'device':
-            device['root'] = adb.check_root(device['id'])
-        else:
-            device['root'] = False
+        device['root'] = root.get(device['id'], False)
     return jsonify(devices)
 
 @app.route('/api/packages/<device_id>', methods=['GET'])
@@ -53,102 +235,641 @@ def check_package_debuggable(device_id, package_name):
     is_debuggable = adb.is_package_debuggable(device_id, package_name)
     return jsonify({'debuggable': is_debuggable})
 
+@app.route('/api/packages-debuggable/<device_id>', methods=['GET'])
+def get_debuggable_packages(device_id):
+    # {package: bool} for the whole package list in one device-side pass
+    flags = adb.debuggable_packages(device_id)
+    if flags is None:
+        return jsonify({'error': 'Cannot read package flags'}), 500
+    return jsonify(flags)
+
 @app.route('/api/databases/<device_id>/<package_name>', methods=['GET'])
 def get_databases(device_id, package_name):
     databases = adb.list_databases(device_id, package_name)
     return jsonify(databases)
 
+def pull_snapshot(device_id, package_name, db_name, mode='full'):
+    """Pull a database into the snapshot store. Returns (token, transfer), or
+    (None, None) if the pull failed and (None, {'error'}) if it could not be stored.
+
+    Every pull gets a new token; identical content is stored only once by the
+    snapshot store, which also evicts old snapshots of this database.
+    'delta' mode only transfers what changed since the previous pull.
+    """
+    # Format: device_package_dbname_timestamp
+    safe_pkg = package_name.replace('.', '_')
+    base_token = f"{device_id}_{safe_pkg}_{db_name}"
+    timestamp = int(time.time() * 1000)
+    token = f"{base_token}_{timestamp}"
+
+    local_path = store.staging_path(token)
+    
+    def on_progress(filename, done, total):
+        pull_progress[base_token] = {'file': filename, 'done': done, 'total': total}
+
+    transfer = None
+    with metrics.span('pull_snapshot', mode=mode) as span:
+        try:
+            if mode == 'delta':
+                transfer = delta.sync(device_id, package_name, db_name, base_token, local_path)
+            if transfer is None:
+                success = adb.pull_database(device_id, package_name, db_name, local_path, progress=on_progress)
+                if success:
+                    transfer = {'mode': 'full', 'bytes': sum(
+                        os.path.getsize(f"{local_path}{suffix}")
+                        for suffix in ('', '-wal', '-shm') if os.path.exists(f"{local_path}{suffix}")
+                    )}
+            else:
+                success = True
+        finally:
+            pull_progress.pop(base_token, None)
+
+        if not success:
+            span.fail('pull failed')
+            store.discard_staging(token)
+            return None, None
+        # mode may fall back from 'delta' to 'full'; the bytes are labelled with what ran
+        metrics.inc('pull_snapshot_bytes_total', transfer['bytes'], mode=transfer['mode'])
+        span.fields.update(transfer)
+        try:
+            store.ingest(base_token, token, local_path)
+        except (OSError, sqlite3.Error) as e:
+            # Disk full, or not a database (prepare_snapshot could not open it)
+            print(f"Cannot store snapshot of {db_name}: {e}")
+            span.fail('ingest failed')
+            store.discard_staging(token)
+            return None, {'error': f"Cannot store snapshot: {e}"}
+    search.on_ingest(token)
+    return token, transfer
+
+# Server-side Monitor: one watcher per database, pulling in delta mode on change
+watchers = WatcherHub(
+    adb,
+    lambda device_id, package_name, db_name: pull_snapshot(device_id, package_name, db_name, 'delta'),
+    interval=app.config['WATCH_INTERVAL'],
+    max_subscribers=app.config['WATCH_MAX_STREAMS'],
+)
+atexit.register(watchers.stop_all)
+
+# Background snapshots of many databases / devices (see /api/jobs/snapshot)
+jobs = SnapshotJobRunner(
+    pull_snapshot,
+    max_workers=app.config['SNAPSHOT_JOB_WORKERS'],
+    per_device=app.config['SNAPSHOT_JOB_PER_DEVICE'],
+)
+
 @app.route('/api/pull', methods=['POST'])
 def pull_database():
     data = request.json
     device_id = data.get('device_id')
     package_name = data.get('package_name')
     db_name = data.get('db_name')
+    # 'delta' only transfers what changed since the previous pull (used by Refresh)
+    mode = data.get('mode', 'full')
     
     if not all([device_id, package_name, db_name]):
         return jsonify({'error': 'Missing parameters'}), 400
-        
-    # Generate a unique filename to avoid collisions and file locking issues on Windows
-    # Format: device_package_dbname_timestamp.sqlite
+
+    token, transfer = pull_snapshot(device_id, package_name, db_name, mode)
+    if token:
+        return jsonify({'success': True, 'token': token, 'transfer': transfer})
+    else:
+        return jsonify({'success': False, 'error': (transfer or {}).get('error') or 'Failed to pull database'}), 500
+
+@app.route('/api/watch/<device_id>/<package_name>/<db_name>', methods=['GET'])
+def watch_database(device_id, package_name, db_name):
+    """Server-Sent Events: a 'snapshot' event with the new token whenever the
+    database changes on the device, 'error' when it can no longer be read."""
+    watcher, events = watchers.subscribe(device_id, package_name, db_name)
+    heartbeat = app.config['WATCH_HEARTBEAT']
+
+    def refuse():
+        # An 'error' event stops Monitor in the client, which then closes the stream
+        error = f"Too many Monitor streams open (WATCH_MAX_STREAMS = {app.config['WATCH_MAX_STREAMS']})"
+        yield 'retry: 3000\n\n'
+        yield f"event: error\ndata: {json.dumps({'error': error})}\n\n"
+
+    def generate():
+        yield 'retry: 3000\n\n'
+        while True:
+            try:
+                event = events.get(timeout=heartbeat)
+            except queue.Empty:
+                # Keeps proxies from closing the stream and notices gone clients
+                yield ': ping\n\n'
+                continue
+            data = {k: v for k, v in event.items() if k != 'event'}
+            yield f"event: {event['event']}\ndata: {json.dumps(data)}\n\n"
+
+    body = refuse() if watcher is None else stream_with_context(generate())
+    response = Response(body, mimetype='text/event-stream')
+    if watcher is not None:
+        # On close, also if the client left before the generator ever ran
+        response.call_on_close(lambda: watchers.unsubscribe(watcher, events))
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/jobs/snapshot', methods=['POST'])
+def create_snapshot_job():
+    """Snapshot several databases in the background.
+
+    Body: {"targets": [{"device_id", "package_name", "db_name"}, ...]} or
+    {"device_ids": [...] (or "device_id"), "package_name", "db_names": [...]
+    (or "db_name"; omitted = every database of the package)}, plus an
+    optional "mode" ('full' or 'delta').
+    """
+    data = request.json or {}
+    mode = data.get('mode', 'full')
+
+    targets = []
+    for target in data.get('targets') or []:
+        if not all(target.get(k) for k in ('device_id', 'package_name', 'db_name')):
+            return jsonify({'error': 'Each target needs device_id, package_name and db_name'}), 400
+        targets.append((target['device_id'], target['package_name'], target['db_name']))
+
+    package_name = data.get('package_name')
+    device_ids = data.get('device_ids') or ([data['device_id']] if data.get('device_id') else [])
+    if device_ids and package_name:
+        db_names = data.get('db_names') or ([data['db_name']] if data.get('db_name') else None)
+        for device_id in device_ids:
+            for db_name in db_names or adb.list_databases(device_id, package_name):
+                targets.append((device_id, package_name, db_name))
+
+    # The same database twice would only race with itself
+    targets = list(dict.fromkeys(targets))
+    if not targets:
+        return jsonify({'error': 'No databases to snapshot'}), 400
+
+    job = jobs.submit(targets, mode)
+    return jsonify(job.to_dict()), 202
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    return jsonify([job.to_dict(with_tasks=False) for job in jobs.jobs()])
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/pull/progress/<device_id>/<package_name>/<db_name>', methods=['GET'])
+def get_pull_progress(device_id, package_name, db_name):
     safe_pkg = package_name.replace('.', '_')
     base_token = f"{device_id}_{safe_pkg}_{db_name}"
-    timestamp = int(time.time() * 1000)
-    token = f"{base_token}_{timestamp}"
-    
-    # Cleanup old files for this specific database to prevent disk filling
-    try:
-        temp_dir = app.config['TEMP_DIR']
-        for filename in os.listdir(temp_dir):
-            if filename.startswith(base_token):
-                file_path = os.path.join(temp_dir, filename)
-                try:
-                    # Try to remove. If locked (very unlikely now), ignore.
-                    os.remove(file_path)
-                except Exception as e:
-                    print(f"Cleanup warning for {filename}: {e}")
-    except Exception as e:
-        print(f"Directory cleanup warning: {e}")
-
-    local_path = get_db_path(token)
-    
-    success = adb.pull_database(device_id, package_name, db_name, local_path)
-    
-    if success:
-        return jsonify({'success': True, 'token': token})
-    else:
-        return jsonify({'success': False, 'error': 'Failed to pull database'}), 500
+    progress = pull_progress.get(base_token)
+    if not progress:
+        return jsonify({'active': False})
+    return jsonify({'active': True, **progress})
 
 @app.route('/api/tables/<token>', methods=['GET'])
 def get_tables(token):
     db_path = get_db_path(token)
-    if not os.path.exists(db_path):
+    if not db_path:
         return jsonify({'error': 'Database session expired or invalid'}), 404
         
-    db = DBManager(db_path)
+    db = open_db(token, db_path)
     tables = db.get_tables()
     return jsonify(tables)
 
+@app.route('/api/schema/<token>', methods=['GET'])
+def get_schema(token):
+    db_path = get_db_path(token)
+    if not db_path:
+        return jsonify({'error': 'Database session expired or invalid'}), 404
+
+    db = open_db(token, db_path)
+    return jsonify(db.get_schema())
+
 @app.route('/api/table/<token>/<table_name>', methods=['GET'])
 def get_table_data(token, table_name):
     db_path = get_db_path(token)
-    if not os.path.exists(db_path):
+    if not db_path:
         return jsonify({'error': 'Database session expired or invalid'}), 404
         
-    limit = int(request.args.get('limit', 100))
-    offset = int(request.args.get('offset', 0))
-    
-    db = DBManager(db_path)
+    try:
+        limit = number_arg(request.args, 'limit', 100, minimum=1)
+        offset = number_arg(request.args, 'offset', 0, minimum=0)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    # ?sort=<column>&order=asc|desc, ?filters=[{"column", "op", "value"}, ...] (JSON)
+    sort = request.args.get('sort') or None
+    descending = request.args.get('order', 'asc').lower() == 'desc'
+    try:
+        filters = json.loads(request.args['filters']) if request.args.get('filters') else None
+    except ValueError:
+        return jsonify({'error': 'filters must be a JSON list'}), 400
+    if filters is not None and not (isinstance(filters, list) and all(isinstance(f, dict) for f in filters)):
+        return jsonify({'error': 'filters must be a JSON list'}), 400
+
+    if sort or filters:
+        # Sorted/filtered views read the indexed working copy once there is one
+        db_path = table_indexes.read_path(token) or db_path
+    db = open_db(token, db_path, result_cache)
+
+    # Keyset paging: ?cursor=<next_cursor of the previous page> (empty = first page)
+    if 'cursor' in request.args or sort or filters:
+        estimate = request.args.get('estimate') == '1'
+        try:
+            page = db.get_table_page(table_name, limit, request.args.get('cursor'), estimate=estimate,
+                                     sort=sort, descending=descending, filters=filters)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if sort or filters:
+            table_indexes.note_use(token, table_name, indexable_columns(sort, filters))
+        return jsonify(page)
+
     columns, rows, total = db.get_table_data(table_name, limit, offset)
     return jsonify({'columns': columns, 'rows': rows, 'total': total})
 
+@app.route('/api/diff/<old_token>/<new_token>/<table_name>', methods=['GET'])
+def diff_table(old_token, new_token, table_name):
+    old_path = get_db_path(old_token)
+    new_path = get_db_path(new_token)
+    if not old_path or not new_path:
+        return jsonify({'error': 'Database session expired or invalid'}), 404
+    if wal_timeline.is_view(old_token):
+        # ATTACH would open the view with a shared wal-index (see connect_wal_view)
+        return jsonify({'error': 'Diffs can not start from a WAL commit'}), 400
+
+    try:
+        limit = number_arg(request.args, 'limit', app.config['DIFF_MAX_ROWS'], minimum=1)
+        # ?page=<page size>&cursor=<cursor of that page>: diff only the keys
+        # of the page on screen (keyset order), not the whole table
+        window = number_arg(request.args, 'page', minimum=1)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    after = None
+    if request.args.get('cursor'):
+        cursor = decode_cursor(request.args['cursor'])
+        if not isinstance(cursor, dict) or not isinstance(cursor.get('k'), list) or 's' in cursor:
+            # Sorted pages are not a key range: the client reloads those instead
+            return jsonify({'error': 'cursor must be a cursor of an unsorted table page'}), 400
+        after = cursor['k']
+    if old_path == new_path:
+        # Same content hash: nothing changed, no need to open anything
+        return jsonify({'inserted': [], 'updated': [], 'deleted': [], 'truncated': False, 'unchanged': True})
+
+    db = open_db(new_token, new_path)
+    result = db.diff_table(old_path, table_name, limit, after=after, window=window)
+    if 'error' in result:
+        return jsonify(result), 400
+    return jsonify(result)
+
+@app.route('/api/wal/<token>', methods=['GET'])
+def wal_commits(token):
+    """Commits found in the WAL pulled with a snapshot, oldest first: frames,
+    changed pages and changed pages per table. Each commit's 'token' opens the
+    database as of that commit in every read-only route (/api/table, /api/query...)."""
+    commits = wal_timeline.commits(token)
+    if commits is None:
+        return jsonify({'error': 'Database session expired or invalid'}), 404
+    return jsonify({'commits': commits})
+
+@app.route('/api/blob/<token>/<table_name>/<rowid>/<column>', methods=['GET'])
+def get_blob(token, table_name, rowid, column):
+    """The bytes of one BLOB cell (pages and query results only carry
+    {'$blob': size, 'type', 'sha1'} stubs).
+
+    <rowid> is the row's rowid, or for tables keyed on their primary key its
+    key as a cursor (encode_cursor({'k': key})). A Range header or
+    ?offset=&length= reads part of the value. ?preview=hex returns a hex dump
+    of the range (BLOB_PREVIEW_BYTES by default), ?preview=protobuf the value
+    decoded as a protobuf message without schema.
+    """
+    db_path = get_db_path(token)
+    if not db_path:
+        return jsonify({'error': 'Database session expired or invalid'}), 404
+    key = decode_row_key(rowid)
+    if key is None:
+        return jsonify({'error': 'Invalid row key'}), 400
+    preview = request.args.get('preview')
+    if preview not in (None, 'hex', 'protobuf'):
+        return jsonify({'error': f'Unknown preview: {preview}'}), 400
+
+    try:
+        offset = number_arg(request.args, 'offset', 0, minimum=0)
+        length = number_arg(request.args, 'length', minimum=0)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    suffix = None
+    byte_range = request.range
+    if byte_range is not None and not preview:
+        if byte_range.units != 'bytes' or len(byte_range.ranges) != 1:
+            return jsonify({'error': 'Only single byte ranges are supported'}), 416
+        start, stop = byte_range.ranges[0]
+        if start < 0:
+            # bytes=-N: the last N bytes, wherever they start
+            suffix = -start
+        else:
+            offset, length = start, None if stop is None else stop - start
+    if preview == 'hex' and length is None:
+        length = app.config['BLOB_PREVIEW_BYTES']
+    if preview == 'protobuf':
+        offset, length = 0, app.config['BLOB_DECODE_MAX_BYTES'] + 1
+    if offset < 0 or (length is not None and length < 0):
+        return jsonify({'error': 'offset and length must not be negative'}), 400
+
+    db = open_db(token, db_path)
+    try:
+        if suffix is not None:
+            found = db.read_blob(table_name, key, column, 0, 0)
+            if found is not None:
+                offset = max(0, found[0] - suffix)
+        found = db.read_blob(table_name, key, column, offset, length)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if found is None:
+        return jsonify({'error': 'No such row, or the value is not a BLOB or text'}), 404
+    size, data = found
+    if byte_range is not None and not preview and offset >= size > 0:
+        return Response(status=416, headers={'Content-Range': f"bytes */{size}"})
+
+    if preview == 'hex':
+        return jsonify({'size': size, 'offset': offset, 'hex': hex_preview(data, offset)})
+    if preview == 'protobuf':
+        if size > app.config['BLOB_DECODE_MAX_BYTES']:
+            return jsonify({'error': f'BLOB too large to decode ({size} bytes)'}), 413
+        fields = protobuf_preview(data)
+        if fields is None:
+            return jsonify({'error': 'Not a protobuf message', 'type': sniff_type(data)}), 422
+        return jsonify({'size': size, 'protobuf': fields})
+
+    partial = offset > 0 or offset + len(data) < size
+    response = Response(data, status=206 if partial and byte_range is not None else 200,
+                        mimetype=mime_type(sniff_type(data)) if offset == 0 else 'application/octet-stream')
+    response.headers['Accept-Ranges'] = 'bytes'
+    if partial and byte_range is not None:
+        response.headers['Content-Range'] = f"bytes {offset}-{offset + max(len(data), 1) - 1}/{size}"
+    return response
+
+@app.route('/api/fork/<token>', methods=['POST', 'DELETE'])
+def fork_snapshot(token):
+    """Snapshots are immutable: POST makes a writable copy of one under a new
+    token, for statements that modify data. DELETE drops a writable copy."""
+    if request.method == 'DELETE':
+        return jsonify({'deleted': store.drop_fork(token)})
+
+    if not get_db_path(token):
+        return jsonify({'error': 'Database session expired or invalid'}), 404
+    fork_token = store.fork(token)
+    if not fork_token:
+        return jsonify({'error': 'Failed to create a writable copy'}), 500
+    return jsonify({'success': True, 'token': fork_token, 'writable': True})
+
+@app.route('/api/export/<token>', methods=['GET', 'POST'])
+@app.route('/api/export/<token>/<table_name>', methods=['GET'])
+def export_data(token, table_name=None):
+    """Stream a table (/api/export/<token>/<table>), a query (?query= or JSON
+    body) or the whole database as an SQL dump (no table, no query).
+
+    ?format=csv|jsonl|xlsx|sql, ?cursor=<resume cursor from /api/export/status>.
+    """
+    db_path = get_db_path(token)
+    if not db_path:
+        return jsonify({'error': 'Database session expired or invalid'}), 404
+
+    params = {**request.args, **(request.get_json(silent=True) or {})}
+    fmt = params.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f'Unknown export format: {fmt}'}), 400
+
+    db = open_db(token, db_path)
+    exporter = Exporter(db, app.config['EXPORT_CHUNK_ROWS'], exports)
+    try:
+        if table_name:
+            job, body = exporter.export_table(table_name, fmt, params.get('cursor'))
+            filename = table_name
+        elif params.get('query'):
+            job, body = exporter.export_query(params['query'], fmt, params.get('cursor'))
+            filename = 'query_result'
+        elif fmt == 'sql':
+            job, body = exporter.dump_database()
+            filename = os.path.splitext(os.path.basename(db_path))[0]
+        else:
+            return jsonify({'error': 'Only the sql format can export a whole database'}), 400
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 404
+    except sqlite3.Error as e:
+        return jsonify({'error': str(e)}), 400
+
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}.{extension}"'
+    response.headers['X-Export-Id'] = job.id
+    return response
+
+@app.route('/api/export/status/<export_id>', methods=['GET'])
+def export_status(export_id):
+    job = exports.get(export_id)
+    if not job:
+        return jsonify({'error': 'Unknown export'}), 404
+    return jsonify(job.stats())
+
+@app.route('/api/search/<token>', methods=['GET'])
+def search_snapshot(token):
+    """Text search across every table: ?q=<text>&limit=<n>.
+
+    The snapshot is indexed in the background on first use; until then this
+    returns 202 with the build status, so the client polls.
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Missing search text'}), 400
+    if not get_db_path(token):
+        return jsonify({'error': 'Invalid token'}), 404
+    if store.is_fork(token) or wal_timeline.is_view(token):
+        return jsonify({'error': 'Search is only available on pulled snapshots, not writable copies or WAL commits'}), 400
+    try:
+        limit = number_arg(request.args, 'limit', app.config['SEARCH_MAX_RESULTS'], minimum=1)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    limit = min(limit, app.config['SEARCH_MAX_RESULTS'])
+
+    try:
+        status, matches, truncated = search.search(token, query, limit)
+    except sqlite3.Error as e:
+        return jsonify({'error': str(e)}), 500
+    if status['status'] == 'failed':
+        return jsonify({'error': f"Indexing failed: {status.get('error')}", 'status': status}), 500
+    if matches is None:
+        return jsonify({'status': status}), 202
+    return jsonify({'status': status, 'matches': matches, 'truncated': truncated})
+
 @app.route('/api/query/<token>', methods=['POST'])
 def execute_query(token):
     db_path = get_db_path(token)
-    if not os.path.exists(db_path):
+    if not db_path:
         return jsonify({'error': 'Database session expired or invalid'}), 404
         
     query = request.json.get('query')
     if not query:
         return jsonify({'error': 'No query provided'}), 400
-        
-    db = DBManager(db_path)
-    result = db.execute_query(query)
-    return jsonify(result)
+
+    try:
+        requested_timeout = number_arg(request.json, 'timeout', kind=float, minimum=0)
+        requested_rows = number_arg(request.json, 'max_rows', minimum=0)
+        # Streaming modes read rows in pages of page_size
+        page_size = number_arg(request.json, 'page_size', app.config['QUERY_PAGE_SIZE'], minimum=1)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Time and row budgets: the request may lower the configured limits
+    timeout = app.config['QUERY_TIMEOUT']
+    if requested_timeout:
+        timeout = min(timeout, requested_timeout)
+    # Streamed results stop at QUERY_MAX_ROWS (the SQL tab shows the limit was
+    # reached); plain results are only capped when the request asks for it
+    mode = request.json.get('mode')
+    max_rows = app.config['QUERY_MAX_ROWS'] if mode in ('stream', 'cursor') else None
+    if requested_rows:
+        max_rows = min(max_rows, requested_rows) if max_rows else requested_rows
+
+    query_id = request.json.get('query_id') or uuid.uuid4().hex
+    control = QueryControl(timeout)
+    if not queries.start(query_id, control):
+        return jsonify({'error': f'Query {query_id} is already running'}), 409
+
+    db = open_db(token, db_path, result_cache)
+    if mode not in ('stream', 'cursor'):
+        try:
+            result = db.execute_query(query, max_rows=max_rows, control=control)
+        finally:
+            queries.finish(query_id)
+        result.update(query_id=query_id, stats=control.stats())
+        return jsonify(result)
+
+    # Streaming modes: rows are arrays in `columns` order, read with fetchmany
+    result = db.open_query(query, max_rows=max_rows, control=control)
+    if isinstance(result, dict):
+        queries.finish(query_id)
+        result.update(query_id=query_id, stats=control.stats())
+        return jsonify(result)
+
+    if mode == 'stream':
+        # NDJSON: {"columns"}, then {"rows"} chunks, then {"done"} (or {"error"})
+        def generate():
+            try:
+                yield json.dumps({'columns': result.columns, 'query_id': query_id}) + '\n'
+                while not result.closed:
+                    rows = result.fetch(page_size)
+                    if rows:
+                        yield json.dumps({'rows': rows}) + '\n'
+                end = {'done': True, 'row_count': result.row_count, 'truncated': result.truncated}
+                if result.error:
+                    end = {'error': result.error, 'row_count': result.row_count}
+                end['stats'] = control.stats()
+                yield json.dumps(end) + '\n'
+            finally:
+                result.close()
+                queries.finish(query_id)
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    # Cursor mode: first page now, the rest through /api/query/cursor/<cursor_id>
+    rows = result.fetch(page_size)
+    cursor_id = None
+    if result.closed:
+        queries.finish(query_id)
+    else:
+        cursor_id = cursors.add(result)
+        queries.attach_cursor(query_id, cursor_id)
+    return jsonify(_cursor_response(result, rows, cursor_id, query_id=query_id, columns=result.columns))
+
+def _cursor_response(cursor, rows, cursor_id, **extra):
+    response = {
+        'rows': rows,
+        'cursor_id': cursor_id,
+        'row_count': cursor.row_count,
+        'truncated': cursor.truncated,
+        'stats': cursor.control.stats() if cursor.control else None,
+        **extra,
+    }
+    if cursor.error:
+        response['error'] = cursor.error
+    return response
+
+@app.route('/api/query/cursor/<cursor_id>', methods=['POST', 'DELETE'])
+def query_cursor(cursor_id):
+    if request.method == 'DELETE':
+        return jsonify({'closed': cursors.close(cursor_id)})
+
+    cursor = cursors.get(cursor_id)
+    if cursor is None:
+        return jsonify({'error': 'Cursor expired or invalid'}), 404
+
+    try:
+        page_size = number_arg(request.json, 'page_size', app.config['QUERY_PAGE_SIZE'], minimum=1)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    rows = cursor.fetch(page_size)
+    cursors.discard_closed(cursor_id)
+    return jsonify(_cursor_response(cursor, rows, None if cursor.closed else cursor_id))
+
+@app.route('/api/query/<query_id>/cancel', methods=['POST'])
+def cancel_query(query_id):
+    stats = queries.cancel(query_id)
+    if stats is None:
+        return jsonify({'cancelled': False, 'error': 'Query is not running'}), 404
+    return jsonify({'cancelled': True, 'stats': stats})
+
+@app.route('/api/cache', methods=['GET', 'DELETE'])
+def result_cache_stats():
+    # Hit/miss counters and size of the query result cache; DELETE empties it
+    if request.method == 'DELETE':
+        result_cache.clear()
+    return jsonify(result_cache.stats())
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    # Prometheus text format: adb, pull, DBManager, route and JSON timings, bytes, caches
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
     return jsonify({'status': 'ok', 'timestamp': int(time.time())})
 
-import webbrowser
-from threading import Timer
+def serve(host, port, threads):
+    """Production serving: waitress with a thread pool when it is installed,
+    else Werkzeug's threaded server (no debugger, no reloader process).
+
+    Every open Monitor stream (/api/watch) holds a waitress thread, so the
+    pool gets WATCH_MAX_STREAMS threads on top of `threads` for other requests.
+    """
+    try:
+        from waitress import serve as waitress_serve
+    except ImportError:
+        print(f"waitress is not installed, using the threaded Werkzeug server on http://{host}:{port}")
+        app.run(host=host, port=port, debug=False, use_reloader=False, threaded=True)
+        return
+    streams = app.config['WATCH_MAX_STREAMS']
+    print(f"Serving on http://{host}:{port} (waitress, {threads} threads + {streams} for Monitor streams)")
+    waitress_serve(app, host=host, port=port, threads=threads + streams, ident='AndroidDBViewer')
+
 
 if __name__ == '__main__':
+    import argparse
+    import webbrowser
+    from threading import Timer
+
+    parser = argparse.ArgumentParser(description='Android DB Viewer')
+    parser.add_argument('--dev', action='store_true', help='Flask debug server with the reloader')
+    parser.add_argument('--host', default=app.config['HOST'])
+    parser.add_argument('--port', type=int, default=app.config['PORT'])
+    parser.add_argument('--threads', type=int, default=app.config['SERVER_THREADS'])
+    parser.add_argument('--no-browser', action='store_true', help="don't open the browser")
+    args = parser.parse_args()
+
     # Open browser after a short delay to ensure server is running
     def open_browser():
-        webbrowser.open_new("http://127.0.0.1:5000")
+        webbrowser.open_new(f"http://127.0.0.1:{args.port}")
 
-    # If running in a frozen bundle (EXE) or standard mode without reloader
-    if getattr(sys, 'frozen', False) or not os.environ.get("WERKZEUG_RUN_MAIN"):
+    # Not in the reloader's child process (the parent already opened it)
+    if app.config['OPEN_BROWSER'] and not args.no_browser and not os.environ.get("WERKZEUG_RUN_MAIN"):
         Timer(1.5, open_browser).start()
 
-    app.run(debug=True, port=5000)
+    if args.dev:
+        app.run(debug=True, host=args.host, port=args.port)
+    else:
+        serve(args.host, args.port, args.threads)
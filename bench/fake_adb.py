@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""Stand-in for the `adb` binary that serves fake devices from a directory.
+
+Each directory FAKE_ADB_ROOT/<serial>/ is one device:
+    device.json                     {"state": "device", "rooted": false, "debuggable": ["com.example"]}
+    data/data/<package>/databases/  the app's files
+    data/local/tmp/, sdcard/        scratch space used by pulls
+
+Device-absolute paths (/data/..., /sdcard/...) in commands are mapped into
+the device directory, and the tools the app calls on a phone (su, run-as, pm,
+dumpsys, id) are shell scripts in bench/fake_device_bin. Everything else
+(cp, dd, md5sum, split, stat...) is the host's own, so this needs a POSIX
+host with GNU coreutils.
+
+Slow links are simulated with:
+    FAKE_ADB_LATENCY_MS   added to every adb call and every shell command
+    FAKE_ADB_BANDWIDTH    bytes/s for data coming back from the device (0 = unlimited)
+"""
+import os
+import re
+import sys
+import json
+import time
+import threading
+import subprocess
+
+DEVICE_BIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_device_bin')
+CHUNK_SIZE = 64 * 1024
+
+# /data/... and /sdcard/... at the start of a path (not /dev/null, not host paths)
+_DEVICE_PATH = re.compile(rb"(?<![\w./-])/(data|sdcard)(?=/|\b)")
+
+
+def _latency():
+    return float(os.environ.get('FAKE_ADB_LATENCY_MS') or 0) / 1000
+
+
+class Throttle:
+    """Writes data on to `out` no faster than FAKE_ADB_BANDWIDTH bytes/s."""
+
+    def __init__(self, out):
+        self.out = out
+        self.bandwidth = float(os.environ.get('FAKE_ADB_BANDWIDTH') or 0)
+        self.started = time.perf_counter()
+        self.sent = 0
+
+    def write(self, data):
+        self.out.write(data)
+        self.out.flush()
+        self.sent += len(data)
+        if self.bandwidth:
+            ahead = self.sent / self.bandwidth - (time.perf_counter() - self.started)
+            if ahead > 0:
+                time.sleep(ahead)
+
+
+class Device:
+    def __init__(self, root, serial):
+        self.serial = serial
+        self.root = os.path.join(root, serial)
+        try:
+            with open(os.path.join(self.root, 'device.json')) as f:
+                self.info = json.load(f)
+        except (OSError, ValueError):
+            self.info = None
+
+    def remap(self, command):
+        """Point device-absolute paths in a command at the device directory."""
+        root = self.root.encode()
+        return _DEVICE_PATH.sub(lambda m: root + b'/' + m.group(1), command)
+
+    def env(self):
+        env = dict(os.environ)
+        env['PATH'] = DEVICE_BIN + os.pathsep + env.get('PATH', '')
+        env['FAKE_DEVICE_ROOT'] = self.root
+        env['FAKE_ROOTED'] = '1' if self.info.get('rooted') else '0'
+        env['FAKE_DEBUGGABLE'] = ' '.join(self.info.get('debuggable', []))
+        env['FAKE_UID'] = '2000'
+        env['FAKE_USER'] = 'shell'
+        return env
+
+    def sh(self, args, **kwargs):
+        return subprocess.Popen(['sh'] + args, cwd=self.root, env=self.env(), **kwargs)
+
+
+def devices(root):
+    print("List of devices attached")
+    for serial in sorted(os.listdir(root)):
+        device = Device(root, serial)
+        if device.info is not None:
+            print(f"{serial}\t{device.info.get('state', 'device')}")
+    print()
+    return 0
+
+
+def shell(device, args):
+    if args:
+        # One-off `adb shell <command>`
+        proc = device.sh(['-c', device.remap(' '.join(args).encode()).decode()], stdout=subprocess.PIPE)
+        _pump(proc.stdout, Throttle(sys.stdout.buffer))
+        return proc.wait()
+
+    # Interactive session (ADBTransport): commands arrive on stdin, one per
+    # marker-terminated frame. Each frame costs one round trip of latency.
+    proc = device.sh([], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    latency = _latency()
+
+    def feed():
+        try:
+            for line in iter(sys.stdin.buffer.readline, b''):
+                if latency and b'__ADBT_' in line:
+                    time.sleep(latency)
+                proc.stdin.write(device.remap(line))
+                proc.stdin.flush()
+        except (OSError, ValueError):
+            pass
+        finally:
+            try:
+                proc.stdin.close()
+            except OSError:
+                pass
+
+    threading.Thread(target=feed, daemon=True).start()
+    _pump(proc.stdout, Throttle(sys.stdout.buffer))
+    return proc.wait()
+
+
+def exec_out(device, args):
+    time.sleep(_latency())
+    proc = device.sh(['-c', device.remap(' '.join(args).encode()).decode()], stdout=subprocess.PIPE)
+    _pump(proc.stdout, Throttle(sys.stdout.buffer))
+    return proc.wait()
+
+
+def pull(device, args):
+    time.sleep(_latency())
+    remote, local = args[0], args[1]
+    source = device.remap(remote.encode()).decode()
+    if not os.path.isfile(source):
+        print(f"adb: error: failed to stat remote object '{remote}': No such file or directory", file=sys.stderr)
+        return 1
+    if os.path.isdir(local):
+        local = os.path.join(local, os.path.basename(remote))
+    with open(source, 'rb') as src, open(local, 'wb') as dst:
+        _pump(src, Throttle(dst))
+    print(f"{remote}: 1 file pulled.")
+    return 0
+
+
+def _pump(stream, throttle):
+    fd = stream.fileno()
+    while True:
+        chunk = os.read(fd, CHUNK_SIZE)
+        if not chunk:
+            break
+        throttle.write(chunk)
+
+
+def main(argv):
+    root = os.environ.get('FAKE_ADB_ROOT')
+    if not root or not os.path.isdir(root):
+        print("fake adb: FAKE_ADB_ROOT is not set to a directory", file=sys.stderr)
+        return 1
+
+    serial = None
+    if len(argv) >= 2 and argv[0] == '-s':
+        serial, argv = argv[1], argv[2:]
+    if not argv:
+        print("fake adb: no command", file=sys.stderr)
+        return 1
+
+    command, args = argv[0], argv[1:]
+    if command == 'devices':
+        time.sleep(_latency())
+        return devices(root)
+    if command in ('start-server', 'kill-server'):
+        return 0
+
+    if serial is None:
+        serials = [s for s in sorted(os.listdir(root)) if Device(root, s).info is not None]
+        if len(serials) != 1:
+            print("adb: error: more than one device/emulator", file=sys.stderr)
+            return 1
+        serial = serials[0]
+    device = Device(root, serial)
+    if device.info is None or device.info.get('state', 'device') != 'device':
+        print(f"adb: device '{serial}' not found", file=sys.stderr)
+        return 1
+
+    handlers = {'shell': shell, 'exec-out': exec_out, 'pull': pull}
+    if command not in handlers:
+        print(f"fake adb: unsupported command '{command}'", file=sys.stderr)
+        return 1
+    return handlers[command](device, args)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
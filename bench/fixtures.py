@@ -0,0 +1,110 @@
+import os
+import json
+import random
+import sqlite3
+
+WORDS = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor "
+    "incididunt ut labore et dolore magna aliqua enim ad minim veniam quis nostrud"
+).split()
+
+SCHEMA = """
+CREATE TABLE messages (
+    id INTEGER PRIMARY KEY,
+    thread_id INTEGER NOT NULL,
+    sender TEXT,
+    body TEXT,
+    created INTEGER,
+    payload BLOB
+);
+CREATE INDEX idx_messages_thread ON messages (thread_id, created);
+CREATE TABLE contacts (uid TEXT PRIMARY KEY, name TEXT, phone TEXT) WITHOUT ROWID;
+CREATE TABLE settings (key TEXT PRIMARY KEY, value TEXT);
+CREATE VIEW recent_messages AS SELECT id, sender, body FROM messages ORDER BY created DESC LIMIT 100;
+"""
+
+
+class FixtureDevice:
+    """A fake device (see fake_adb.py) with one app database of a chosen size.
+
+    The database is in WAL mode and `writer` keeps it open with automatic
+    checkpoints off, so the device always has a live -wal next to the main
+    file, like a running app. append() commits more rows into that WAL.
+    """
+
+    def __init__(self, root, serial='bench-0001', package='com.example.bench', db_name='bench.db',
+                 rows=100000, wal_rows=1000, rooted=False, seed=1):
+        self.root = root
+        self.serial = serial
+        self.package = package
+        self.db_name = db_name
+        self.device_dir = os.path.join(root, serial)
+        self.db_dir = os.path.join(self.device_dir, 'data', 'data', package, 'databases')
+        self.db_path = os.path.join(self.db_dir, db_name)
+        self._random = random.Random(seed)
+        self._next_id = 1
+
+        for path in (self.db_dir, os.path.join(self.device_dir, 'data', 'data', package, 'cache'),
+                     os.path.join(self.device_dir, 'data', 'local', 'tmp'),
+                     os.path.join(self.device_dir, 'sdcard')):
+            os.makedirs(path, exist_ok=True)
+        with open(os.path.join(self.device_dir, 'device.json'), 'w') as f:
+            json.dump({'state': 'device', 'rooted': rooted, 'debuggable': [] if rooted else [package]}, f)
+
+        self._create(rows)
+        self.writer = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.writer.execute("PRAGMA journal_mode=WAL")
+        self.writer.execute("PRAGMA wal_autocheckpoint=0")
+        self.append(wal_rows)
+
+    def _create(self, rows):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            batch = 10000
+            for start in range(0, rows, batch):
+                conn.executemany("INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?)",
+                                 [self._message() for _ in range(min(batch, rows - start))])
+            conn.executemany("INSERT INTO contacts VALUES (?, ?, ?)", [
+                (f"u{i:06d}", f"{self._random.choice(WORDS).title()} {i}", f"+1555{i:07d}")
+                for i in range(max(1, rows // 100))
+            ])
+            conn.executemany("INSERT INTO settings VALUES (?, ?)", [(f"setting_{i}", str(i)) for i in range(50)])
+            conn.commit()
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        finally:
+            conn.close()
+
+    def _message(self):
+        message_id = self._next_id
+        self._next_id += 1
+        body = ' '.join(self._random.choice(WORDS) for _ in range(self._random.randint(5, 30)))
+        return (
+            message_id,
+            self._random.randint(1, 500),
+            f"user{self._random.randint(1, 200)}",
+            body,
+            1700000000 + message_id,
+            self._random.randbytes(self._random.randint(0, 64)),
+        )
+
+    def append(self, rows):
+        """Commit `rows` new messages (they stay in the WAL)."""
+        if rows:
+            self.writer.executemany("INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?)",
+                                    [self._message() for _ in range(rows)])
+            self.writer.commit()
+
+    def update(self, rows):
+        """Rewrite the body of `rows` random existing messages."""
+        ids = [(f"edited {i}", self._random.randint(1, self._next_id - 1)) for i in range(rows)]
+        self.writer.executemany("UPDATE messages SET body = ? WHERE id = ?", ids)
+        self.writer.commit()
+
+    def checkpoint(self):
+        """Merge the WAL into the main file, as the app eventually does."""
+        self.writer.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def close(self):
+        self.writer.close()
@@ -0,0 +1,245 @@
+"""Offline benchmarks for the pull / browse / Monitor paths, against a fake device.
+
+    python -m bench.run_bench                      # run and compare with bench/baseline.json
+    python -m bench.run_bench --save-baseline      # run and store the result as the new baseline
+    python -m bench.run_bench --rows 500000 --latency-ms 20 --bandwidth 5M --rooted
+
+Nothing needs a phone: bench/fake_adb.py plays adb with a fixture database
+(with a live WAL) generated for the run. Each benchmark is repeated and its
+median compared with the baseline; the exit code is 1 if one got slower than
+the tolerance allows. Baselines only compare runs with the same parameters
+on the same machine, so none is committed.
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import time
+
+from bench.fixtures import FixtureDevice
+from modules import db_manager
+from modules.adb_interface import ADBInterface
+from modules.db_manager import DBManager, ConnectionPool, encode_cursor
+from modules.delta_sync import DeltaSync
+from modules.snapshot_store import SnapshotStore
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baseline.json')
+# Parameters that must match for a baseline to be comparable
+CONFIG_KEYS = ('rows', 'wal_rows', 'latency_ms', 'bandwidth', 'rooted')
+
+
+def parse_size(value):
+    """'5M' -> 5242880. Plain numbers are bytes."""
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    value = str(value).strip().upper()
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(float(value or 0))
+
+
+class Bench:
+    """Builds the fake device and the app's objects, and times operations."""
+
+    def __init__(self, args, work_dir):
+        self.args = args
+        self.work_dir = work_dir
+        os.environ['FAKE_ADB_ROOT'] = os.path.join(work_dir, 'devices')
+        os.environ['FAKE_ADB_LATENCY_MS'] = str(args.latency_ms)
+        os.environ['FAKE_ADB_BANDWIDTH'] = str(parse_size(args.bandwidth))
+
+        print(f"Building fixture: {args.rows} rows, {args.wal_rows} rows in the WAL...")
+        self.device = FixtureDevice(os.environ['FAKE_ADB_ROOT'], rows=args.rows,
+                                    wal_rows=args.wal_rows, rooted=args.rooted)
+        self.adb = ADBInterface(adb_path=os.path.join(BENCH_DIR, 'fake_adb.py'))
+        self.pool = ConnectionPool()
+        self.store = SnapshotStore(os.path.join(work_dir, 'snapshots'), prepare=DBManager.prepare_snapshot,
+                                   on_evict=self.pool.close_path)
+        self.delta = DeltaSync(self.adb, os.path.join(work_dir, 'mirrors'))
+        self.pulls = 0
+        self.results = {}
+
+    def close(self):
+        self.adb.transport.close_all()
+        self.pool.close_all()
+        self.device.close()
+
+    # --- Helpers ---
+
+    def measure(self, name, fn, setup=None, repeat=None):
+        """Run fn `repeat` times (after setup(), untimed) and record milliseconds."""
+        if self.args.only and name not in self.args.only:
+            return
+        times = []
+        for _ in range(repeat or self.args.repeat):
+            if setup:
+                setup()
+            started = time.perf_counter()
+            fn()
+            times.append((time.perf_counter() - started) * 1000)
+        self.results[name] = {
+            'median': round(statistics.median(times), 2),
+            'p95': round(sorted(times)[max(0, int(len(times) * 0.95 + 0.5) - 1)], 2),
+            'min': round(min(times), 2),
+            'runs': len(times),
+        }
+        print(f"  {name:<24} median {self.results[name]['median']:>9.2f} ms")
+
+    def pull(self, mode):
+        """pull_snapshot() of app.py: pull (full or delta) and ingest into the store."""
+        d = self.device
+        base_token = f"{d.serial}_{d.package.replace('.', '_')}_{d.db_name}"
+        self.pulls += 1
+        token = f"{base_token}_{self.pulls}"
+        staging = self.store.staging_path(token)
+        transfer = None
+        if mode == 'delta':
+            transfer = self.delta.sync(d.serial, d.package, d.db_name, base_token, staging)
+        if transfer is None and not self.adb.pull_database(d.serial, d.package, d.db_name, staging):
+            raise RuntimeError('Pull failed')
+        self.store.ingest(base_token, token, staging)
+        return token
+
+    def db(self, token):
+        return DBManager(self.store.resolve(token), self.pool)
+
+    # --- Benchmarks ---
+
+    def run(self):
+        d = self.device
+        adb = self.adb
+
+        print("Device:")
+        self.measure('devices', adb.connect_device)
+        self.measure('root_probe', lambda: adb.check_root(d.serial), setup=lambda: adb.forget_device(d.serial))
+        self.measure('list_databases', lambda: adb.list_databases(d.serial, d.package))
+        self.measure('debuggable_flags', lambda: adb.debuggable_packages(d.serial),
+                     setup=lambda: adb._debuggable_cache.clear())
+
+        print("Pull:")
+        self.measure('pull_full', lambda: self.pull('full'))
+        self.pull('delta')  # creates the delta mirror
+        self.measure('pull_delta_unchanged', lambda: self.pull('delta'))
+        self.measure('pull_delta_changed', lambda: self.pull('delta'), setup=lambda: d.append(100))
+        token = self.pull('full')
+        snapshot_bytes = os.path.getsize(self.store.resolve(token))
+
+        print("Browse:")
+        self.measure('schema_load', lambda: self.db(token).get_schema(),
+                     setup=lambda: (db_manager._schema_cache.clear(), db_manager._row_count_cache.clear()))
+        self.measure('page_first', lambda: self.db(token).get_table_page('messages', 50))
+        deep = encode_cursor({'k': [int(self.args.rows * 0.9)]})
+        self.measure('page_deep', lambda: self.db(token).get_table_page('messages', 50, deep))
+        self.measure('page_offset_deep', lambda: self.db(token).get_table_data('messages', 50, int(self.args.rows * 0.9)))
+
+        print("Query:")
+        self.measure('query_group_by', lambda: self.db(token).execute_query(
+            "SELECT sender, count(*), max(created) FROM messages GROUP BY sender"))
+        self.measure('query_like', lambda: self.db(token).execute_query(
+            "SELECT id FROM messages WHERE body LIKE '%tempor magna%' LIMIT 1000"))
+        self.measure('query_index', lambda: self.db(token).execute_query(
+            "SELECT * FROM messages WHERE thread_id = 42 ORDER BY created DESC LIMIT 100"))
+
+        print("Monitor:")
+        names = [d.db_name, f"{d.db_name}-wal"]
+        self.measure('monitor_tick_idle', lambda: adb.stat_remote_files(d.serial, d.package, names))
+
+        state = {'token': token}
+
+        def changed_tick():
+            # What one Monitor tick costs when the app wrote something:
+            # stat, delta pull + ingest, then the diff the open tab asks for
+            adb.stat_remote_files(d.serial, d.package, names)
+            new_token = self.pull('delta')
+            self.db(new_token).diff_table(self.store.resolve(state['token']), 'messages')
+            state['token'] = new_token
+
+        self.measure('monitor_tick_change', changed_tick, setup=lambda: d.update(20))
+        return {'snapshot_bytes': snapshot_bytes}
+
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    """Print a table against the baseline. Returns the names that regressed."""
+    regressions = []
+    print(f"\n{'benchmark':<24} {'median':>10} {'baseline':>10} {'change':>8}")
+    for name, result in results.items():
+        base = (baseline or {}).get('results', {}).get(name)
+        if not base:
+            print(f"{name:<24} {result['median']:>10.2f} {'-':>10} {'':>8}")
+            continue
+        change = (result['median'] - base['median']) / base['median'] if base['median'] else 0
+        status = ''
+        if result['median'] > base['median'] * (1 + tolerance) and result['median'] - base['median'] > min_delta_ms:
+            status = '  REGRESSION'
+            regressions.append(name)
+        elif change < -tolerance:
+            status = '  faster'
+        print(f"{name:<24} {result['median']:>10.2f} {base['median']:>10.2f} {change:>+7.0%}{status}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000, help='rows in the fixture table')
+    parser.add_argument('--wal-rows', type=int, default=1000, help='rows committed into the live WAL')
+    parser.add_argument('--latency-ms', type=float, default=0, help='added to every adb call and shell command')
+    parser.add_argument('--bandwidth', default='0', help='device -> host bytes/s, e.g. 20M (0 = unlimited)')
+    parser.add_argument('--rooted', action='store_true', help='pull through su instead of run-as')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per benchmark')
+    parser.add_argument('--only', help='comma-separated benchmark names')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown (0.25 = 25%%)')
+    parser.add_argument('--min-delta-ms', type=float, default=5.0, help='ignore slowdowns smaller than this')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args(argv)
+    args.only = set(args.only.split(',')) if args.only else None
+
+    config = {key: getattr(args, key) for key in CONFIG_KEYS}
+    work_dir = tempfile.mkdtemp(prefix='adbv_bench_')
+    bench = None
+    try:
+        bench = Bench(args, work_dir)
+        info = bench.run()
+    finally:
+        if bench:
+            bench.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        'config': config,
+        'machine': {'python': platform.python_version(), 'platform': platform.platform()},
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        **info,
+        'results': bench.results,
+    }
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('config') != config:
+            print(f"\nBaseline {args.baseline} was recorded with {baseline.get('config')}; not comparing.")
+            baseline = None
+    regressions = compare(bench.results, baseline, args.tolerance, args.min_delta_ms)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+    if regressions:
+        print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,175 @@
+"""Startup benchmark: time from launching the app to its first answered request.
+
+    python -m bench.startup_bench                  # compare with bench/startup_baseline.json
+    python -m bench.startup_bench --save-baseline  # store this run as the baseline
+    python -m bench.startup_bench --dev            # the debug server (with reloader) instead
+    python -m bench.startup_bench --command dist/AndroidDBViewer/AndroidDBViewer
+
+Every run starts a fresh server on a free port, with its own temp and log
+directories (ADBV_TEMP_DIR / ADBV_LOG_DIR), polls /api/health until it
+answers and stops it again. `import_app` times a bare `import app` in a new
+interpreter; --imports prints the slowest imports (python -X importtime).
+Results are compared with the baseline like bench.run_bench.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+import urllib.request
+
+from bench.run_bench import compare
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'startup_baseline.json')
+CONFIG_KEYS = ('command', 'dev')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def isolated_env(work_dir):
+    env = dict(os.environ)
+    env['ADBV_TEMP_DIR'] = os.path.join(work_dir, 'temp')
+    env['ADBV_LOG_DIR'] = os.path.join(work_dir, 'logs')
+    env['PYTHONPATH'] = ROOT_DIR + os.pathsep + env.get('PYTHONPATH', '')
+    return env
+
+
+def time_first_request(command, env, timeout):
+    """Seconds from starting `command` (plus --port) to a 200 from /api/health."""
+    port = free_port()
+    url = f"http://127.0.0.1:{port}/api/health"
+    started = time.perf_counter()
+    proc = subprocess.Popen(command + ['--port', str(port), '--no-browser'], cwd=ROOT_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            if proc.poll() is not None:
+                raise RuntimeError(f"Server exited with {proc.returncode} before answering")
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                pass
+            if time.perf_counter() - started > timeout:
+                raise RuntimeError(f"No answer from {url} after {timeout} s")
+            time.sleep(0.01)
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+
+def time_import(env):
+    started = time.perf_counter()
+    subprocess.run([sys.executable, '-c', 'import app'], cwd=ROOT_DIR, env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - started
+
+
+def slowest_imports(env, count=15):
+    """(cumulative ms, module) of the slowest imports of `import app`."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=ROOT_DIR,
+                            env=env, capture_output=True, text=True, check=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            imports.append((int(parts[1]) / 1000, parts[2].rstrip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def summarize(times):
+    ms = sorted(t * 1000 for t in times)
+    return {
+        'median': round(statistics.median(ms), 2),
+        'p95': round(ms[max(0, int(len(ms) * 0.95 + 0.5) - 1)], 2),
+        'min': round(ms[0], 2),
+        'runs': len(ms),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--command', help='server executable (default: this Python running app.py)')
+    parser.add_argument('--dev', action='store_true', help='start the debug server (--dev)')
+    parser.add_argument('--repeat', type=int, default=5, help='starts per benchmark')
+    parser.add_argument('--timeout', type=float, default=60, help='seconds to wait for the first answer')
+    parser.add_argument('--imports', action='store_true', help='print the slowest imports of app.py')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown (0.25 = 25%%)')
+    parser.add_argument('--min-delta-ms', type=float, default=50.0, help='ignore slowdowns smaller than this')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args(argv)
+
+    command = [args.command] if args.command else [sys.executable, os.path.join(ROOT_DIR, 'app.py')]
+    if args.dev:
+        command.append('--dev')
+    config = {'command': args.command or 'app.py', 'dev': args.dev}
+
+    work_dir = tempfile.mkdtemp(prefix='adbv_startup_')
+    results = {}
+    try:
+        env = isolated_env(work_dir)
+        print("Startup:")
+        if not args.command:
+            results['import_app'] = summarize([time_import(env) for _ in range(args.repeat)])
+            print(f"  {'import_app':<24} median {results['import_app']['median']:>9.2f} ms")
+        name = 'first_request_dev' if args.dev else 'first_request'
+        results[name] = summarize([time_first_request(command, env, args.timeout) for _ in range(args.repeat)])
+        print(f"  {name:<24} median {results[name]['median']:>9.2f} ms")
+        if args.imports and not args.command:
+            print("\nSlowest imports (cumulative):")
+            for ms, module in slowest_imports(env):
+                print(f"  {ms:>9.1f} ms  {module}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        'config': config,
+        'machine': {'python': platform.python_version(), 'platform': platform.platform()},
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'results': results,
+    }
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('config') != config:
+            print(f"\nBaseline {args.baseline} was recorded with {baseline.get('config')}; not comparing.")
+            baseline = None
+    regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+    if regressions:
+        print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
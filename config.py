@@ -2,9 +2,92 @@ import os
 
 class Config:
     BASE_DIR = os.path.abspath(os.path.dirname(__file__))
-    TEMP_DIR = os.path.join(BASE_DIR, 'temp')
-    LOG_DIR = os.path.join(BASE_DIR, 'logs')
+    # ADBV_TEMP_DIR / ADBV_LOG_DIR move them (e.g. a second instance, bench/startup_bench.py)
+    TEMP_DIR = os.environ.get('ADBV_TEMP_DIR') or os.path.join(BASE_DIR, 'temp')
+    LOG_DIR = os.environ.get('ADBV_LOG_DIR') or os.path.join(BASE_DIR, 'logs')
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'you-will-never-guess'
+
+    # Server: `python app.py` serves with waitress (threads) when it is installed,
+    # else with the threaded Werkzeug server; `--dev` runs the debug server with reloader
+    HOST = '127.0.0.1'
+    PORT = 5000
+    # Threads for ordinary requests; Monitor streams get WATCH_MAX_STREAMS more
+    SERVER_THREADS = 8
+    OPEN_BROWSER = True
+
+    # ADB: the adb executable (e.g. bench/fake_adb.py to try the app without a phone)
+    ADB_PATH = os.environ.get('ADB_PATH') or 'adb'
+    # Seconds a single device command may run before its shell session is reset
+    ADB_COMMAND_TIMEOUT = 30
+    # Seconds a device's root check is trusted (a reconnect always re-checks)
+    ROOT_CACHE_TTL = 300
+
+    # Delta sync: SQLite pages per compared block, and where the pristine mirrors live
+    DELTA_BLOCK_PAGES = 16
+    # Blocks hashed per batch on the device: fewer processes per batch, but
+    # the batch is split into a scratch directory (128 x 16 x 4 KiB = 8 MiB)
+    DELTA_HASH_BATCH_BLOCKS = 128
+    MIRROR_DIR = os.path.join(TEMP_DIR, 'mirrors')
+
+    # Snapshot store: content-addressed pulls, newest N kept per database,
+    # least recently used evicted above the byte budget
+    SNAPSHOT_DIR = os.path.join(TEMP_DIR, 'snapshots')
+    SNAPSHOTS_PER_DB = 3
+    SNAPSHOT_MAX_BYTES = 2 * 1024 ** 3
+    # Writable copies of snapshots (for statements that modify data) kept at once
+    SNAPSHOT_FORKS = 5
+    # Keep the WAL of each pull, so every commit in it can be browsed (/api/wal)
+    SNAPSHOT_KEEP_WAL = True
+    WAL_VIEW_DIR = os.path.join(TEMP_DIR, 'wal_views')
+
+    # Snapshot jobs: parallel pulls in total and per device
+    SNAPSHOT_JOB_WORKERS = 4
+    SNAPSHOT_JOB_PER_DEVICE = 2
+
+    # Read-only connection pool for snapshots
+    DB_POOL_MAX_IDLE = 4          # idle connections kept per snapshot
+    DB_POOL_IDLE_TIMEOUT = 120    # seconds before an idle connection is closed
+    DB_MMAP_SIZE = 1024 * 1024 * 1024
+    DB_CACHE_SIZE_KIB = 16384
+
+    # SQL tab: rows per chunk, hard cap per streamed query ('stream'/'cursor'
+    # mode; plain results only take the request's max_rows), idle cursor lifetime (s)
+    QUERY_PAGE_SIZE = 500
+    QUERY_MAX_ROWS = 100000
+    QUERY_CURSOR_IDLE_TIMEOUT = 300
+    # Seconds of SQLite work a single query may use before it is interrupted
+    QUERY_TIMEOUT = 30
+    # Result cache for read-only queries and table pages (bytes in total, per result)
+    RESULT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+    RESULT_CACHE_MAX_ENTRY_BYTES = 8 * 1024 * 1024
+    # Exports: rows read and written per chunk
+    EXPORT_CHUNK_ROWS = 1000
+    # Monitor: seconds between remote stat checks, SSE keep-alive interval
+    # (a closed tab's stream holds its thread until the next keep-alive fails)
+    WATCH_INTERVAL = 2.0
+    WATCH_HEARTBEAT = 5
+    # Open Monitor streams (/api/watch) at once, each holding a server thread;
+    # further streams get an 'error' event and the client stops monitoring
+    WATCH_MAX_STREAMS = 16
+
+    # Monitor diffs: past this many changed rows per kind the page is reloaded instead
+    DIFF_MAX_ROWS = 1000
+    # Full-text search: rows read per indexing chunk, most matches returned
+    SEARCH_INDEX_CHUNK_ROWS = 1000
+    SEARCH_MAX_RESULTS = 200
+    # BLOB cells are sent as stubs; /api/blob hex dumps this many bytes by default
+    # and decodes values up to BLOB_DECODE_MAX_BYTES as protobuf
+    BLOB_PREVIEW_BYTES = 4096
+    BLOB_DECODE_MAX_BYTES = 1024 * 1024
+    # Table views: a column sorted/filtered on this often gets an index in the
+    # snapshot's working copy (tables with at least TABLE_INDEX_MIN_ROWS rows)
+    TABLE_INDEX_MIN_USES = 2
+    TABLE_INDEX_MIN_ROWS = 10000
+    TABLE_INDEX_MAX_PER_SNAPSHOT = 8
+    # Metrics: one JSON line per timed span in LOG_DIR/metrics.log (see /api/metrics)
+    METRICS_LOG = True
+    METRICS_LOG_MAX_BYTES = 5 * 1024 * 1024
+    METRICS_LOG_BACKUPS = 3
     
     # Ensure directories exist
     os.makedirs(TEMP_DIR, exist_ok=True)
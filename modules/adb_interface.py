@@ -1,67 +1,145 @@
 import subprocess
 import os
 import time
+import uuid
 import base64
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from modules.adb_transport import ADBTransport
+from modules.metrics import metrics
 
 class ADBInterface:
-    def __init__(self, adb_path='adb'):
+    # Read size for binary exec-out transfers
+    STREAM_CHUNK_SIZE = 1024 * 1024
+    # Timeout for whole-file copies and pulls: none, they take as long as the file needs
+    TRANSFER_TIMEOUT = 0
+
+    # Ways to get a root shell, tried in this order. {cmd} is a shell script
+    # without single quotes. 'adbd' means adbd itself already runs as root.
+    SU_VARIANTS = [
+        ('adbd', "sh -c '{cmd}'"),
+        ('su -c', "su -c '{cmd}'"),
+        ('su 0', "su 0 sh -c '{cmd}'"),
+    ]
+
+    def __init__(self, adb_path='adb', command_timeout=30, root_cache_ttl=300, probe_workers=8,
+                 hash_batch_blocks=128):
         self.adb_path = adb_path
+        self.command_timeout = command_timeout
+        # One persistent `adb shell` per device, reused by every device-side command
+        self.transport = ADBTransport(adb_path, command_timeout)
+        # (device_id, package) -> how private app files can be read (su / run-as)
+        self._access_cache = {}
+        # device_id -> {'su': su variant or None, 'checked': time}
+        self._root_cache = {}
+        self.root_cache_ttl = root_cache_ttl
+        self.probe_workers = probe_workers
+        # device_id -> (package list fingerprint, {package: debuggable})
+        self._debuggable_cache = {}
+        # device_id -> status from the last `adb devices`, to notice reconnects
+        self._device_states = {}
+        # Blocks hashed per batch by hash_remote_blocks (scratch space on the device)
+        self.hash_batch_blocks = hash_batch_blocks
+        self._lock = threading.Lock()
 
-    def _run_command(self, command):
-        """Run an ADB command and return the output."""
-        full_command = f"{self.adb_path} {command}"
-        try:
-            result = subprocess.run(
-                full_command,
-                shell=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                # text=True,  <-- REMOVED: We need binary output for base64
-                # encoding='utf-8' <-- REMOVED
-            )
-            if result.returncode != 0:
-                # Need to decode stderr for logging
-                try:
-                    err = result.stderr.decode('utf-8', errors='ignore')
-                except:
-                    err = str(result.stderr)
-                print(f"Error running command '{full_command}': {err}")
-                return None
+    def _run_command(self, args, timeout=None):
+        """Run a host-side ADB command (devices, pull...) and return the output.
+
+        args are the adb arguments as a list (no shell, so paths need no
+        quoting). timeout defaults to command_timeout; TRANSFER_TIMEOUT (0)
+        means no limit, for pulls whose duration grows with the file size.
+        """
+        with metrics.span('adb_command', command=self._command_verb(args)) as span:
+            full_command = ' '.join([self.adb_path] + list(args))
+            if timeout is None:
+                timeout = self.command_timeout
+            try:
+                result = subprocess.run(
+                    [self.adb_path] + list(args),
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    timeout=timeout or None,
+                    # text=True,  <-- REMOVED: We need binary output for base64
+                    # encoding='utf-8' <-- REMOVED
+                )
+                if result.returncode != 0:
+                    # Need to decode stderr for logging
+                    try:
+                        err = result.stderr.decode('utf-8', errors='ignore')
+                    except:
+                        err = str(result.stderr)
+                    print(f"Error running command '{full_command}': {err}")
+                    span.fail(f"exit {result.returncode}")
+                    return None
             
-            # For list_packages and others that expect string, we try to decode.
-            # For base64 output, we need to handle it carefully in caller, 
-            # BUT here we are a generic runner.
-            # To avoid breaking existing code, we try to decode as utf-8 by default.
-            # If it fails (binary garbage?), we return bytes?
-            # Or better: We change _run_command to ALWAYS return bytes, and let callers decode?
-            # That's a big refactor.
-            # 
-            # Alternative: Add a 'binary' flag to this method.
-            # But we can't easily change signature everywhere.
+                # For list_packages and others that expect string, we try to decode.
+                # For base64 output, we need to handle it carefully in caller, 
+                # BUT here we are a generic runner.
+                # To avoid breaking existing code, we try to decode as utf-8 by default.
+                # If it fails (binary garbage?), we return bytes?
+                # Or better: We change _run_command to ALWAYS return bytes, and let callers decode?
+                # That's a big refactor.
+                # 
+                # Alternative: Add a 'binary' flag to this method.
+                # But we can't easily change signature everywhere.
             
-            # Let's try to decode. Base64 IS valid utf-8 text (it's ASCII).
-            # The problem with 'text=True' in subprocess on Windows is \r\n translation.
-            # By reading bytes and decoding manually, we avoid automatic newline translation?
-            # Python's decode() usually handles newlines fine, but subprocess text mode does more.
+                # Let's try to decode. Base64 IS valid utf-8 text (it's ASCII).
+                # The problem with 'text=True' in subprocess on Windows is \r\n translation.
+                # By reading bytes and decoding manually, we avoid automatic newline translation?
+                # Python's decode() usually handles newlines fine, but subprocess text mode does more.
             
-            try:
-                return result.stdout.decode('utf-8').strip()
-            except UnicodeDecodeError:
-                # If it's not text, return raw bytes? 
-                # Existing code expects string (e.g. split('\n')).
-                # If we return bytes, code like "if 'Permission' in output" will fail.
-                # Base64 output IS text. So decode() should work.
-                # The fix is that we REMOVED text=True, so we get raw bytes from pipe, 
-                # avoiding Windows CRLF mangling of the stream BEFORE we get it.
-                return result.stdout.decode('utf-8', errors='ignore').strip()
+                try:
+                    return result.stdout.decode('utf-8').strip()
+                except UnicodeDecodeError:
+                    # If it's not text, return raw bytes? 
+                    # Existing code expects string (e.g. split('\n')).
+                    # If we return bytes, code like "if 'Permission' in output" will fail.
+                    # Base64 output IS text. So decode() should work.
+                    # The fix is that we REMOVED text=True, so we get raw bytes from pipe, 
+                    # avoiding Windows CRLF mangling of the stream BEFORE we get it.
+                    return result.stdout.decode('utf-8', errors='ignore').strip()
                 
-        except Exception as e:
-            print(f"Exception running command '{full_command}': {e}")
-            return None
+            except subprocess.TimeoutExpired:
+                print(f"Command timed out: '{full_command}'")
+                span.fail('timeout')
+                return None
+            except Exception as e:
+                print(f"Exception running command '{full_command}': {e}")
+                span.fail(e)
+                return None
+
+    @staticmethod
+    def _command_verb(args):
+        """['-s', SERIAL, 'pull', a, b] -> 'pull', the metrics label of a host-side command."""
+        words = list(args)
+        if len(words) >= 2 and words[0] == '-s':
+            words = words[2:]
+        return words[0] if words else ''
+
+    @staticmethod
+    def _shell_program(command):
+        """'run-as pkg cat f | base64' -> 'run-as', the metrics label of a shell command."""
+        first = command.split(None, 1)[0] if command.strip() else ''
+        return os.path.basename(first).strip('\'"') or 'sh'
+
+    def _shell(self, device_id, command, timeout=None):
+        """Run a shell command on the device through its persistent session.
+
+        Same contract as _run_command: the stripped output, or None on a non-zero
+        exit code, a timeout or a dead session.
+        """
+        with metrics.span('adb_shell', program=self._shell_program(command)) as span:
+            exit_code, stdout, stderr = self.transport.run(device_id, command, timeout)
+            span.fields['bytes'] = len(stdout or b'')
+            if exit_code != 0:
+                print(f"Error running shell command '{command}' on {device_id} (exit {exit_code}): {stderr}")
+                span.fail(f"exit {exit_code}")
+                return None
+            return stdout.decode('utf-8', errors='ignore').strip()
 
     def connect_device(self):
         """Check for connected devices."""
-        output = self._run_command("devices")
+        output = self._run_command(['devices'])
         devices = []
         if output:
             lines = output.split('\n')
@@ -70,44 +148,77 @@ class ADBInterface:
                     parts = line.split()
                     if len(parts) >= 2:
                         devices.append({'id': parts[0], 'status': parts[1]})
+        self._track_reconnects(devices)
         return devices
 
+    def _track_reconnects(self, devices):
+        """Forget what we know about devices that went away or changed state.
+
+        A reconnected device may have been rebooted, rooted or unrooted, and its
+        shell session is dead, so root and file access are probed again.
+        """
+        states = {d['id']: d['status'] for d in devices}
+        with self._lock:
+            changed = [
+                device_id for device_id in set(self._device_states) | set(states)
+                if self._device_states.get(device_id) != states.get(device_id)
+            ]
+            self._device_states = states
+        for device_id in changed:
+            self.forget_device(device_id)
+
+    def forget_device(self, device_id):
+        with self._lock:
+            self._root_cache.pop(device_id, None)
+            self._debuggable_cache.pop(device_id, None)
+            for key in [k for k in self._access_cache if k[0] == device_id]:
+                del self._access_cache[key]
+        self.transport.close(device_id)
+
     def check_root(self, device_id):
-        """Check if the device has root access."""
+        """Check if the device has root access (cached for root_cache_ttl seconds)."""
+        return self._su_variant(device_id) is not None
+
+    def check_root_many(self, device_ids):
+        """check_root for several devices at once. Returns {device_id: bool}.
+
+        Each device has its own shell session, so probing them in parallel
+        takes about as long as the slowest device.
+        """
+        if not device_ids:
+            return {}
+        workers = max(1, min(self.probe_workers, len(device_ids)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return dict(zip(device_ids, executor.map(self.check_root, device_ids)))
+
+    def _su_variant(self, device_id):
+        """The SU_VARIANTS template that gives a root shell on this device, or None."""
+        with self._lock:
+            cached = self._root_cache.get(device_id)
+        if cached and time.time() - cached['checked'] < self.root_cache_ttl:
+            return cached['su']
+
         print(f"Checking root for {device_id}...")
-        
-        # Method 1: Check if adbd is already running as root (e.g. emulator)
-        cmd1 = f"-s {device_id} shell id"
-        out1 = self._run_command(cmd1)
-        if out1 and 'uid=0(root)' in out1:
-            print(f"Device {device_id} is root (adbd running as root)")
-            return True
+        su = None
+        outputs = []
+        for name, template in self.SU_VARIANTS:
+            output = self._shell(device_id, template.format(cmd='id'))
+            outputs.append(output)
+            if output and 'uid=0(root)' in output:
+                print(f"Device {device_id} has root access ({name})")
+                su = template
+                break
+        else:
+            print(f"Device {device_id} does NOT appear to have root access. Outputs: {outputs}")
 
-        # Method 2: su -c id (Standard)
-        # Note: On some devices/versions 'su 0 id' might work better, or quotes might be an issue.
-        # Trying without inner quotes for Windows compatibility if simple
-        cmd2 = f"-s {device_id} shell su -c id"
-        out2 = self._run_command(cmd2)
-        if out2 and 'uid=0(root)' in out2:
-            print(f"Device {device_id} has root access (su -c id)")
-            return True
-            
-        # Method 3: su 0 id (Alternative)
-        cmd3 = f"-s {device_id} shell su 0 id"
-        out3 = self._run_command(cmd3)
-        if out3 and 'uid=0(root)' in out3:
-            print(f"Device {device_id} has root access (su 0 id)")
-            return True
-        
-        # Method 4: With quotes (original method)
-        cmd4 = f"-s {device_id} shell \"su -c 'id'\""
-        out4 = self._run_command(cmd4)
-        if out4 and 'uid=0(root)' in out4:
-            print(f"Device {device_id} has root access (quoted)")
-            return True
+        with self._lock:
+            self._root_cache[device_id] = {'su': su, 'checked': time.time()}
+        return su
 
-        print(f"Device {device_id} does NOT appear to have root access. Outputs: [{out1}], [{out2}], [{out3}], [{out4}]")
-        return False
+    def _su(self, device_id, cmd):
+        """Wrap a script (no single quotes!) to run as root, or None without root."""
+        su = self._su_variant(device_id)
+        return su.format(cmd=cmd) if su else None
 
     def list_packages(self, device_id, filter_type='all'):
         """List packages with filtering.
@@ -120,8 +231,7 @@ class ADBInterface:
         elif filter_type == '-s':
             cmd_args = "-s"
             
-        command = f"-s {device_id} shell pm list packages {cmd_args}"
-        output = self._run_command(command)
+        output = self._shell(device_id, f"pm list packages {cmd_args}")
         
         packages = []
         if not output:
@@ -137,24 +247,81 @@ class ADBInterface:
     def is_package_debuggable(self, device_id, package_name):
         """Check if a specific package is debuggable using run-as."""
         # This is accurate but slow if run 100 times.
-        cmd = f"-s {device_id} shell \"run-as {package_name} id\""
-        output = self._run_command(cmd)
+        output = self._shell(device_id, f"run-as {package_name} id")
         return output and "uid=" in output and "package not debuggable" not in output
 
+    def debuggable_packages(self, device_id):
+        """Return {package: debuggable} for every installed package.
+
+        Read from the package flags in one `dumpsys package` call, or if that is
+        not readable, from one device-side loop over `run-as`. Cached per device
+        until the installed package list changes.
+        """
+        packages = self._shell(device_id, "pm list packages")
+        if packages is None:
+            return None
+        names = sorted(
+            line[len('package:'):].strip() for line in packages.split('\n') if line.startswith('package:')
+        )
+        fingerprint = hash(tuple(names))
+        with self._lock:
+            cached = self._debuggable_cache.get(device_id)
+        if cached and cached[0] == fingerprint:
+            return cached[1]
+
+        flags = self._debuggable_from_dumpsys(device_id)
+        if flags is None:
+            flags = self._debuggable_from_run_as(device_id)
+        if flags is None:
+            return None
+        result = {name: flags.get(name, False) for name in names}
+
+        with self._lock:
+            self._debuggable_cache[device_id] = (fingerprint, result)
+        return result
+
+    def _debuggable_from_dumpsys(self, device_id):
+        """Parse `Package [name]` blocks and their `flags=[ ... ]` line."""
+        output = self._shell(device_id, "dumpsys package packages", timeout=max(self.command_timeout, 60))
+        if not output:
+            return None
+
+        flags = {}
+        current = None
+        for line in output.split('\n'):
+            line = line.strip()
+            if line.startswith('Package [') and ']' in line:
+                current = line[len('Package ['):line.index(']')]
+            elif current and (line.startswith('flags=[') or line.startswith('pkgFlags=[')):
+                # Newer releases print flags=, older ones pkgFlags=. The first block of a
+                # package wins (later ones are hidden system versions)
+                flags.setdefault(current, 'DEBUGGABLE' in line.split())
+                current = None
+        return flags or None
+
+    def _debuggable_from_run_as(self, device_id):
+        """One shell loop instead of one `run-as <pkg> id` round trip per package."""
+        script = (
+            "for p in $(pm list packages | cut -d: -f2); do "
+            "run-as $p true >/dev/null 2>&1 && echo $p; done; true"
+        )
+        output = self._shell(device_id, script, timeout=max(self.command_timeout, 300))
+        if output is None:
+            return None
+        return {line.strip(): True for line in output.split('\n') if line.strip()}
+
     def list_databases(self, device_id, package_name):
         """List database files for a package."""
-        # Try method 1: Root (su)
-        cmd = f"ls /data/data/{package_name}/databases"
-        command_su = f"-s {device_id} shell \"su -c '{cmd}'\""
-        output = self._run_command(command_su)
+        # Try method 1: Root (su), skipped on devices known to have no root
+        su_cmd = self._su(device_id, f"ls /data/data/{package_name}/databases")
+        output = self._shell(device_id, su_cmd) if su_cmd else None
         
         databases = []
         
         # If root failed or permission denied, try Method 2: run-as (Debuggable)
         if not output or "Permission denied" in output or "not found" in output:
             print(f"Root access failed for {package_name}, trying run-as...")
-            command_run_as = f"-s {device_id} shell \"run-as {package_name} ls databases\""
-            output = self._run_command(command_run_as)
+            output = self._shell(device_id, f"run-as {package_name} ls databases")
             
         if output:
             # Check for common run-as errors
@@ -172,75 +339,256 @@ class ADBInterface:
                     databases.append(line)
         return databases
 
-    def pull_database(self, device_id, package_name, db_name, local_path):
-        """Pull a database file and its auxiliary files (WAL/SHM) from the device."""
+    def _stream(self, device_id, remote_command, write, progress=None):
+        """Feed the raw stdout of `adb exec-out <remote_command>` to write().
+
+        Data is copied in STREAM_CHUNK_SIZE pieces, so memory stays flat no matter
+        how big the file is. Returns the number of bytes streamed, or -1 on failure.
+        """
+        done = 0
+        try:
+            proc = subprocess.Popen(
+                [self.adb_path, '-s', device_id, 'exec-out', remote_command],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+            )
+            with proc:
+                while True:
+                    chunk = proc.stdout.read(self.STREAM_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    write(chunk)
+                    done += len(chunk)
+                    if progress:
+                        progress(done)
+            metrics.inc('adb_bytes_total', done, method='exec-out')
+            if proc.returncode != 0:
+                print(f"exec-out '{remote_command}' failed with exit code {proc.returncode}")
+                return -1
+            return done
+        except Exception as e:
+            print(f"Exception streaming '{remote_command}': {e}")
+            return -1
+
+    def _stream_to_file(self, device_id, remote_command, target_path, progress=None):
+        """Stream `adb exec-out <remote_command>` into target_path. Returns bytes written or -1."""
+        temp_path = f"{target_path}.part"
+        with open(temp_path, 'wb') as f:
+            done = self._stream(device_id, remote_command, f.write, progress)
+        if done < 0:
+            os.remove(temp_path)
+            return -1
+        os.replace(temp_path, target_path)
+        return done
+
+    def _pull_base64(self, device_id, package_name, remote_file, target_path):
+        """Fallback transfer: `cat | base64` through the shell, decoded in memory."""
+        b64_output = self._shell(device_id, f"run-as {package_name} cat {remote_file} | base64", self.TRANSFER_TIMEOUT)
+        
+        if b64_output and "package not debuggable" not in b64_output and "No such file" not in b64_output:
+            try:
+                # Clean up output (remove newlines etc)
+                b64_data = b64_output.replace('\n', '').replace('\r', '')
+                
+                # Debug log
+                print(f"Run-as pull {remote_file}: {len(b64_data)} bytes base64")
+
+                # If empty
+                if not b64_data:
+                    print(f"File {remote_file} is empty or not found via run-as.")
+                    return False
+
+                file_data = base64.b64decode(b64_data)
+                metrics.inc('adb_bytes_total', len(b64_data), method='base64')
+                with open(target_path, 'wb') as f:
+                    f.write(file_data)
+                return True
+            except Exception as e:
+                print(f"Failed to decode base64 stream for {remote_file}: {e}")
+                return False
+        else:
+            print(f"Run-as failed for {remote_file}. Output: {b64_output[:100] if b64_output else 'None'}")
+        return False
+
+    # --- Direct access to the app's private files (used by delta sync) ---
+
+    def _data_access(self, device_id, package_name):
+        """Find out how we can read /data/data/<package>/databases on this device.
+
+        Returns {'mode': 'su'|'run-as', 'dir': ..., 'tmp': ...} or None. The answer is
+        remembered per device and package, since it does not change between ticks.
+        """
+        key = (device_id, package_name)
+        if key in self._access_cache:
+            return self._access_cache[key]
+
+        access = None
+        db_dir = f"/data/data/{package_name}/databases"
+        su_cmd = self._su(device_id, f"ls {db_dir}")
+        if su_cmd and self._shell(device_id, su_cmd) is not None:
+            access = {'mode': 'su', 'dir': db_dir, 'tmp': '/data/local/tmp', 'su': self._su_variant(device_id)}
+        elif self._shell(device_id, f"run-as {package_name} ls databases") is not None:
+            access = {'mode': 'run-as', 'dir': 'databases', 'tmp': 'cache'}
+
+        if access:
+            self._access_cache[key] = access
+        return access
+
+    @staticmethod
+    def _data_command(access, package_name, script):
+        """Wrap a shell script (no single quotes!) so it runs with access to the app's files."""
+        if access['mode'] == 'su':
+            return access['su'].format(cmd=script)
+        return f"run-as {package_name} sh -c '{script}'"
+
+    def stat_remote_files(self, device_id, package_name, filenames):
+        """Return {filename: {'size', 'mtime', 'head'}} for the files that exist.
+
+        'head' is the md5 of the first 32 bytes, which for a WAL file covers the
+        header and its salts (they change whenever the WAL is restarted).
+        """
+        access = self._data_access(device_id, package_name)
+        if not access:
+            return None
+        names = ' '.join(f'"{f}"' for f in filenames)
+        script = (
+            f'cd {access["dir"]} && for f in {names}; do if [ -f "$f" ]; then '
+            f'echo "$f|$(stat -c "%s|%y" "$f")|$(dd if="$f" bs=32 count=1 2>/dev/null | md5sum)"; '
+            f'fi; done'
+        )
+        output = self._shell(device_id, self._data_command(access, package_name, script))
+        if output is None:
+            return None
+
+        result = {}
+        for line in output.split('\n'):
+            parts = line.strip().split('|')
+            if len(parts) == 4 and parts[1].isdigit():
+                result[parts[0]] = {'size': int(parts[1]), 'mtime': parts[2], 'head': parts[3].split()[0] if parts[3] else ''}
+        return result
+
+    def hash_remote_blocks(self, device_id, package_name, filename, block_size):
+        """md5 of every block_size block of a remote file, in order. None on failure.
+
+        The file is read in batches of hash_batch_blocks blocks: one dd per
+        batch is split into block files in a scratch directory, and one md5sum
+        hashes them all. That takes a handful of processes per batch and
+        scratch space for one batch, never a copy of the whole file. Devices
+        without `split` fall back to one dd | md5sum per block.
+        """
+        access = self._data_access(device_id, package_name)
+        if not access:
+            return None
+        path = f'{access["dir"]}/{filename}'
+        scratch = f'{access["tmp"]}/adbv_blocks_{uuid.uuid4().hex[:8]}'
+        batch = max(1, self.hash_batch_blocks)
+        count = f's=$(stat -c %s "{path}") && n=$(( (s + {block_size} - 1) / {block_size} ))'
+        script = (
+            f'{count} && rm -rf {scratch} && mkdir -p {scratch} && g=0 && '
+            f'while [ $g -lt $n ]; do '
+            f'dd if="{path}" bs={block_size} skip=$g count={batch} 2>/dev/null | '
+            f'split -b {block_size} -a 6 - {scratch}/b && md5sum {scratch}/b* && rm -f {scratch}/b* || break; '
+            f'g=$((g+{batch})); done; '
+            f'rm -rf {scratch}; [ $g -ge $n ]'
+        )
+        command = self._data_command(access, package_name, script)
+        output = self._shell(device_id, command, self.TRANSFER_TIMEOUT)
+        if output is None:
+            script = (
+                f'{count} && i=0 && while [ $i -lt $n ]; do dd bs={block_size} count=1 2>/dev/null | md5sum; '
+                f'i=$((i+1)); done < "{path}"'
+            )
+            output = self._shell(device_id, self._data_command(access, package_name, script), self.TRANSFER_TIMEOUT)
+        if output is None:
+            return None
+        return [line.split()[0] for line in output.split('\n') if line.strip()]
+
+    def read_remote_blocks(self, device_id, package_name, filename, block_size, first_block, count, write):
+        """Stream `count` blocks starting at `first_block` of a remote file. Returns bytes read or -1."""
+        access = self._data_access(device_id, package_name)
+        if not access:
+            return -1
+        script = f'dd if="{access["dir"]}/{filename}" bs={block_size} skip={first_block} count={count} 2>/dev/null'
+        return self._stream(device_id, self._data_command(access, package_name, script), write)
+
+    def read_remote_tail(self, device_id, package_name, filename, start, write):
+        """Stream a remote file from byte offset `start` to its end. Returns bytes read or -1."""
+        access = self._data_access(device_id, package_name)
+        if not access:
+            return -1
+        path = f'{access["dir"]}/{filename}'
+        script = f'cat "{path}"' if start == 0 else f'tail -c +{start + 1} "{path}"'
+        return self._stream(device_id, self._data_command(access, package_name, script), write)
+
+    def pull_database(self, device_id, package_name, db_name, local_path, progress=None):
+        """Pull a database file and its auxiliary files (WAL/SHM) from the device.
+
+        progress, if given, is called as progress(filename, bytes_done, bytes_total)
+        while a file is being streamed.
+        """
         
         # Helper to pull a single file
         def pull_file(filename, target_path):
-            # Method 1: Try Root (su)
-            temp_remote_path = f"/sdcard/{filename}"
+            # Method 1: Try Root (su), skipped on devices known to have no root
+            # Unique name: several pulls may run on one device at once (snapshot jobs)
+            temp_remote_path = f"/sdcard/{package_name}_{filename}_{uuid.uuid4().hex[:8]}"
             cp_cmd = f"cp /data/data/{package_name}/databases/{filename} {temp_remote_path}"
             chmod_cmd = f"chmod 644 {temp_remote_path}"
             full_shell_cmd = f"{cp_cmd} && {chmod_cmd}"
             
-            command_su = f"-s {device_id} shell \"su -c '{full_shell_cmd}'\""
-            self._run_command(command_su)
-            
-            pull_cmd = f"-s {device_id} pull {temp_remote_path} \"{target_path}\""
-            self._run_command(pull_cmd)
-            
-            rm_cmd = f"-s {device_id} shell rm {temp_remote_path}"
-            self._run_command(rm_cmd)
-            
-            if os.path.exists(target_path) and os.path.getsize(target_path) > 0:
-                return True
+            su_cmd = self._su(device_id, full_shell_cmd)
+            if su_cmd and self._shell(device_id, su_cmd, self.TRANSFER_TIMEOUT) is not None:
+                self._run_command(['-s', device_id, 'pull', temp_remote_path, target_path], self.TRANSFER_TIMEOUT)
                 
-            # Method 2: Try run-as (Debuggable) using Base64 Streaming
+                self._shell(device_id, f"rm {temp_remote_path}")
+                
+                if os.path.exists(target_path) and os.path.getsize(target_path) > 0:
+                    metrics.inc('adb_bytes_total', os.path.getsize(target_path), method='pull')
+                    return True
+                
+            # Method 2: Try run-as (Debuggable) using a binary exec-out stream
             print(f"Root pull failed/not available, trying run-as for {filename}...")
             
             # Use 'cp' to cache to avoid file locking issues with 'cat' on live WAL files
             # 1. Copy to cache/temp_<filename>
             # 2. Cat from cache
             # 3. Remove from cache
-            temp_cache_file = f"cache/temp_{filename}_{int(time.time())}"
+            temp_cache_file = f"cache/temp_{filename}_{uuid.uuid4().hex[:8]}"
             
             # Step 1: Copy (cp preserves content better than cat for locked files)
-            cp_cmd = f"-s {device_id} shell \"run-as {package_name} cp databases/{filename} {temp_cache_file}\""
-            self._run_command(cp_cmd)
-            
-            # Step 2: Cat | base64
-            stream_cmd = f"-s {device_id} shell \"run-as {package_name} cat {temp_cache_file} | base64\""
-            b64_output = self._run_command(stream_cmd)
+            self._shell(device_id, f"run-as {package_name} cp databases/{filename} {temp_cache_file}",
+                        self.TRANSFER_TIMEOUT)
             
-            # Step 3: Cleanup (always try)
-            rm_cmd = f"-s {device_id} shell \"run-as {package_name} rm {temp_cache_file}\""
-            self._run_command(rm_cmd)
-            
-            if b64_output and "package not debuggable" not in b64_output and "No such file" not in b64_output:
-                try:
-                    # Clean up output (remove newlines etc)
-                    b64_data = b64_output.replace('\n', '').replace('\r', '')
-                    
-                    # Debug log
-                    print(f"Run-as pull {filename}: {len(b64_data)} bytes base64")
-
-                    # If empty
-                    if not b64_data:
-                        print(f"File {filename} is empty or not found via run-as.")
-                        if filename == db_name:
-                             return False
-                        return False 
-
-                    file_data = base64.b64decode(b64_data)
-                    with open(target_path, 'wb') as f:
-                        f.write(file_data)
-                    return True
-                except Exception as e:
-                    print(f"Failed to decode base64 stream for {filename}: {e}")
+            try:
+                # Step 2: Stream raw bytes with exec-out. Falls back to the
+                # older `cat | base64` transfer if exec-out is not usable.
+                size_output = self._shell(device_id, f"run-as {package_name} stat -c %s {temp_cache_file}")
+                if not size_output or not size_output.isdigit():
+                    # Missing file, or an old toolbox without `stat`: let the base64 path decide
+                    return self._pull_base64(device_id, package_name, temp_cache_file, target_path)
+                expected_size = int(size_output)
+                if expected_size == 0:
+                    print(f"File {filename} is empty via run-as.")
                     return False
-            else:
-                print(f"Run-as failed for {filename}. Output: {b64_output[:100] if b64_output else 'None'}")
-            return False
+
+                def report(done):
+                    if progress:
+                        progress(filename, done, expected_size)
+
+                received = self._stream_to_file(
+                    device_id, f"run-as {package_name} cat {temp_cache_file}", target_path, report
+                )
+                if received == expected_size:
+                    print(f"Run-as pull {filename}: {received} bytes via exec-out")
+                    return True
+
+                print(f"exec-out pull of {filename} returned {received} of {expected_size} bytes, falling back to base64...")
+                if os.path.exists(target_path):
+                    os.remove(target_path)
+                return self._pull_base64(device_id, package_name, temp_cache_file, target_path)
+            finally:
+                # Step 3: Cleanup (always try)
+                self._shell(device_id, f"run-as {package_name} rm {temp_cache_file}")
 
         # 1. First, try to pull WAL and SHM files (The "Incrementals")
         # We pull them BEFORE the main DB.
@@ -260,12 +608,22 @@ class ADBInterface:
         if os.path.exists(local_wal): os.remove(local_wal)
         if os.path.exists(local_shm): os.remove(local_shm)
         
+        def timed_pull(filename, target_path, phase):
+            with metrics.span('pull_file', file=phase) as span:
+                ok = pull_file(filename, target_path)
+                if ok:
+                    span.fields['bytes'] = os.path.getsize(target_path)
+                elif phase == 'db':
+                    # A missing -wal/-shm is normal (checkpointed or rollback journal)
+                    span.fail('pull failed')
+                return ok
+
         # Best effort pull for aux files
-        pull_file(wal_file, local_wal)
-        pull_file(shm_file, local_shm)
+        timed_pull(wal_file, local_wal, 'wal')
+        timed_pull(shm_file, local_shm, 'shm')
 
         # 2. Pull the main DB file (The "Base")
-        main_success = pull_file(db_name, local_path)
+        main_success = timed_pull(db_name, local_path, 'db')
         
         if main_success:
             return True
@@ -0,0 +1,170 @@
+import subprocess
+import threading
+import queue
+import uuid
+import time
+from collections import deque
+
+
+class ShellSession:
+    """A long-lived `adb -s <device> shell` process that runs commands one at a time.
+
+    Every command is framed with a unique marker that carries its exit code, so we
+    know exactly where one command's output ends without starting a new process.
+    """
+
+    def __init__(self, adb_path, device_id):
+        self.adb_path = adb_path
+        self.device_id = device_id
+        self.lock = threading.Lock()
+        self.process = None
+        self.last_used = time.time()
+        self._stdout = None
+        self._stderr = deque(maxlen=200)
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        # stdin is a pipe (not a tty), so adb opens a raw, non-PTY shell:
+        # no echo, no prompt and no CRLF translation of the output.
+        self.process = subprocess.Popen(
+            [self.adb_path, '-s', self.device_id, 'shell'],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            bufsize=0,
+        )
+        self._stdout = queue.Queue()
+        self._stderr.clear()
+        threading.Thread(target=self._pump, args=(self.process.stdout, self._stdout.put), daemon=True).start()
+        threading.Thread(target=self._pump, args=(self.process.stderr, self._stderr.append), daemon=True).start()
+
+    @staticmethod
+    def _pump(stream, sink):
+        try:
+            for line in iter(stream.readline, b''):
+                sink(line)
+        except (OSError, ValueError):
+            pass
+        # EOF marker: the session is gone
+        sink(None)
+
+    def close(self):
+        if self.process is not None:
+            try:
+                self.process.kill()
+                self.process.wait(timeout=2)
+            except Exception:
+                pass
+        self.process = None
+
+    def run(self, command, timeout=None):
+        """Run a command and return (exit_code, stdout_bytes, stderr_text).
+
+        exit_code is None if the session died or the command timed out. A timed
+        out session is killed, since its output stream is no longer in sync.
+        """
+        with self.lock:
+            if not self.is_alive():
+                self.start()
+            self.last_used = time.time()
+            self._stderr.clear()
+
+            marker = f"__ADBT_{uuid.uuid4().hex}__"
+            # Run in a subshell with stdin detached so a command can never eat the
+            # following frames, then print the marker on its own line with $?.
+            payload = f"( {command}\n) </dev/null\nprintf '\\n{marker}:%s\\n' \"$?\"\n"
+            try:
+                self.process.stdin.write(payload.encode('utf-8'))
+                self.process.stdin.flush()
+            except (OSError, ValueError) as e:
+                print(f"Shell session for {self.device_id} is broken: {e}")
+                self.close()
+                return None, b'', ''
+
+            deadline = time.time() + timeout if timeout else None
+            marker_bytes = marker.encode('ascii')
+            chunks = []
+            while True:
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                try:
+                    line = self._stdout.get(timeout=remaining)
+                except queue.Empty:
+                    break
+
+                if line is None:
+                    # Session exited (device gone, adb error...)
+                    stderr = self._stderr_text()
+                    self.close()
+                    return None, b''.join(chunks), stderr
+
+                if line.startswith(marker_bytes):
+                    try:
+                        exit_code = int(line[len(marker_bytes) + 1:].strip() or -1)
+                    except ValueError:
+                        exit_code = -1
+                    output = b''.join(chunks)
+                    # Drop the newline we printed in front of the marker
+                    if output.endswith(b'\n'):
+                        output = output[:-1]
+                    return exit_code, output, self._stderr_text()
+                chunks.append(line)
+
+            print(f"Command timed out after {timeout}s on {self.device_id}: {command}")
+            self.close()
+            return None, b''.join(chunks), self._stderr_text()
+
+    def _stderr_text(self):
+        lines = [l for l in list(self._stderr) if l]
+        return b''.join(lines).decode('utf-8', errors='ignore').strip()
+
+
+class ADBTransport:
+    """Keeps one persistent shell session per device and reuses it for every command."""
+
+    def __init__(self, adb_path='adb', default_timeout=30):
+        self.adb_path = adb_path
+        self.default_timeout = default_timeout
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def _get_session(self, device_id):
+        with self._lock:
+            session = self._sessions.get(device_id)
+            if session is None:
+                session = ShellSession(self.adb_path, device_id)
+                self._sessions[device_id] = session
+            return session
+
+    def run(self, device_id, command, timeout=None):
+        """Run a shell command on the device. Returns (exit_code, stdout_bytes, stderr_text).
+
+        timeout defaults to default_timeout; 0 means no limit.
+        """
+        if timeout is None:
+            timeout = self.default_timeout
+        session = self._get_session(device_id)
+        try:
+            return session.run(command, timeout)
+        except OSError as e:
+            # adb binary missing or not executable
+            print(f"Cannot start shell session for {device_id}: {e}")
+            return None, b'', str(e)
+
+    def close(self, device_id):
+        with self._lock:
+            session = self._sessions.pop(device_id, None)
+        if session:
+            session.close()
+
+    def close_all(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
@@ -0,0 +1,156 @@
+import struct
+import hashlib
+
+# Leading bytes of common BLOB payloads -> (type, MIME type)
+MAGIC = (
+    (b'\x89PNG\r\n\x1a\n', 'png', 'image/png'),
+    (b'\xff\xd8\xff', 'jpeg', 'image/jpeg'),
+    (b'GIF87a', 'gif', 'image/gif'),
+    (b'GIF89a', 'gif', 'image/gif'),
+    (b'%PDF-', 'pdf', 'application/pdf'),
+    (b'PK\x03\x04', 'zip', 'application/zip'),
+    (b'\x1f\x8b', 'gzip', 'application/gzip'),
+    (b'SQLite format 3\x00', 'sqlite', 'application/vnd.sqlite3'),
+    (b'bplist00', 'bplist', 'application/octet-stream'),
+)
+
+MIME_TYPES = {kind: mime for _, kind, mime in MAGIC}
+MIME_TYPES.update({'webp': 'image/webp', 'json': 'application/json', 'text': 'text/plain; charset=utf-8'})
+
+# Bytes looked at to tell text from binary
+TEXT_SNIFF_BYTES = 512
+
+
+def sniff_type(data):
+    """Rough content type of a BLOB from its first bytes: png, jpeg, gif,
+    webp, pdf, zip, gzip, sqlite, bplist, json, text or binary."""
+    for magic, kind, _ in MAGIC:
+        if data.startswith(magic):
+            return kind
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    head = data[:TEXT_SNIFF_BYTES]
+    try:
+        text = head.decode('utf-8')
+    except UnicodeDecodeError as e:
+        # A multi-byte character may be cut at the end of the sample
+        if len(data) <= TEXT_SNIFF_BYTES or e.start < len(head) - 3:
+            return 'binary'
+        text = head[:e.start].decode('utf-8')
+    if not text or any(c < ' ' and c not in '\t\r\n' for c in text):
+        return 'binary'
+    return 'json' if text.lstrip()[:1] in ('{', '[') else 'text'
+
+
+def mime_type(kind):
+    return MIME_TYPES.get(kind, 'application/octet-stream')
+
+
+def blob_stub(data):
+    """What the client gets instead of a BLOB value: its size, type and SHA-1.
+    The bytes themselves are read through /api/blob."""
+    return {'$blob': len(data), 'type': sniff_type(data), 'sha1': hashlib.sha1(data).hexdigest()}
+
+
+def wire_row(row):
+    """A row as a JSON-ready list, BLOBs replaced by stubs."""
+    return [blob_stub(v) if isinstance(v, bytes) else v for v in row]
+
+
+def hex_preview(data, offset=0, width=16):
+    """Hex dump lines ('00000010  de ad be ef ...  ....') of data read at offset."""
+    lines = []
+    for i in range(0, len(data), width):
+        chunk = data[i:i + width]
+        text = ''.join(chr(b) if 32 <= b < 127 else '.' for b in chunk)
+        lines.append(f"{offset + i:08x}  {chunk.hex(' '):<{width * 3 - 1}}  {text}")
+    return lines
+
+
+def _varint(data, pos):
+    result = shift = 0
+    while pos < len(data) and shift < 64:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+    raise ValueError('truncated varint')
+
+
+def protobuf_preview(data, max_depth=8, max_fields=1000):
+    """Decode data as a protobuf message without its schema.
+
+    Returns [{'field', 'wire', 'value'}]; length-delimited values come as a
+    'string' if they are printable UTF-8, else as a nested 'message' if they
+    parse as one, else as 'hex'. Returns None if data is not a message.
+    """
+    try:
+        fields = _protobuf_fields(data, max_depth, [max_fields])
+    except ValueError:
+        return None
+    return fields if fields else None
+
+
+def _protobuf_fields(data, depth, budget):
+    fields = []
+    pos = 0
+    while pos < len(data):
+        key, pos = _varint(data, pos)
+        field, wire = key >> 3, key & 7
+        if field == 0:
+            raise ValueError('field number 0')
+        budget[0] -= 1
+        if budget[0] < 0:
+            raise ValueError('too many fields')
+        if wire == 0:
+            value, pos = _varint(data, pos)
+            fields.append({'field': field, 'wire': 'varint', 'value': value})
+        elif wire == 1:
+            if pos + 8 > len(data):
+                raise ValueError('truncated fixed64')
+            raw = data[pos:pos + 8]
+            pos += 8
+            fields.append({'field': field, 'wire': 'fixed64', 'value': struct.unpack('<q', raw)[0],
+                           'double': struct.unpack('<d', raw)[0]})
+        elif wire == 5:
+            if pos + 4 > len(data):
+                raise ValueError('truncated fixed32')
+            raw = data[pos:pos + 4]
+            pos += 4
+            fields.append({'field': field, 'wire': 'fixed32', 'value': struct.unpack('<i', raw)[0],
+                           'float': struct.unpack('<f', raw)[0]})
+        elif wire == 2:
+            length, pos = _varint(data, pos)
+            if pos + length > len(data):
+                raise ValueError('truncated bytes')
+            fields.append({'field': field, 'wire': 'bytes', **_length_delimited(data[pos:pos + length], depth, budget)})
+            pos += length
+        else:
+            # Groups (3, 4) are long deprecated; anything else is not protobuf
+            raise ValueError(f"wire type {wire}")
+    return fields
+
+
+def _length_delimited(value, depth, budget):
+    # Text first: the tags of low field numbers (0x08, 0x12...) are control
+    # characters, so a printable value is hardly ever a nested message
+    text = _printable(value)
+    if text is not None:
+        return {'string': text}
+    if depth > 1:
+        try:
+            return {'message': _protobuf_fields(value, depth - 1, budget)}
+        except ValueError:
+            pass
+    return {'hex': value[:256].hex(), 'size': len(value)}
+
+
+def _printable(value):
+    try:
+        text = value.decode('utf-8')
+    except UnicodeDecodeError:
+        return None
+    return text if all(c >= ' ' or c in '\t\r\n' for c in text) else None
+
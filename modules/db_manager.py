@@ -1,36 +1,527 @@
 import sqlite3
-import pandas as pd
 import json
+import os
+import base64
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from urllib.request import pathname2url
+
+from modules.result_cache import is_cacheable, normalize_sql, estimate_size
+from modules.blobs import wire_row
+from modules.metrics import metrics
+
+# (db_path, table) -> (file signature, row count). Snapshots don't change after
+# they are pulled, so a count stays valid until the file itself changes.
+_row_count_cache = {}
+_row_count_lock = threading.Lock()
+
+# (db_path, table, where, params) -> (file signature, count) of filtered counts.
+# Every distinct filter adds one, so only the most recent ones are kept.
+_filtered_count_cache = OrderedDict()
+FILTERED_COUNT_CACHE_SIZE = 1024
+
+# db_path -> (file signature, schema dict), see DBManager.get_schema
+_schema_cache = {}
+
+
+def forget_snapshot(db_path):
+    """Drop the cached counts and schema of a file that is about to be deleted."""
+    with _row_count_lock:
+        for cache in (_row_count_cache, _filtered_count_cache):
+            for key in [k for k in cache if k[0] == db_path]:
+                del cache[key]
+        _schema_cache.pop(db_path, None)
+
+
+def quote_ident(name):
+    """Quote an SQLite identifier (table/column name)."""
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _encode_value(v):
+    return {'$b': v.hex()} if isinstance(v, bytes) else v
+
+
+def wire_key(key):
+    """A row key as a JSON-ready list (BLOB key values as {'$b': hex})."""
+    return [_encode_value(v) for v in key]
+
+
+def encode_cursor(data):
+    """Opaque, URL-safe page cursor for the client."""
+    if 'k' in data:
+        data = {**data, 'k': wire_key(data['k'])}
+    if 's' in data:
+        data = {**data, 's': _encode_value(data['s'])}
+    raw = json.dumps(data, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """Inverse of encode_cursor. Returns None for an empty or malformed cursor."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        data = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    def decode_value(v):
+        return bytes.fromhex(v['$b']) if isinstance(v, dict) else v
+    if 'k' in data:
+        data['k'] = [decode_value(v) for v in data['k']]
+    if 's' in data:
+        data['s'] = decode_value(data['s'])
+    return data
+
+
+def decode_row_key(text):
+    """Row key from a URL: a rowid, or encode_cursor({'k': key}) for tables
+    keyed on their primary key (WITHOUT ROWID). None if malformed."""
+    try:
+        return [int(text)]
+    except ValueError:
+        pass
+    data = decode_cursor(text)
+    return data['k'] if isinstance(data, dict) and isinstance(data.get('k'), list) else None
+
+
+# Filters accepted by DBManager.get_table_page: op -> SQL after the column
+FILTER_OPS = {
+    '=': '= ?',
+    '!=': '!= ?',
+    '<': '< ?',
+    '<=': '<= ?',
+    '>': '> ?',
+    '>=': '>= ?',
+    'contains': "LIKE ? ESCAPE '\\'",
+    'is_null': 'IS NULL',
+    'not_null': 'IS NOT NULL',
+}
+
+
+def indexable_columns(sort=None, filters=None):
+    """Columns of a sort/filter that an index on that column would speed up
+    (a 'contains' filter is a LIKE '%...%' and can't use one)."""
+    columns = [sort] if sort else []
+    for f in filters or []:
+        if f.get('op') != 'contains' and f.get('column') not in columns:
+            columns.append(f.get('column'))
+    return [c for c in columns if c and c != 'rowid']
+
+
+def sqlite_uri(path, **params):
+    """file: URI for sqlite3.connect(..., uri=True), e.g. sqlite_uri(p, mode='ro')."""
+    uri = 'file:' + pathname2url(os.path.abspath(path))
+    if params:
+        uri += '?' + '&'.join(f"{k}={v}" for k, v in params.items())
+    return uri
+
+
+def connect_wal_view(path, **kwargs):
+    """Read-only connection to a WAL commit view (see wal_reader.WalTimeline).
+
+    Views are hardlinks of one store object, each with its own -wal, but
+    SQLite shares the wal-index (-shm) between every connection of the
+    process to the same inode. So views are opened without shared memory:
+    the no-locking VFS plus exclusive locking mode keep a private wal-index
+    on the heap of each connection. Views never change, locks are not needed.
+    """
+    vfs = 'win32-none' if os.name == 'nt' else 'unix-none'
+    conn = sqlite3.connect(sqlite_uri(path, mode='ro', vfs=vfs), uri=True, **kwargs)
+    # Must come before the first read of the file
+    conn.execute("PRAGMA locking_mode = EXCLUSIVE")
+    return conn
+
+
+class ConnectionPool:
+    """Reusable read-only connections, keyed by snapshot file.
+
+    Snapshots are prepared once (see DBManager.prepare_snapshot) when they are
+    stored, so browsing them afterwards needs no checkpoint and no writes.
+    They never change afterwards either, so they are opened immutable: SQLite
+    then takes no file locks and never looks for a journal or WAL. Writable
+    forks are opened with immutable=False, WAL commit views with wal_view=True.
+    Connections are handed out to one thread at a time (check_same_thread is off
+    for that reason), idle ones are closed after `idle_timeout` seconds.
+    """
+
+    def __init__(self, max_idle_per_db=4, idle_timeout=120, mmap_size=256 * 1024 * 1024, cache_size_kib=16384):
+        self.max_idle_per_db = max_idle_per_db
+        self.idle_timeout = idle_timeout
+        self.mmap_size = mmap_size
+        self.cache_size_kib = cache_size_kib
+        self._idle = {}          # path -> [(conn, last_used)]
+        self._generation = {}    # path -> bumped by close_path()
+        self._checked_out = {}   # id(conn) -> (path, generation)
+        self._lock = threading.Lock()
+
+    def _open(self, path, immutable, wal_view):
+        if wal_view:
+            conn = connect_wal_view(path, check_same_thread=False)
+        else:
+            params = {'mode': 'ro', 'immutable': 1} if immutable else {'mode': 'ro'}
+            conn = sqlite3.connect(sqlite_uri(path, **params), uri=True, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute(f"PRAGMA cache_size = -{int(self.cache_size_kib)}")
+        return conn
+
+    def acquire(self, path, immutable=True, wal_view=False):
+        with self._lock:
+            self._evict_idle()
+            idle = self._idle.get(path)
+            conn = idle.pop()[0] if idle else None
+            generation = self._generation.get(path, 0)
+        if conn is None:
+            conn = self._open(path, immutable, wal_view)
+        with self._lock:
+            self._checked_out[id(conn)] = (path, generation)
+        return conn
+
+    def release(self, path, conn):
+        # Never hand out a connection with a previous query's progress handler
+        conn.set_progress_handler(None, 0)
+        with self._lock:
+            _, generation = self._checked_out.pop(id(conn), (path, None))
+            keep = (
+                generation == self._generation.get(path, 0)
+                and len(self._idle.get(path, [])) < self.max_idle_per_db
+                and not conn.in_transaction
+            )
+            if keep:
+                self._idle.setdefault(path, []).append((conn, time.time()))
+        if not keep:
+            conn.close()
+
+    def close_path(self, path):
+        """Close every pooled handle on a snapshot (before it is deleted).
+        Handles in use are closed when they are released."""
+        with self._lock:
+            self._generation[path] = self._generation.get(path, 0) + 1
+            idle = self._idle.pop(path, [])
+        for conn, _ in idle:
+            conn.close()
+
+    def close_all(self):
+        with self._lock:
+            idle = [conn for conns in self._idle.values() for conn, _ in conns]
+            self._idle.clear()
+        for conn in idle:
+            conn.close()
+
+    def _evict_idle(self):
+        # Caller holds self._lock
+        cutoff = time.time() - self.idle_timeout
+        for path in list(self._idle):
+            fresh = []
+            for conn, last_used in self._idle[path]:
+                if last_used < cutoff:
+                    conn.close()
+                else:
+                    fresh.append((conn, last_used))
+            if fresh:
+                self._idle[path] = fresh
+            else:
+                del self._idle[path]
+
+
+class QueryControl:
+    """Time budget and cancellation for one ad-hoc query.
+
+    Installed as the connection's progress handler, which SQLite calls every
+    PROGRESS_STEPS virtual machine instructions; returning non-zero aborts the
+    running statement with an 'interrupted' error. Only time spent inside
+    SQLite counts against the budget, not the pauses between cursor fetches.
+    """
+
+    PROGRESS_STEPS = 1000
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        self.status = 'running'
+        self.rows = 0
+        self.created = time.time()
+        self._busy_time = 0.0
+        self._started = None
+        self._cancelled = threading.Event()
+        self._conn = None
+        # Guards _conn: never interrupt a connection after it went back to the pool
+        self._lock = threading.Lock()
+
+    def begin(self, conn):
+        with self._lock:
+            self._conn = conn
+            self._started = time.perf_counter()
+        conn.set_progress_handler(self._check, self.PROGRESS_STEPS)
+
+    def end(self):
+        with self._lock:
+            if self._started is not None:
+                self._busy_time += time.perf_counter() - self._started
+                self._started = None
+            if self._conn is not None:
+                self._conn.set_progress_handler(None, 0)
+                self._conn = None
+
+    def cancel(self):
+        self._cancelled.set()
+        if self.status == 'running':
+            self.status = 'cancelled'
+        with self._lock:
+            if self._conn is not None:
+                # Also stops work between progress callbacks (e.g. a big sort)
+                self._conn.interrupt()
+
+    def _elapsed(self):
+        running = time.perf_counter() - self._started if self._started is not None else 0.0
+        return self._busy_time + running
+
+    def _check(self):
+        if self._cancelled.is_set():
+            self.status = 'cancelled'
+            return 1
+        if self.timeout and self._elapsed() > self.timeout:
+            self.status = 'timeout'
+            return 1
+        return 0
+
+    def interrupted_error(self, e):
+        """Turn SQLite's 'interrupted' error into a message, or None if it was another error."""
+        if 'interrupt' not in str(e):
+            return None
+        if self._cancelled.is_set():
+            self.status = 'cancelled'
+            return 'Query cancelled'
+        self.status = 'timeout'
+        return f'Query timed out after {self.timeout}s'
+
+    def stats(self):
+        return {
+            'status': self.status,
+            'elapsed_ms': round(self._elapsed() * 1000, 1),
+            'rows': self.rows,
+        }
+
+
+class QueryCursor:
+    """An open statement whose rows are read in chunks (a server-side cursor).
+
+    Rows are plain lists in `columns` order, BLOBs replaced by stubs
+    (blobs.blob_stub). The connection is held until the
+    rows run out, max_rows is reached or close() is called.
+
+    on_complete(columns, rows, truncated) is called once all rows were read
+    without error, if they fit in collect_limit bytes (used to cache results).
+    """
+
+    def __init__(self, conn, cursor, release, max_rows=None, control=None, on_complete=None, collect_limit=0):
+        self.columns = [d[0] for d in cursor.description]
+        self.max_rows = max_rows
+        self.control = control
+        self.error = None
+        self.row_count = 0
+        self.truncated = False
+        self.closed = False
+        self.lock = threading.Lock()
+        self._conn = conn
+        self._cursor = cursor
+        self._release = release
+        # One row of lookahead, so we know whether another fetch is worth it
+        self._pending = []
+        self._on_complete = on_complete
+        self._collected = [] if on_complete else None
+        self._collected_size = 0
+        self._collect_limit = collect_limit
+
+    def fetch(self, n):
+        if n < 1:
+            raise ValueError('fetch() needs a positive row count')
+        with self.lock:
+            if self.closed:
+                return []
+            if self.max_rows is not None:
+                n = max(0, min(n, self.max_rows - self.row_count))
+            if self.control:
+                self.control.begin(self._conn)
+            try:
+                rows = self._pending + self._cursor.fetchmany(n + 1 - len(self._pending))
+            except sqlite3.Error as e:
+                # Cancelled, timed out or failed half way: keep what was sent so far
+                self.error = self.control and self.control.interrupted_error(e)
+                if not self.error:
+                    self.error = str(e)
+                    if self.control:
+                        self.control.status = 'error'
+                self._close()
+                return []
+            finally:
+                if self.control:
+                    self.control.end()
+            self._pending = rows[n:]
+            rows = [wire_row(row) for row in rows[:n]]
+            self.row_count += len(rows)
+            if self.control:
+                self.control.rows = self.row_count
+            self._collect(rows)
+
+            if not self._pending:
+                self._close()
+                self._complete()
+            elif self.max_rows is not None and self.row_count >= self.max_rows:
+                self.truncated = True
+                self._close()
+                self._complete()
+            return rows
+
+    def _collect(self, rows):
+        if self._collected is None:
+            return
+        self._collected_size += estimate_size(rows)
+        if self._collected_size > self._collect_limit:
+            # Too big to cache, stop keeping a copy
+            self._collected = None
+        else:
+            self._collected.extend(rows)
+
+    def _complete(self):
+        if self._collected is not None:
+            self._on_complete(self.columns, self._collected, self.truncated)
+            self._collected = None
+
+    def close(self):
+        with self.lock:
+            self._close()
+
+    def _close(self):
+        if not self.closed:
+            self.closed = True
+            self._pending = []
+            if self.control and self.control.status == 'running':
+                self.control.status = 'done'
+            try:
+                self._cursor.close()
+            finally:
+                self._release(self._conn)
+
+
+class CachedQueryCursor:
+    """A QueryCursor over a result that came from the ResultCache."""
+
+    def __init__(self, columns, rows, truncated, control=None):
+        self.columns = columns
+        self.control = control
+        self.error = None
+        self.row_count = 0
+        self.truncated = False
+        self.closed = False
+        self.lock = threading.Lock()
+        self._rows = rows
+        self._truncated = truncated
+
+    def fetch(self, n):
+        if n < 1:
+            raise ValueError('fetch() needs a positive row count')
+        with self.lock:
+            rows = self._rows[self.row_count:self.row_count + n]
+            self.row_count += len(rows)
+            if self.control:
+                self.control.rows = self.row_count
+            if self.row_count >= len(self._rows):
+                self.truncated = self._truncated
+                self.close()
+            return [list(row) for row in rows]
+
+    def close(self):
+        self.closed = True
+        if self.control and self.control.status == 'running':
+            self.control.status = 'done'
+
 
 class DBManager:
-    def __init__(self, db_path):
+    # Returned when a statement tries to write to a (read-only) snapshot
+    READONLY_ERROR = 'Snapshots are read-only. Create a writable copy to modify data.'
+
+    def __init__(self, db_path, pool=None, cache=None, writable=False, wal_view=False):
         self.db_path = db_path
+        # Optional ConnectionPool; without one every call opens its own connection
+        self.pool = pool
+        # Optional ResultCache for read-only queries and table pages
+        self.cache = cache
+        # Only writable copies (SnapshotStore.fork) accept writes; snapshots are immutable
+        self.writable = writable
+        # WAL commit views (see wal_reader.WalTimeline) are read through their
+        # -wal, so they can't be opened immutable
+        self.wal_view = wal_view
+
+    @staticmethod
+    def prepare_snapshot(db_path):
+        """Merge a freshly pulled WAL into the main file, once.
+
+        Afterwards the snapshot is a plain rollback-journal database that
+        read-only connections can open without touching the file.
+        """
+        with metrics.span('snapshot_prepare') as span:
+            conn = sqlite3.connect(db_path)
+            try:
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+                conn.execute("PRAGMA journal_mode=DELETE;")
+            except sqlite3.Error as e:
+                # Not a database / corrupt pull: leave it, errors surface on read
+                print(f"Snapshot preparation warning for {db_path}: {e}")
+                span.fail(e)
+            finally:
+                conn.close()
+
+    def _acquire(self):
+        if self.pool is None:
+            return self.get_connection()
+        try:
+            return self.pool.acquire(self.db_path, immutable=not self.writable, wal_view=self.wal_view)
+        except sqlite3.Error as e:
+            print(f"Error connecting to database: {e}")
+            return None
+
+    def _release(self, conn):
+        if self.pool is None:
+            conn.close()
+        else:
+            self.pool.release(self.db_path, conn)
+
+    @contextmanager
+    def connection(self):
+        """A connection (pooled if there is a pool) for the length of a with
+        block. Raises sqlite3.OperationalError if the database can't be opened."""
+        conn = self._acquire()
+        if conn is None:
+            raise sqlite3.OperationalError(f"Cannot open database {os.path.basename(self.db_path)}")
+        try:
+            yield conn
+        finally:
+            self._release(conn)
 
     def get_connection(self):
+        """A private connection: read-only and immutable on snapshots (the WAL
+        was merged by prepare_snapshot), read-write on writable copies."""
         try:
-            conn = sqlite3.connect(self.db_path)
+            if self.writable:
+                conn = sqlite3.connect(self.db_path)
+            elif self.wal_view:
+                conn = connect_wal_view(self.db_path)
+            else:
+                conn = sqlite3.connect(sqlite_uri(self.db_path, mode='ro', immutable=1), uri=True)
             conn.row_factory = sqlite3.Row
-            
-            # Force WAL Checkpoint to ensure we see the latest data from the pulled WAL file
-            # This is crucial because we just pulled raw files and SQLite might not auto-checkpoint immediately
-            # or correctly in this read-only-like scenario.
-            try:
-                # PASSIVE: Checkpoint as much as possible without blocking
-                # FULL: Checkpoint everything (might block if locks exist, but here we are single user)
-                conn.execute("PRAGMA wal_checkpoint(FULL);")
-            except Exception as e:
-                # It might fail if database is locked or not in WAL mode, which is fine
-                # print(f"Checkpoint warning: {e}")
-                pass
-                
             return conn
         except sqlite3.Error as e:
             print(f"Error connecting to database: {e}")
             return None
 
+    @metrics.timed('db_call')
     def get_tables(self):
         """Get a list of all tables in the database."""
-        conn = self.get_connection()
+        conn = self._acquire()
         if not conn:
             return []
         
@@ -40,11 +531,12 @@ class DBManager:
             tables = [row['name'] for row in cursor.fetchall()]
             return tables
         finally:
-            conn.close()
+            self._release(conn)
 
+    @metrics.timed('db_call')
     def get_table_info(self, table_name):
         """Get column info for a table."""
-        conn = self.get_connection()
+        conn = self._acquire()
         if not conn:
             return []
         
@@ -54,11 +546,526 @@ class DBManager:
             columns = [dict(row) for row in cursor.fetchall()]
             return columns
         finally:
-            conn.close()
+            self._release(conn)
+
+    @metrics.timed('db_call')
+    def get_schema(self):
+        """Tables, views, columns, indexes and row counts in one pass.
+
+        Reads sqlite_master joined with the pragma table-valued functions instead
+        of one PRAGMA per table, and is memoized per snapshot file.
+        """
+        signature = self._file_signature()
+        with _row_count_lock:
+            cached = _schema_cache.get(self.db_path)
+        if cached and cached[0] == signature:
+            return cached[1]
+
+        conn = self._acquire()
+        if not conn:
+            return {'tables': []}
+
+        try:
+            cursor = conn.cursor()
+            entries = {}
+            cursor.execute(
+                "SELECT m.name AS tbl, m.type AS kind, p.name, p.type, p.\"notnull\", p.dflt_value, p.pk "
+                "FROM sqlite_master m JOIN pragma_table_info(m.name) p "
+                "WHERE m.type IN ('table', 'view') ORDER BY m.name, p.cid"
+            )
+            for row in cursor.fetchall():
+                entry = entries.setdefault(row['tbl'], {
+                    'name': row['tbl'], 'type': row['kind'], 'columns': [], 'indexes': [],
+                    'row_count': None, 'row_count_estimated': False,
+                })
+                entry['columns'].append({
+                    'name': row['name'], 'type': row['type'], 'notnull': bool(row['notnull']),
+                    'default': row['dflt_value'], 'pk': row['pk'],
+                })
+
+            cursor.execute(
+                "SELECT m.name AS tbl, il.name AS idx, il.\"unique\", il.origin, ii.name AS col "
+                "FROM sqlite_master m JOIN pragma_index_list(m.name) il JOIN pragma_index_info(il.name) ii "
+                "WHERE m.type = 'table' ORDER BY m.name, il.name, ii.seqno"
+            )
+            indexes = {}
+            for row in cursor.fetchall():
+                index = indexes.get((row['tbl'], row['idx']))
+                if index is None:
+                    index = {'name': row['idx'], 'unique': bool(row['unique']), 'origin': row['origin'], 'columns': []}
+                    indexes[(row['tbl'], row['idx'])] = index
+                    if row['tbl'] in entries:
+                        entries[row['tbl']]['indexes'].append(index)
+                index['columns'].append(row['col'])
+
+            for entry in entries.values():
+                if entry['type'] == 'table':
+                    count, estimated = self.get_row_count(entry['name'], estimate=True, conn=conn)
+                    entry['row_count'] = count
+                    entry['row_count_estimated'] = estimated
+
+            schema = {'tables': list(entries.values())}
+            with _row_count_lock:
+                _schema_cache[self.db_path] = (signature, schema)
+            return schema
+        except sqlite3.Error as e:
+            print(f"Error reading schema: {e}")
+            return {'tables': [], 'error': str(e)}
+        finally:
+            self._release(conn)
+
+    def _cache_key(self, *parts):
+        """ResultCache key for this snapshot as it is now, or None without a cache."""
+        if self.cache is None:
+            return None
+        return (self.db_path, self._file_signature()) + parts
+
+    def _query_cache_key(self, kind, query, max_rows):
+        # kind: 'result' (execute_query) or 'rows' (open_query) result format
+        if self.cache is None or not is_cacheable(query):
+            return None
+        return self._cache_key(kind, normalize_sql(query), max_rows)
 
+    def _file_signature(self):
+        """Changes whenever the snapshot (or its WAL) is modified."""
+        signature = []
+        for path in (self.db_path, f"{self.db_path}-wal"):
+            try:
+                st = os.stat(path)
+                signature.append((st.st_size, st.st_mtime_ns))
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+
+    @metrics.timed('db_call')
+    def get_row_count(self, table_name, estimate=False, conn=None, where=None, params=()):
+        """Row count of a table, cached per snapshot file.
+
+        With estimate=True, the count recorded by ANALYZE in sqlite_stat1 for the
+        table or one of its non-partial indexes is used when available (O(1)). `where`/`params` count only matching rows (see
+        _filter_clause); such counts are never estimated. Returns (count, is_estimate).
+        """
+        own_conn = conn is None
+        if own_conn:
+            conn = self._acquire()
+            if not conn:
+                return 0, False
+
+        try:
+            cursor = conn.cursor()
+            if estimate and not where:
+                try:
+                    # The first number of a stat row counts the rows of its index,
+                    # which for a partial index is less than the table's
+                    cursor.execute(
+                        "SELECT s.stat FROM sqlite_stat1 s LEFT JOIN pragma_index_list(s.tbl) il ON il.name = s.idx "
+                        "WHERE s.tbl = ? AND (s.idx IS NULL OR il.partial = 0) ORDER BY s.idx IS NULL DESC LIMIT 1",
+                        (table_name,)
+                    )
+                    row = cursor.fetchone()
+                    if row and row[0]:
+                        return int(str(row[0]).split()[0]), True
+                except (sqlite3.Error, ValueError):
+                    # No sqlite_stat1 (never analyzed)
+                    pass
+
+            key = (self.db_path, table_name, where, tuple(params)) if where else (self.db_path, table_name)
+            cache = _filtered_count_cache if where else _row_count_cache
+            signature = self._file_signature()
+            with _row_count_lock:
+                cached = cache.get(key)
+                if cached and where:
+                    cache.move_to_end(key)
+            if cached and cached[0] == signature:
+                return cached[1], False
+
+            with metrics.span('db_count'):
+                sql = f"SELECT COUNT(*) FROM {quote_ident(table_name)}"
+                cursor.execute(f"{sql} WHERE {where}" if where else sql, list(params))
+                count = cursor.fetchone()[0]
+            with _row_count_lock:
+                cache[key] = (signature, count)
+                if where:
+                    cache.move_to_end(key)
+                    while len(cache) > FILTERED_COUNT_CACHE_SIZE:
+                        cache.popitem(last=False)
+            return count, False
+        finally:
+            if own_conn:
+                self._release(conn)
+
+    def page_key(self, cursor, table_name):
+        """Columns to seek on: ['rowid'], the primary key of a WITHOUT ROWID
+        table, or None (views) in which case we fall back to OFFSET."""
+        cursor.execute("SELECT type FROM sqlite_master WHERE name = ?", (table_name,))
+        row = cursor.fetchone()
+        if not row or row[0] != 'table':
+            # Views accept "rowid" but it is always NULL
+            return None
+        try:
+            cursor.execute(f"SELECT rowid FROM {quote_ident(table_name)} LIMIT 0")
+            return ['rowid']
+        except sqlite3.Error:
+            pass
+        cursor.execute(f"PRAGMA table_info({quote_ident(table_name)})")
+        pk = sorted((row['pk'], row['name']) for row in cursor.fetchall() if row['pk'])
+        return [name for _, name in pk] or None
+
+    def _filter_clause(self, cursor, table_name, filters):
+        """WHERE clause and parameters for [{'column', 'op', 'value'}, ...].
+
+        Column names are checked against the table and ops against FILTER_OPS,
+        so nothing from the client reaches the SQL text unquoted. Raises
+        ValueError for an unknown column or op.
+        """
+        if not filters:
+            return None, []
+        cursor.execute(f"PRAGMA table_info({quote_ident(table_name)})")
+        columns = {row['name'] for row in cursor.fetchall()}
+        conditions, params = [], []
+        for f in filters:
+            column, op = f.get('column'), f.get('op', '=')
+            if column not in columns and column != 'rowid':
+                raise ValueError(f"No such column: {column}")
+            if op not in FILTER_OPS:
+                raise ValueError(f"Unknown filter: {op}")
+            conditions.append(f"{quote_ident(column) if column != 'rowid' else 'rowid'} {FILTER_OPS[op]}")
+            if op == 'contains':
+                escaped = str(f.get('value', '')).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+                params.append(f"%{escaped}%")
+            elif '?' in FILTER_OPS[op]:
+                params.append(f.get('value'))
+        return ' AND '.join(conditions), params
+
+    def _sorted_rows(self, cursor, table_name, key_columns, sort, descending, where, where_params, position, n):
+        """Up to n rows of a table ordered by (sort, key columns), after `position`.
+
+        The seek is on the row value (sort, key...), which an index on the
+        sort column serves directly (its entries end with the rowid / primary
+        key). NULLs sort first ascending and last descending, and compare as
+        unknown, so they are read as a separate segment keyed on the key alone.
+        Each row is (sort value, key..., columns...).
+        """
+        table = quote_ident(table_name)
+        sort_expr = 'rowid' if sort == 'rowid' else quote_ident(sort)
+        key_exprs = ['rowid' if c == 'rowid' else quote_ident(c) for c in key_columns]
+        key_list = ', '.join(key_exprs)
+        key_select = ', '.join(f"{e} AS __key{i}" for i, e in enumerate(key_exprs))
+        placeholders = ', '.join('?' for _ in key_columns)
+        direction, op = ('DESC', '<') if descending else ('ASC', '>')
+        order = ', '.join(f"{e} {direction}" for e in [sort_expr] + key_exprs)
+        segments = ['value', 'null'] if descending else ['null', 'value']
+
+        bound = position if position.get('k') else None
+        if bound is not None:
+            segments = segments[segments.index('null' if bound.get('s') is None else 'value'):]
+
+        rows = []
+        for segment in segments:
+            conditions = [where] if where else []
+            params = list(where_params)
+            conditions.append(f"{sort_expr} IS NULL" if segment == 'null' else f"{sort_expr} IS NOT NULL")
+            if bound is not None:
+                if segment == 'null':
+                    conditions.append(f"({key_list}) {op} ({placeholders})")
+                    params.extend(bound['k'])
+                else:
+                    conditions.append(f"({sort_expr}, {key_list}) {op} (?, {placeholders})")
+                    params.extend([bound['s']] + list(bound['k']))
+                bound = None
+            params.append(n - len(rows))
+            cursor.execute(
+                f"SELECT {sort_expr} AS __sort, {key_select}, * FROM {table} "
+                f"WHERE {' AND '.join(conditions)} ORDER BY {order} LIMIT ?",
+                params,
+            )
+            rows.extend(cursor.fetchall())
+            if len(rows) >= n:
+                break
+        return rows
+
+    @metrics.timed('db_call')
+    def get_table_page(self, table_name, limit=100, cursor_token=None, estimate=False,
+                       sort=None, descending=False, filters=None):
+        """Get one page of a table by seeking on rowid / primary key.
+
+        Unlike LIMIT/OFFSET, the cost of a page does not depend on how deep it
+        is. cursor_token is the 'next_cursor' returned for the previous page
+        (None for the first page); it is only valid with the same sort/filters.
+
+        sort orders by a column (then by the row key, so the order is total),
+        filters is a list of {'column', 'op', 'value'} (ops: FILTER_OPS), all
+        of which must match. Both run in SQLite; an index on the column makes
+        a sorted page a seek instead of a scan. Raises ValueError for an
+        unknown sort/filter column.
+        """
+        cache_key = self._cache_key('page', table_name, limit, cursor_token or '', estimate,
+                                    sort, descending, json.dumps(filters, sort_keys=True) if filters else None)
+        if cache_key:
+            cached = self.cache.get(cache_key)
+            if cached:
+                return dict(cached)
+
+        conn = self._acquire()
+        if not conn:
+            return {'columns': [], 'rows': [], 'total': 0, 'next_cursor': None}
+
+        try:
+            cursor = conn.cursor()
+            table = quote_ident(table_name)
+            key_columns = self.page_key(cursor, table_name)
+            position = decode_cursor(cursor_token) or {}
+            where, where_params = self._filter_clause(cursor, table_name, filters)
+            if sort and sort != 'rowid':
+                cursor.execute(f"PRAGMA table_info({table})")
+                if sort not in {row['name'] for row in cursor.fetchall()}:
+                    raise ValueError(f"No such column: {sort}")
+
+            if key_columns and sort:
+                fetched = self._sorted_rows(cursor, table_name, key_columns, sort, descending,
+                                            where, where_params, position, limit + 1)
+                skip = 1 + len(key_columns)
+                columns = [d[0] for d in cursor.description[skip:]]
+            elif key_columns:
+                key_select = ', '.join(
+                    f"{'rowid' if c == 'rowid' else quote_ident(c)} AS __key{i}"
+                    for i, c in enumerate(key_columns)
+                )
+                key_list = ', '.join('rowid' if c == 'rowid' else quote_ident(c) for c in key_columns)
+                sql = f"SELECT {key_select}, * FROM {table}"
+                conditions = [where] if where else []
+                params = list(where_params)
+                if position.get('k'):
+                    # Row-value comparison also covers composite primary keys
+                    placeholders = ', '.join('?' for _ in key_columns)
+                    conditions.append(f"({key_list}) > ({placeholders})")
+                    params.extend(position['k'])
+                if conditions:
+                    sql += f" WHERE {' AND '.join(conditions)}"
+                sql += f" ORDER BY {key_list} LIMIT ?"
+                params.append(limit + 1)
+                cursor.execute(sql, params)
+                skip = len(key_columns)
+                columns = [d[0] for d in cursor.description[skip:]]
+                fetched = cursor.fetchall()
+            else:
+                offset = position.get('o', 0)
+                sql = f"SELECT * FROM {table}"
+                if where:
+                    sql += f" WHERE {where}"
+                if sort:
+                    sql += f" ORDER BY {quote_ident(sort)} {'DESC' if descending else 'ASC'}"
+                cursor.execute(f"{sql} LIMIT ? OFFSET ?", list(where_params) + [limit + 1, offset])
+                skip = 0
+                columns = [d[0] for d in cursor.description]
+                fetched = cursor.fetchall()
+
+            has_more = len(fetched) > limit
+            fetched = fetched[:limit]
+            # Column names once, then rows as arrays (BLOBs as stubs, see /api/blob)
+            rows = [wire_row(tuple(row)[skip:]) for row in fetched]
+            # Row identities, so Monitor can match rows with /api/diff results
+            first_key = 1 if sort and key_columns else 0
+            keys = [wire_key(tuple(row)[first_key:skip]) for row in fetched] if key_columns else None
+
+            next_cursor = None
+            if has_more:
+                if key_columns and sort:
+                    last = tuple(fetched[-1])
+                    next_cursor = encode_cursor({'s': last[0], 'k': list(last[1:skip])})
+                elif key_columns:
+                    next_cursor = encode_cursor({'k': list(tuple(fetched[-1])[:skip])})
+                else:
+                    next_cursor = encode_cursor({'o': position.get('o', 0) + limit})
+
+            total, estimated = self.get_row_count(table_name, estimate=estimate, conn=conn,
+                                                  where=where, params=where_params)
+            page = {
+                'columns': columns,
+                'rows': rows,
+                'keys': keys,
+                'key_columns': key_columns,
+                'total': total,
+                'estimated': estimated,
+                'next_cursor': next_cursor,
+            }
+            if cache_key:
+                self.cache.put(cache_key, page, estimate_size(rows) + estimate_size(keys or []))
+            return dict(page)
+        except sqlite3.Error as e:
+            print(f"Error reading table {table_name}: {e}")
+            return {'columns': [], 'rows': [], 'total': 0, 'next_cursor': None, 'error': str(e)}
+        finally:
+            self._release(conn)
+
+    @metrics.timed('db_call')
+    def diff_table(self, old_path, table_name, limit=1000, after=None, window=None):
+        """Rows of table_name inserted, updated and deleted since the snapshot at old_path.
+
+        Both snapshots are compared in SQL (the old one is ATTACHed read-only),
+        matching rows on the same key as keyset paging: rowid, or the primary
+        key of a WITHOUT ROWID table. Each list holds at most `limit` entries;
+        'truncated' tells the caller to reload instead of applying the delta.
+
+        With `window`, only the keys of one keyset page are compared: those
+        after the key `after` (None = from the start), up to the `window`-th
+        key of either snapshot. Each bound is an index seek, so a page of a
+        big table costs as much as the page itself, not a scan of both tables.
+        """
+        conn = self._acquire()
+        if not conn:
+            return {'error': 'Cannot connect to database'}
+
+        attached = False
+        try:
+            cursor = conn.cursor()
+            key_columns = self.page_key(cursor, table_name)
+            if not key_columns:
+                return {'error': f'{table_name} has no rowid or primary key to compare on'}
+
+            # Pooled and read-only connections understand URIs; a plain
+            # connection would create a file by that name
+            old_name = sqlite_uri(old_path, mode='ro') if self.pool or not self.writable else old_path
+            cursor.execute("ATTACH DATABASE ? AS old", (old_name,))
+            attached = True
+
+            table = quote_ident(table_name)
+            cursor.execute("SELECT name FROM pragma_table_info(?, 'main')", (table_name,))
+            new_columns = [row[0] for row in cursor.fetchall()]
+            cursor.execute("SELECT name FROM pragma_table_info(?, 'old')", (table_name,))
+            old_columns = [row[0] for row in cursor.fetchall()]
+            common = [c for c in new_columns if c in old_columns]
+
+            result = {
+                'key_columns': key_columns,
+                'columns': new_columns,
+                'schema_changed': new_columns != old_columns,
+                'inserted': [],
+                'updated': [],
+                'deleted': [],
+                'truncated': False,
+            }
+
+            def key_expr(alias):
+                return ', '.join(
+                    f"{alias}.{'rowid' if c == 'rowid' else quote_ident(c)}" for c in key_columns
+                )
+
+            skip = len(key_columns)
+            new_key, old_key = key_expr('n'), key_expr('o')
+            match = ' AND '.join(
+                f"o.{k} = n.{k}" for k in ('rowid' if c == 'rowid' else quote_ident(c) for c in key_columns)
+            )
+
+            bounds = self._diff_window(cursor, table, key_expr, old_columns, after, window) if window else ([], [])
+
+            def within(alias):
+                """(' AND ' + key range condition, params) for rows of alias."""
+                conditions, params = [], []
+                for op, key in zip(('>', '<='), bounds):
+                    if key:
+                        conditions.append(f"({key_expr(alias)}) {op} ({', '.join('?' for _ in key)})")
+                        params.extend(key)
+                return ''.join(f" AND {c}" for c in conditions), params
+
+            new_range, new_params = within('n')
+            if not old_columns:
+                # Table did not exist before: everything is new
+                sql = f"SELECT {new_key}, n.* FROM main.{table} n WHERE 1{new_range} ORDER BY {new_key} LIMIT ?"
+            else:
+                sql = (
+                    f"SELECT {new_key}, n.* FROM main.{table} n "
+                    f"WHERE NOT EXISTS (SELECT 1 FROM old.{table} o WHERE {match}){new_range} "
+                    f"ORDER BY {new_key} LIMIT ?"
+                )
+            cursor.execute(sql, new_params + [limit + 1])
+            for row in cursor.fetchall():
+                row = tuple(row)
+                result['inserted'].append({'key': wire_key(row[:skip]), 'row': wire_row(row[skip:])})
+
+            if old_columns:
+                old_range, old_params = within('o')
+                cursor.execute(
+                    f"SELECT {old_key} FROM old.{table} o "
+                    f"WHERE NOT EXISTS (SELECT 1 FROM main.{table} n WHERE {match}){old_range} "
+                    f"ORDER BY {old_key} LIMIT ?",
+                    old_params + [limit + 1]
+                )
+                result['deleted'] = [wire_key(row) for row in cursor.fetchall()]
+
+            if common:
+                n_values = ', '.join(f"n.{quote_ident(c)}" for c in common)
+                o_values = ', '.join(f"o.{quote_ident(c)}" for c in common)
+                # IS NOT treats NULL = NULL as unchanged
+                cursor.execute(
+                    f"SELECT {new_key}, {o_values}, n.* FROM main.{table} n JOIN old.{table} o ON {match} "
+                    f"WHERE ({n_values}) IS NOT ({o_values}){new_range} ORDER BY {new_key} LIMIT ?",
+                    new_params + [limit + 1]
+                )
+                for row in cursor.fetchall():
+                    row = tuple(row)
+                    before = dict(zip(common, row[skip:skip + len(common)]))
+                    after = dict(zip(new_columns, row[skip + len(common):]))
+                    result['updated'].append({
+                        'key': wire_key(row[:skip]),
+                        'row': wire_row(row[skip + len(common):]),
+                        'changed': [c for c in common if before[c] != after[c]],
+                    })
+
+            for name in ('inserted', 'updated', 'deleted'):
+                if len(result[name]) > limit:
+                    result[name] = result[name][:limit]
+                    result['truncated'] = True
+            return result
+        except sqlite3.Error as e:
+            print(f"Error comparing {table_name}: {e}")
+            return {'error': str(e)}
+        finally:
+            if attached:
+                try:
+                    conn.execute("DETACH DATABASE old")
+                except sqlite3.Error:
+                    # Never pool a connection that still holds the old snapshot open
+                    conn.close()
+                    conn = None
+            if conn is not None:
+                self._release(conn)
+
+    @staticmethod
+    def _diff_window(cursor, table, key_expr, old_columns, after, window):
+        """(lower, upper) keys of a diff window: keys > lower and <= upper; an
+        empty upper means the page is not full in either snapshot (no bound)."""
+        lower = list(after or [])
+        uppers = []
+        for schema in ('main', 'old') if old_columns else ('main',):
+            where = f"WHERE ({key_expr('x')}) > ({', '.join('?' for _ in lower)}) " if lower else ''
+            cursor.execute(
+                f"SELECT {key_expr('x')} FROM {schema}.{table} x {where}ORDER BY {key_expr('x')} LIMIT 1 OFFSET ?",
+                lower + [window - 1]
+            )
+            row = cursor.fetchone()
+            if row is None:
+                return lower, []
+            uppers.append(list(row))
+        upper = uppers[0]
+        if len(uppers) == 2:
+            # Compare in SQL: keys may mix types that Python can't order
+            placeholders = ', '.join('?' for _ in upper)
+            cursor.execute(f"SELECT ({placeholders}) < ({placeholders})", upper + uppers[1])
+            if cursor.fetchone()[0]:
+                upper = uppers[1]
+        return lower, upper
+
+    @metrics.timed('db_call')
     def get_table_data(self, table_name, limit=100, offset=0):
         """Get data from a table with pagination."""
-        conn = self.get_connection()
+        cache_key = self._cache_key('data', table_name, limit, offset)
+        if cache_key:
+            cached = self.cache.get(cache_key)
+            if cached:
+                return cached
+
+        conn = self._acquire()
         if not conn:
             return [], []
         
@@ -70,37 +1077,228 @@ class DBManager:
             
             # Get data
             cursor.execute(f"SELECT * FROM {table_name} LIMIT ? OFFSET ?", (limit, offset))
-            rows = [dict(row) for row in cursor.fetchall()]
+            rows = [wire_row(row) for row in cursor.fetchall()]
             
-            # Count total rows
-            cursor.execute(f"SELECT COUNT(*) as count FROM {table_name}")
-            total_rows = cursor.fetchone()['count']
+            # Count total rows (cached per snapshot)
+            total_rows, _ = self.get_row_count(table_name, conn=conn)
             
+            if cache_key:
+                self.cache.put(cache_key, (columns, rows, total_rows), estimate_size(rows))
             return columns, rows, total_rows
         except sqlite3.Error as e:
             print(f"Error reading table {table_name}: {e}")
             return [], [], 0
         finally:
-            conn.close()
+            self._release(conn)
 
-    def execute_query(self, query):
-        """Execute a custom SQL query."""
-        conn = self.get_connection()
+    @metrics.timed('db_call')
+    def read_blob(self, table_name, key, column, offset=0, length=None):
+        """Bytes [offset, offset + length) of one BLOB (or TEXT) value.
+
+        The row is found by its key, as in the 'keys' of get_table_page. Returns
+        (size of the whole value, bytes), or None if there is no such row or
+        the value is NULL or a number. Raises ValueError for an unknown column
+        or a key that does not fit the table.
+        """
+        conn = self._acquire()
+        if not conn:
+            return None
+
+        try:
+            cursor = conn.cursor()
+            table = quote_ident(table_name)
+            cursor.execute(f"PRAGMA table_info({table})")
+            if column not in {row['name'] for row in cursor.fetchall()}:
+                raise ValueError(f"No such column: {column}")
+            key_columns = self.page_key(cursor, table_name)
+            if not key_columns or len(key) != len(key_columns):
+                raise ValueError(f"Rows of {table_name} can not be addressed by this key")
+
+            if key_columns == ['rowid'] and isinstance(key[0], int):
+                # Incremental BLOB I/O: only the requested range is read from the file
+                try:
+                    with conn.blobopen(table_name, column, key[0], readonly=True) as blob:
+                        size = len(blob)
+                        blob.seek(min(offset, size))
+                        return size, blob.read(-1 if length is None else length)
+                except sqlite3.OperationalError:
+                    # No such row, or not a BLOB/TEXT value: the query below tells
+                    pass
+
+            value = f"CAST({quote_ident(column)} AS BLOB)"
+            match = ' AND '.join(f"{'rowid' if c == 'rowid' else quote_ident(c)} = ?" for c in key_columns)
+            params = [offset + 1] + ([length] if length is not None else []) + list(key)
+            cursor.execute(
+                f"SELECT typeof({quote_ident(column)}), length({value}), "
+                f"substr({value}, ?{', ?' if length is not None else ''}) FROM {table} WHERE {match}",
+                params
+            )
+            row = cursor.fetchone()
+            if row is None or row[0] not in ('blob', 'text'):
+                return None
+            return row[1], row[2] or b''
+        except sqlite3.Error as e:
+            print(f"Error reading {table_name}.{column}: {e}")
+            return None
+        finally:
+            self._release(conn)
+
+    @metrics.timed('db_call')
+    def execute_query(self, query, max_rows=None, control=None):
+        """Execute a custom SQL query.
+
+        max_rows caps the rows returned (the result is flagged 'truncated');
+        control (a QueryControl) enforces a time budget and allows cancelling.
+        Results of read-only statements are served from the ResultCache when
+        the same (normalized) query ran on the same snapshot before.
+        """
+        cache_key = self._query_cache_key('result', query, max_rows)
+        if cache_key:
+            cached = self.cache.get(cache_key)
+            if cached:
+                if control:
+                    control.rows = len(cached['rows'])
+                    control.status = 'done'
+                return dict(cached, cached=True)
+
+        conn = self._acquire()
         if not conn:
             return {'error': 'Cannot connect to database'}
         
+        try:
+            changes = conn.total_changes
+            result = self._run_query(conn, query, max_rows, control)
+            if cache_key and 'columns' in result and conn.total_changes == changes:
+                self.cache.put(cache_key, result, estimate_size(result['rows']))
+            elif 'columns' not in result:
+                self._invalidate_cache()
+            return dict(result)
+        except sqlite3.OperationalError as e:
+            if 'readonly' not in str(e) or not self.writable:
+                return self._query_error(e, control)
+        except sqlite3.Error as e:
+            return self._query_error(e, control)
+        finally:
+            self._release(conn)
+
+        # Reads are read-only: run writes to a writable copy on a connection of their own
+        self._invalidate_cache()
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        try:
+            return self._run_query(conn, query, max_rows, control)
+        except sqlite3.Error as e:
+            return self._query_error(e, control)
+        finally:
+            conn.close()
+            self._invalidate_cache()
+
+    def _invalidate_cache(self):
+        if self.cache is not None:
+            self.cache.invalidate(self.db_path)
+
+    @metrics.timed('db_call')
+    def open_query(self, query, max_rows=None, control=None):
+        """Start a query and return a QueryCursor to read its rows in chunks.
+
+        Statements without a result set run to completion and return a dict
+        ({'message': ...} or {'error': ...}) instead, like execute_query.
+        control (a QueryControl) enforces a time budget and allows cancelling.
+        Cached results (see execute_query) come back as a CachedQueryCursor,
+        and results read to the end on a read-only connection are cached.
+        """
+        cache_key = self._query_cache_key('rows', query, max_rows)
+        if cache_key:
+            cached = self.cache.get(cache_key)
+            if cached:
+                return CachedQueryCursor(*cached, control=control)
+
+        conn = self._acquire()
+        if not conn:
+            return {'error': 'Cannot connect to database'}
+        release = self._release
+
         try:
             cursor = conn.cursor()
+            try:
+                self._execute(conn, cursor, query, control)
+            except sqlite3.OperationalError as e:
+                if 'readonly' not in str(e) or not self.writable:
+                    raise
+                # Reads are read-only: writes to a writable copy get a connection of their own
+                self._release(conn)
+                self._invalidate_cache()
+                conn = sqlite3.connect(self.db_path)
+                conn.row_factory = sqlite3.Row
+                release = lambda c: c.close()
+                cursor = conn.cursor()
+                cache_key = None
+                self._execute(conn, cursor, query, control)
+
+            if cursor.description:
+                on_complete = None
+                if cache_key and self.pool is not None:
+                    def on_complete(columns, rows, truncated):
+                        self.cache.put(cache_key, (columns, rows, truncated), estimate_size(rows))
+                limit = self.cache.max_entry_bytes if on_complete else 0
+                return QueryCursor(conn, cursor, release, max_rows, control, on_complete, limit)
+
+            conn.commit()
+            release(conn)
+            self._invalidate_cache()
+            if control:
+                control.status = 'done'
+            return {'message': f'Query executed successfully. Rows affected: {cursor.rowcount}'}
+        except sqlite3.Error as e:
+            release(conn)
+            return self._query_error(e, control)
+
+    @staticmethod
+    def _execute(conn, cursor, query, control):
+        if control:
+            control.begin(conn)
+        try:
             cursor.execute(query)
-            
+        finally:
+            if control:
+                control.end()
+
+    @classmethod
+    def _query_error(cls, e, control):
+        message = control.interrupted_error(e) if control else None
+        if control and not message:
+            control.status = 'error'
+        if not message and 'readonly' in str(e):
+            # The client offers to fork the snapshot and run the statement there
+            return {'error': cls.READONLY_ERROR, 'readonly': True}
+        return {'error': message or str(e)}
+
+    @staticmethod
+    def _run_query(conn, query, max_rows=None, control=None):
+        cursor = conn.cursor()
+        if control:
+            control.begin(conn)
+        try:
+            cursor.execute(query)
+
             if cursor.description:
                 columns = [description[0] for description in cursor.description]
-                rows = [dict(row) for row in cursor.fetchall()]
-                return {'columns': columns, 'rows': rows}
+                if max_rows is None:
+                    fetched = cursor.fetchall()
+                else:
+                    fetched = cursor.fetchmany(max_rows + 1)
+                rows = [wire_row(row) for row in fetched[:max_rows]]
+                result = {'columns': columns, 'rows': rows}
+                if max_rows is not None and len(fetched) > max_rows:
+                    result['truncated'] = True
             else:
                 conn.commit()
-                return {'message': f'Query executed successfully. Rows affected: {cursor.rowcount}'}
-        except sqlite3.Error as e:
-            return {'error': str(e)}
+                rows = []
+                result = {'message': f'Query executed successfully. Rows affected: {cursor.rowcount}'}
         finally:
-            conn.close()
+            if control:
+                control.end()
+        if control:
+            control.rows = len(rows)
+            control.status = 'done'
+        return result
@@ -0,0 +1,132 @@
+import queue
+import threading
+
+
+class DBWatcher:
+    """Watches one remote database and tells every subscriber about new snapshots.
+
+    Each tick is a single `stat` of the database and its WAL on the device
+    (size, mtime and WAL header, see ADBInterface.stat_remote_files). Only when
+    that changes is the database pulled, once, however many tabs are watching.
+    """
+
+    def __init__(self, hub, key, device_id, package_name, db_name):
+        self.hub = hub
+        self.key = key
+        self.device_id = device_id
+        self.package_name = package_name
+        self.db_name = db_name
+        self.subscribers = set()
+        # Last 'snapshot' event, replayed to late subscribers
+        self.last_event = None
+        self._signature = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _broadcast(self, event):
+        for q in list(self.subscribers):
+            q.put(event)
+
+    def _run(self):
+        failures = 0
+        while not self._stop.is_set():
+            try:
+                self._check()
+                failures = 0
+            except Exception as e:
+                print(f"Watcher {self.key} failed: {e}")
+                failures += 1
+                if failures >= self.hub.max_failures:
+                    self._broadcast({'event': 'error', 'error': str(e)})
+                    failures = 0
+            self._stop.wait(self.hub.interval)
+
+    def _check(self):
+        names = [self.db_name, f"{self.db_name}-wal"]
+        remote = self.hub.adb.stat_remote_files(self.device_id, self.package_name, names)
+        if not remote or self.db_name not in remote:
+            raise RuntimeError(f"Cannot read {self.db_name} on {self.device_id} (device disconnected?)")
+
+        # The -shm is rewritten by readers too, so it is not part of the signature
+        signature = tuple(
+            (remote[n]['size'], remote[n]['mtime'], remote[n]['head']) if n in remote else None
+            for n in names
+        )
+        if signature == self._signature:
+            return
+
+        token, transfer = self.hub.pull(self.device_id, self.package_name, self.db_name)
+        if token is None:
+            raise RuntimeError((transfer or {}).get('error') or f"Failed to pull {self.db_name}")
+        self._signature = signature
+        self.last_event = {'event': 'snapshot', 'token': token, 'transfer': transfer}
+        self._broadcast(self.last_event)
+
+
+class WatcherHub:
+    """One DBWatcher per (device, package, database), shared by all subscribers.
+
+    pull(device_id, package_name, db_name) must return (token, transfer) or
+    (None, None | {'error'}); the app passes its delta pull + ingest helper. A
+    watcher stops when its last subscriber leaves.
+
+    Each subscriber is an open event stream holding a server thread, so at most
+    `max_subscribers` are accepted at once (None = no limit).
+    """
+
+    def __init__(self, adb, pull, interval=2.0, max_failures=3, max_subscribers=None):
+        self.adb = adb
+        self.pull = pull
+        self.interval = interval
+        self.max_subscribers = max_subscribers
+        # Consecutive failed ticks before subscribers get an 'error' event
+        self.max_failures = max_failures
+        self._watchers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, device_id, package_name, db_name):
+        """Return (watcher, queue); events for this database arrive on the queue.
+        Returns (None, None) if max_subscribers streams are already open."""
+        key = (device_id, package_name, db_name)
+        q = queue.Queue()
+        with self._lock:
+            if self.max_subscribers is not None and \
+                    sum(len(w.subscribers) for w in self._watchers.values()) >= self.max_subscribers:
+                return None, None
+            watcher = self._watchers.get(key)
+            if watcher is None:
+                watcher = DBWatcher(self, key, device_id, package_name, db_name)
+                watcher.subscribers.add(q)
+                self._watchers[key] = watcher
+                watcher.start()
+            else:
+                if watcher.last_event:
+                    q.put(watcher.last_event)
+                watcher.subscribers.add(q)
+        return watcher, q
+
+    def unsubscribe(self, watcher, q):
+        with self._lock:
+            watcher.subscribers.discard(q)
+            if not watcher.subscribers and self._watchers.get(watcher.key) is watcher:
+                del self._watchers[watcher.key]
+                watcher.stop()
+
+    def stop_all(self):
+        with self._lock:
+            watchers = list(self._watchers.values())
+            self._watchers.clear()
+        for watcher in watchers:
+            watcher.stop()
+
+    def stats(self):
+        with self._lock:
+            return {
+                f"{d}/{p}/{n}": len(w.subscribers) for (d, p, n), w in self._watchers.items()
+            }
@@ -0,0 +1,267 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+
+from modules.metrics import metrics
+
+
+class DeltaSync:
+    """Keeps a pristine local mirror of each remote database and refreshes it by
+    transferring only what changed on the device.
+
+    The main file is compared block by block (a block is `block_pages` SQLite
+    pages) using md5 hashes computed on the device. The WAL is append-only until
+    it is restarted, so while its header is unchanged only the new tail is read.
+    Snapshots handed to DBManager are copies of the mirror, because opening them
+    checkpoints and rewrites the file.
+
+    A mirror is only useful while its database has snapshots: drop() it when
+    the snapshot store forgets the database, and prune() leftovers on startup.
+    """
+
+    MIRROR_SUFFIXES = ('.json.tmp', '.json', '-wal', '-shm')
+
+    def __init__(self, adb, mirror_dir, block_pages=16, max_changed_ratio=0.5):
+        self.adb = adb
+        self.mirror_dir = mirror_dir
+        self.block_pages = block_pages
+        # Past this share of changed blocks a plain full read is cheaper
+        self.max_changed_ratio = max_changed_ratio
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        os.makedirs(mirror_dir, exist_ok=True)
+
+    def _lock_for(self, mirror_key):
+        with self._locks_lock:
+            return self._locks.setdefault(mirror_key, threading.Lock())
+
+    def sync(self, device_id, package_name, db_name, mirror_key, local_path):
+        """Bring the mirror up to date and copy it to local_path (+ -wal/-shm).
+
+        Returns {'mode': 'full'|'delta', 'bytes': transferred} or None on failure,
+        in which case the caller should fall back to a regular pull.
+        """
+        with self._lock_for(mirror_key):
+            mirror_db = os.path.join(self.mirror_dir, mirror_key)
+            meta_path = f"{mirror_db}.json"
+            with metrics.span('delta_sync') as span:
+                try:
+                    stats = self._refresh(device_id, package_name, db_name, mirror_db, meta_path)
+                except Exception as e:
+                    print(f"Delta sync failed for {db_name}: {e}")
+                    stats = None
+                if stats is None:
+                    span.fail('delta sync failed')
+                else:
+                    span.fields.update(stats)
+
+            if stats is None:
+                # Force a clean full pull next time
+                if os.path.exists(meta_path):
+                    os.remove(meta_path)
+                return None
+
+            for suffix in ('', '-wal', '-shm'):
+                src = f"{mirror_db}{suffix}"
+                dst = f"{local_path}{suffix}"
+                if os.path.exists(src):
+                    shutil.copyfile(src, dst)
+                elif os.path.exists(dst):
+                    os.remove(dst)
+            return stats
+
+    def drop(self, mirror_key):
+        """Delete a mirror. Skipped (returns False) while it is being synced."""
+        lock = self._lock_for(mirror_key)
+        if not lock.acquire(blocking=False):
+            return False
+        try:
+            mirror_db = os.path.join(self.mirror_dir, mirror_key)
+            for suffix in ('',) + self.MIRROR_SUFFIXES:
+                path = f"{mirror_db}{suffix}"
+                if os.path.exists(path):
+                    try:
+                        os.remove(path)
+                    except OSError as e:
+                        print(f"Cannot delete mirror file {path}: {e}")
+            return True
+        finally:
+            lock.release()
+
+    def prune(self, keep):
+        """Drop every mirror whose key is not in `keep`."""
+        keys = set()
+        for filename in os.listdir(self.mirror_dir):
+            # Keys may contain dots (app.db), so strip the known suffixes
+            key = filename
+            for suffix in self.MIRROR_SUFFIXES:
+                if key.endswith(suffix):
+                    key = key[:-len(suffix)]
+                    break
+            keys.add(key)
+        for key in keys - set(keep):
+            self.drop(key)
+
+    def _refresh(self, device_id, package_name, db_name, mirror_db, meta_path):
+        wal_name = f"{db_name}-wal"
+        shm_name = f"{db_name}-shm"
+        remote = self.adb.stat_remote_files(device_id, package_name, [db_name, wal_name, shm_name])
+        if not remote or db_name not in remote:
+            return None
+
+        meta = self._load_meta(meta_path)
+        if meta is None or not os.path.exists(mirror_db):
+            return self._full_refresh(device_id, package_name, db_name, mirror_db, meta_path, remote)
+
+        transferred = 0
+
+        # 1. WAL first, for the same reason pull_database pulls it first
+        local_wal = f"{mirror_db}-wal"
+        remote_wal = remote.get(wal_name)
+        if remote_wal is None:
+            if os.path.exists(local_wal):
+                os.remove(local_wal)
+        else:
+            local_size = os.path.getsize(local_wal) if os.path.exists(local_wal) else 0
+            same_wal = meta.get('wal_head') == remote_wal['head'] and remote_wal['size'] >= local_size
+            start = local_size if same_wal else 0
+            if remote_wal['size'] > start or not same_wal:
+                with open(local_wal, 'ab' if same_wal else 'wb') as f:
+                    n = self.adb.read_remote_tail(device_id, package_name, wal_name, start, f.write)
+                if n < 0:
+                    return None
+                transferred += n
+            meta['wal_head'] = remote_wal['head']
+
+        # 2. SHM is a small index; just read it whole
+        local_shm = f"{mirror_db}-shm"
+        if shm_name in remote:
+            with open(local_shm, 'wb') as f:
+                n = self.adb.read_remote_tail(device_id, package_name, shm_name, 0, f.write)
+            if n < 0:
+                return None
+            transferred += n
+        elif os.path.exists(local_shm):
+            os.remove(local_shm)
+
+        # 3. Main file: in WAL mode it only changes on checkpoint, so stat is usually enough
+        remote_db = remote[db_name]
+        if [remote_db['size'], remote_db['mtime']] != meta.get('db_stat'):
+            n = self._refresh_blocks(device_id, package_name, db_name, mirror_db, meta, remote_db['size'])
+            if n < 0:
+                return None
+            transferred += n
+            meta['db_stat'] = [remote_db['size'], remote_db['mtime']]
+
+        self._save_meta(meta_path, meta)
+        return {'mode': 'delta', 'bytes': transferred}
+
+    def _refresh_blocks(self, device_id, package_name, db_name, mirror_db, meta, remote_size):
+        block_size = meta['block_size']
+        remote_hashes = self.adb.hash_remote_blocks(device_id, package_name, db_name, block_size)
+        if remote_hashes is None:
+            return -1
+
+        local_hashes = meta['hashes']
+        changed = [
+            i for i, h in enumerate(remote_hashes)
+            if i >= len(local_hashes) or local_hashes[i] != h
+        ]
+
+        if len(changed) > self.max_changed_ratio * max(len(remote_hashes), 1):
+            with open(mirror_db, 'wb') as f:
+                n = self.adb.read_remote_tail(device_id, package_name, db_name, 0, f.write)
+            if n >= 0:
+                meta['hashes'] = self._hash_local_blocks(mirror_db, block_size)
+            return n
+
+        transferred = 0
+        with open(mirror_db, 'r+b') as f:
+            for first, count in self._runs(changed):
+                f.seek(first * block_size)
+                n = self.adb.read_remote_blocks(device_id, package_name, db_name, block_size, first, count, f.write)
+                if n < 0:
+                    return -1
+                transferred += n
+            f.truncate(remote_size)
+
+            # Hash what we actually received: the file may have moved on since hashing
+            hashes = list(local_hashes[:len(remote_hashes)])
+            hashes += [''] * (len(remote_hashes) - len(hashes))
+            for i in changed:
+                f.seek(i * block_size)
+                hashes[i] = hashlib.md5(f.read(block_size)).hexdigest()
+        meta['hashes'] = hashes
+        print(f"Delta sync {db_name}: {len(changed)}/{len(remote_hashes)} blocks changed, {transferred} bytes")
+        return transferred
+
+    def _full_refresh(self, device_id, package_name, db_name, mirror_db, meta_path, remote):
+        if not self.adb.pull_database(device_id, package_name, db_name, mirror_db):
+            return None
+
+        block_size = self._page_size(mirror_db) * self.block_pages
+        remote_db = remote[db_name]
+        meta = {
+            'block_size': block_size,
+            'hashes': self._hash_local_blocks(mirror_db, block_size),
+            # Stat taken before the pull: if the file moved on meanwhile, the next
+            # sync notices and compares blocks
+            'db_stat': [remote_db['size'], remote_db['mtime']],
+            'wal_head': remote.get(f"{db_name}-wal", {}).get('head'),
+        }
+        self._save_meta(meta_path, meta)
+
+        transferred = sum(
+            os.path.getsize(f"{mirror_db}{suffix}")
+            for suffix in ('', '-wal', '-shm') if os.path.exists(f"{mirror_db}{suffix}")
+        )
+        return {'mode': 'full', 'bytes': transferred}
+
+    @staticmethod
+    def _runs(indices):
+        """Group sorted block indices into (first, count) runs of adjacent blocks."""
+        runs = []
+        for i in indices:
+            if runs and runs[-1][0] + runs[-1][1] == i:
+                runs[-1][1] += 1
+            else:
+                runs.append([i, 1])
+        return runs
+
+    @staticmethod
+    def _page_size(db_path):
+        """Read the page size from the SQLite header (offset 16, big-endian; 1 means 65536)."""
+        with open(db_path, 'rb') as f:
+            header = f.read(100)
+        if len(header) < 100 or not header.startswith(b'SQLite format 3\x00'):
+            return 4096
+        size = int.from_bytes(header[16:18], 'big')
+        return 65536 if size == 1 else size
+
+    @staticmethod
+    def _hash_local_blocks(path, block_size):
+        hashes = []
+        with open(path, 'rb') as f:
+            while True:
+                block = f.read(block_size)
+                if not block:
+                    break
+                hashes.append(hashlib.md5(block).hexdigest())
+        return hashes
+
+    @staticmethod
+    def _load_meta(meta_path):
+        try:
+            with open(meta_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _save_meta(meta_path, meta):
+        temp_path = f"{meta_path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(temp_path, meta_path)
@@ -0,0 +1,348 @@
+import csv
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from modules.db_manager import quote_ident, encode_cursor, decode_cursor
+
+# format -> (mimetype, file extension)
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+    'sql': ('application/sql', 'sql'),
+}
+
+XLSX_MAX_ROWS = 1048576
+
+
+def sql_literal(value):
+    """Value as an SQLite literal, like the sqlite3 shell's .dump writes it."""
+    if value is None:
+        return 'NULL'
+    if isinstance(value, bytes):
+        return f"X'{value.hex()}'"
+    if isinstance(value, float):
+        if value != value:
+            return 'NULL'
+        if value in (float('inf'), float('-inf')):
+            return '1e999' if value > 0 else '-1e999'
+        return repr(value)
+    if isinstance(value, int):
+        return str(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _text(value):
+    # BLOBs are written as hex in text formats
+    return value.hex() if isinstance(value, bytes) else value
+
+
+class ExportJob:
+    """Progress of one export, for /api/export/status/<id>.
+
+    `cursor` is the resume point after the last chunk handed to the web server:
+    pass it back as ?cursor= to continue an interrupted download.
+    """
+
+    def __init__(self, fmt, source):
+        self.id = uuid.uuid4().hex
+        self.format = fmt
+        self.source = source
+        self.rows = 0
+        self.cursor = None
+        self.error = None
+        self.started = time.time()
+        self.finished = None
+
+    def stats(self):
+        elapsed = (self.finished or time.time()) - self.started
+        return {
+            'id': self.id,
+            'format': self.format,
+            'source': self.source,
+            'rows': self.rows,
+            'elapsed': round(elapsed, 3),
+            'rows_per_sec': round(self.rows / elapsed) if elapsed > 0 else 0,
+            'cursor': self.cursor,
+            'done': self.finished is not None and self.error is None,
+            'error': self.error,
+        }
+
+
+class ExportRegistry:
+    """Recent exports by id (the newest `keep` are remembered)."""
+
+    def __init__(self, keep=50):
+        self.keep = keep
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, job):
+        with self._lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.keep:
+                self._jobs.popitem(last=False)
+
+    def get(self, export_id):
+        with self._lock:
+            return self._jobs.get(export_id)
+
+
+class Exporter:
+    """Streams a table, a query or a whole database out of a snapshot.
+
+    Rows are read with fetchmany(chunk_rows) and written out chunk by chunk, so
+    memory use does not depend on the table size. Tables are exported in
+    rowid / primary key order, which makes them resumable from a keyset cursor;
+    queries and views resume by row offset.
+    """
+
+    def __init__(self, db, chunk_rows=1000, registry=None):
+        self.db = db
+        self.chunk_rows = chunk_rows
+        self.registry = registry
+
+    def _new_job(self, fmt, source):
+        job = ExportJob(fmt, source)
+        if self.registry:
+            self.registry.add(job)
+        return job
+
+    # --- Public API: each returns (job, generator of bytes) ---
+
+    def export_table(self, table_name, fmt, cursor_token=None):
+        if not self._master_sql("type IN ('table', 'view') AND name = ?", (table_name,)):
+            raise LookupError(f"No such table: {table_name}")
+        job = self._new_job(fmt, table_name)
+        position = decode_cursor(cursor_token) or {}
+        chunks = self._table_chunks(job, table_name, position)
+        return job, self._write(job, fmt, chunks, table_name, resumed=bool(position))
+
+    def export_query(self, query, fmt, cursor_token=None):
+        """Raises sqlite3.Error for an invalid query, before anything is streamed."""
+        sql = f"SELECT * FROM ({query.strip().rstrip(';')}) LIMIT -1 OFFSET ?"
+        with self.db.connection() as conn:
+            conn.execute(sql.replace('LIMIT -1', 'LIMIT 0'), (0,))
+
+        job = self._new_job(fmt, 'query')
+        position = decode_cursor(cursor_token) or {}
+        offset = position.get('o', 0)
+        chunks = self._chunks(job, sql, (offset,), 0, offset)
+        return job, self._write(job, fmt, chunks, 'query_result', resumed=bool(position))
+
+    def dump_database(self):
+        """The whole database as SQL text, in the spirit of the sqlite3 shell's .dump."""
+        job = self._new_job('sql', 'database')
+        return job, self._dump_database(job)
+
+    # --- Reading ---
+
+    def _table_chunks(self, job, table_name, position):
+        with self.db.connection() as conn:
+            key_columns = self.db.page_key(conn.cursor(), table_name)
+
+        table = quote_ident(table_name)
+        if not key_columns:
+            offset = position.get('o', 0)
+            return self._chunks(job, f"SELECT * FROM {table} LIMIT -1 OFFSET ?", (offset,), 0, offset)
+
+        key_list = ', '.join('rowid' if c == 'rowid' else quote_ident(c) for c in key_columns)
+        sql = f"SELECT {key_list}, * FROM {table}"
+        params = []
+        if position.get('k'):
+            sql += f" WHERE ({key_list}) > ({', '.join('?' for _ in key_columns)})"
+            params.extend(position['k'])
+        sql += f" ORDER BY {key_list}"
+        return self._chunks(job, sql, params, len(key_columns), 0)
+
+    def _chunks(self, job, sql, params, skip, offset):
+        """Yield the column names, then lists of row tuples.
+
+        The first `skip` result columns are the row key; they are used for the
+        resume cursor and left out of the output.
+        """
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(sql, params)
+            yield [d[0] for d in cursor.description[skip:]]
+            while True:
+                rows = cursor.fetchmany(self.chunk_rows)
+                if not rows:
+                    break
+                yield [tuple(row)[skip:] for row in rows]
+                # Only reached once the chunk above has been written out
+                job.rows += len(rows)
+                if skip:
+                    job.cursor = encode_cursor({'k': list(tuple(rows[-1])[:skip])})
+                else:
+                    job.cursor = encode_cursor({'o': offset + job.rows})
+            cursor.close()
+
+    # --- Writing ---
+
+    def _write(self, job, fmt, chunks, name, resumed):
+        writer = {
+            'csv': self._write_csv,
+            'jsonl': self._write_jsonl,
+            'xlsx': self._write_xlsx,
+            'sql': self._write_sql,
+        }[fmt]
+        try:
+            yield from writer(chunks, name, resumed)
+            job.finished = time.time()
+        except Exception as e:
+            print(f"Export of {name} failed: {e}")
+            job.error = str(e)
+            job.finished = time.time()
+            raise
+        finally:
+            chunks.close()
+
+    @staticmethod
+    def _write_csv(chunks, name, resumed):
+        columns = next(chunks)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if not resumed:
+            writer.writerow(columns)
+        for rows in chunks:
+            writer.writerows([_text(v) for v in row] for row in rows)
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode('utf-8')
+
+    @staticmethod
+    def _write_jsonl(chunks, name, resumed):
+        columns = next(chunks)
+        for rows in chunks:
+            yield ''.join(
+                json.dumps(dict(zip(columns, (_text(v) for v in row))), ensure_ascii=False) + '\n'
+                for row in rows
+            ).encode('utf-8')
+
+    @staticmethod
+    def _write_xlsx(chunks, name, resumed):
+        # A zip file cannot be sent before it is complete: write-only mode keeps
+        # memory flat while building it in a temp file, which is then streamed
+        from openpyxl import Workbook
+        from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+        columns = next(chunks)
+        workbook = Workbook(write_only=True)
+        title = name[:31] or 'Sheet'
+        sheet, sheet_rows, sheets = None, XLSX_MAX_ROWS, 0
+        for rows in chunks:
+            for row in rows:
+                if sheet_rows >= XLSX_MAX_ROWS:
+                    sheets += 1
+                    sheet = workbook.create_sheet(title if sheets == 1 else f"{title[:27]}_{sheets}")
+                    sheet.append(columns)
+                    sheet_rows = 1
+                sheet.append([
+                    ILLEGAL_CHARACTERS_RE.sub('', v) if isinstance(v, str) else _text(v) for v in row
+                ])
+                sheet_rows += 1
+        if sheet is None:
+            workbook.create_sheet(title).append(columns)
+
+        handle, temp_path = tempfile.mkstemp(suffix='.xlsx')
+        os.close(handle)
+        try:
+            workbook.save(temp_path)
+            with open(temp_path, 'rb') as f:
+                while True:
+                    block = f.read(1024 * 1024)
+                    if not block:
+                        break
+                    yield block
+        finally:
+            os.remove(temp_path)
+
+    def _write_sql(self, chunks, name, resumed):
+        columns = next(chunks)
+        table = quote_ident(name)
+        yield b"PRAGMA foreign_keys=OFF;\nBEGIN TRANSACTION;\n"
+        if not resumed:
+            create = self._master_sql("type = 'table' AND name = ?", (name,))
+            if create:
+                yield f"{create[0]};\n".encode('utf-8')
+            else:
+                # Query result: a table with the result's columns
+                yield f"CREATE TABLE {table}({', '.join(quote_ident(c) for c in columns)});\n".encode('utf-8')
+        for rows in chunks:
+            yield self._inserts(table, rows).encode('utf-8')
+        if not resumed:
+            for statement in self._master_sql("type IN ('index', 'trigger') AND tbl_name = ?", (name,)):
+                yield f"{statement};\n".encode('utf-8')
+        yield b"COMMIT;\n"
+
+    @staticmethod
+    def _inserts(table, rows):
+        return ''.join(
+            f"INSERT INTO {table} VALUES({','.join(sql_literal(v) for v in row)});\n" for row in rows
+        )
+
+    def _master_sql(self, where, params=()):
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT sql FROM sqlite_master WHERE sql IS NOT NULL AND {where} ORDER BY rowid", params)
+            return [row[0] for row in cursor.fetchall()]
+
+    def _dump_database(self, job):
+        try:
+            yield b"PRAGMA foreign_keys=OFF;\nBEGIN TRANSACTION;\n"
+            with self.db.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "SELECT name, sql FROM sqlite_master WHERE type = 'table' AND sql IS NOT NULL "
+                    "AND name NOT LIKE 'sqlite_stat%' ORDER BY rowid"
+                )
+                tables = [(row[0], row[1]) for row in cursor.fetchall()]
+
+            writable_schema = False
+            for name, create in tables:
+                if name == 'sqlite_sequence':
+                    # Created by SQLite itself along with the first AUTOINCREMENT table
+                    yield b"DELETE FROM sqlite_sequence;\n"
+                elif create.upper().startswith('CREATE VIRTUAL TABLE'):
+                    # Like .dump: register the virtual table without creating its
+                    # shadow tables, which are dumped as ordinary tables
+                    if not writable_schema:
+                        yield b"PRAGMA writable_schema=ON;\n"
+                        writable_schema = True
+                    yield (
+                        "INSERT INTO sqlite_master(type,name,tbl_name,rootpage,sql) "
+                        f"VALUES('table',{sql_literal(name)},{sql_literal(name)},0,{sql_literal(create)});\n"
+                    ).encode('utf-8')
+                    continue
+                else:
+                    yield f"{create};\n".encode('utf-8')
+                chunks = self._chunks(job, f"SELECT * FROM {quote_ident(name)}", (), 0, 0)
+                try:
+                    next(chunks)
+                    for rows in chunks:
+                        yield self._inserts(quote_ident(name), rows).encode('utf-8')
+                finally:
+                    chunks.close()
+
+            for statement in self._master_sql("type IN ('index', 'trigger', 'view')"):
+                yield f"{statement};\n".encode('utf-8')
+            if writable_schema:
+                yield b"PRAGMA writable_schema=OFF;\n"
+            yield b"COMMIT;\n"
+            # Row offsets restart with every table: a dump is not resumable
+            job.cursor = None
+            job.finished = time.time()
+        except Exception as e:
+            print(f"Database dump failed: {e}")
+            job.error = str(e)
+            job.finished = time.time()
+            raise
@@ -0,0 +1,206 @@
+import os
+import json
+import time
+import logging
+import threading
+from functools import wraps
+from logging.handlers import RotatingFileHandler
+
+# Histogram buckets, in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+PREFIX = 'adbv_'
+
+HELP = {
+    'adb_command_seconds': 'Host-side adb invocations (devices, pull...)',
+    'adb_shell_seconds': 'Commands run through the persistent adb shell, by program',
+    'adb_bytes_total': 'Bytes received from devices, by transfer method',
+    'pull_file_seconds': 'Pull of one database file (db, wal, shm)',
+    'pull_snapshot_seconds': 'Pull plus store ingest of a snapshot',
+    'pull_snapshot_bytes_total': 'Bytes transferred by snapshot pulls, by mode',
+    'delta_sync_seconds': 'Delta sync of a database mirror',
+    'snapshot_prepare_seconds': 'One-off WAL checkpoint of a new snapshot',
+    'db_call_seconds': 'DBManager calls',
+    'db_count_seconds': 'COUNT(*) of a table (row count cache miss)',
+    'search_index_build_seconds': 'Full-text index builds',
+    'table_index_build_seconds': 'Automatic sort/filter index builds (working copy)',
+    'wal_view_build_seconds': 'Builds of WAL commit views',
+    'http_request_seconds': 'Flask requests, by route and status',
+    'json_serialize_seconds': 'JSON encoding of API responses',
+    'span_errors_total': 'Failed timed operations, by span',
+}
+
+
+class Span:
+    """One timed operation; see Metrics.span()."""
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+        self.error = None
+        self.fields = {}
+        self._started = None
+
+    def fail(self, error):
+        """Mark the operation failed without raising (most callers return None)."""
+        self.error = str(error)
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None and self.error is None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        self.metrics._finish(self, time.perf_counter() - self._started)
+        return False
+
+
+class Metrics:
+    """Prometheus-style counters and histograms, plus a JSON log of every span.
+
+    Labels must have few distinct values (a route, not a URL; a program, not
+    a command line). render() produces the Prometheus text format; gauges
+    that belong to other objects (cache sizes...) come from collectors
+    registered with add_collector().
+    """
+
+    def __init__(self):
+        self._counters = {}     # (name, labels) -> value
+        self._histograms = {}   # (name, labels) -> [bucket counts..., sum, count]
+        self._collectors = []
+        self._lock = threading.Lock()
+        self.logger = None
+
+    def configure_log(self, log_dir, filename='metrics.log', max_bytes=5 * 1024 * 1024, backups=3):
+        """Write one JSON line per span to log_dir/filename (rotated)."""
+        os.makedirs(log_dir, exist_ok=True)
+        logger = logging.getLogger('adbv.metrics')
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+        handler = RotatingFileHandler(os.path.join(log_dir, filename), maxBytes=max_bytes,
+                                      backupCount=backups, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        self.logger = logger
+
+    # --- Recording ---
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [0] * (len(BUCKETS) + 2)
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    hist[i] += 1
+                    break
+            hist[-2] += seconds
+            hist[-1] += 1
+
+    def span(self, name, **labels):
+        """Context manager timing an operation into the <name>_seconds histogram.
+
+            with metrics.span('pull_file', file='wal') as span:
+                ...
+                span.fields['bytes'] = n   # extra fields for the log line
+                span.fail('no such file')  # counted in span_errors_total
+        """
+        return Span(self, name, labels)
+
+    def timed(self, name, **labels):
+        """Decorator: a span per call, with the function name as the 'call' label."""
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(name, call=fn.__name__, **labels):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _finish(self, span, seconds):
+        self.observe(f"{span.name}_seconds", seconds, **span.labels)
+        if span.error:
+            self.inc('span_errors_total', span=span.name)
+        if self.logger:
+            record = {
+                'ts': round(time.time(), 3),
+                'span': span.name,
+                'ms': round(seconds * 1000, 2),
+                **span.labels,
+                **span.fields,
+            }
+            if span.error:
+                record['error'] = span.error
+            self.logger.info(json.dumps(record, default=str))
+
+    # --- Export ---
+
+    def add_collector(self, collect):
+        """collect() returns [(name, type, value, labels_dict)], read on every render()."""
+        self._collectors.append(collect)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {k: list(v) for k, v in self._histograms.items()}
+
+        families = {}  # name -> (type, [lines])
+        for (name, labels), value in sorted(counters.items()):
+            families.setdefault(name, ('counter', []))[1].append(f"{PREFIX}{name}{_labels(labels)} {_number(value)}")
+        for (name, labels), hist in sorted(histograms.items()):
+            lines = families.setdefault(name, ('histogram', []))[1]
+            cumulative = 0
+            for bound, count in zip(BUCKETS, hist):
+                cumulative += count
+                lines.append(f"{PREFIX}{name}_bucket{_labels(labels + (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{PREFIX}{name}_bucket{_labels(labels + (('le', '+Inf'),))} {hist[-1]}")
+            lines.append(f"{PREFIX}{name}_sum{_labels(labels)} {_number(hist[-2])}")
+            lines.append(f"{PREFIX}{name}_count{_labels(labels)} {hist[-1]}")
+        for collect in self._collectors:
+            try:
+                samples = collect()
+            except Exception as e:
+                print(f"Metrics collector failed: {e}")
+                continue
+            for name, kind, value, labels in samples:
+                if value is None:
+                    continue
+                lines = families.setdefault(name, (kind, []))[1]
+                lines.append(f"{PREFIX}{name}{_labels(tuple(sorted(labels.items())))} {_number(value)}")
+
+        out = []
+        for name, (kind, lines) in families.items():
+            if name in HELP:
+                out.append(f"# HELP {PREFIX}{name} {HELP[name]}")
+            out.append(f"# TYPE {PREFIX}{name} {kind}")
+            out.extend(lines)
+        return '\n'.join(out) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        f'{k}="' + str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for k, v in labels
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# Shared by all modules, exported by the app at /api/metrics
+metrics = Metrics()
@@ -0,0 +1,116 @@
+import threading
+import time
+import uuid
+
+
+class CursorRegistry:
+    """Open QueryCursors that the front end keeps reading from, by id.
+
+    Each cursor holds a database connection, so cursors that are not read for
+    `idle_timeout` seconds are closed, and at most `max_open` stay open (the
+    least recently used one is closed first).
+    """
+
+    def __init__(self, idle_timeout=300, max_open=32):
+        self.idle_timeout = idle_timeout
+        self.max_open = max_open
+        self._cursors = {}  # id -> (cursor, last_used)
+        self._lock = threading.Lock()
+
+    def add(self, cursor):
+        cursor_id = uuid.uuid4().hex
+        with self._lock:
+            self._expire()
+            while len(self._cursors) >= self.max_open:
+                oldest = min(self._cursors, key=lambda k: self._cursors[k][1])
+                self._cursors.pop(oldest)[0].close()
+            self._cursors[cursor_id] = (cursor, time.time())
+        return cursor_id
+
+    def get(self, cursor_id):
+        with self._lock:
+            self._expire()
+            entry = self._cursors.get(cursor_id)
+            if not entry:
+                return None
+            self._cursors[cursor_id] = (entry[0], time.time())
+            return entry[0]
+
+    def close(self, cursor_id):
+        with self._lock:
+            entry = self._cursors.pop(cursor_id, None)
+        if entry:
+            entry[0].close()
+        return entry is not None
+
+    def discard_closed(self, cursor_id):
+        """Forget a cursor that ran out of rows."""
+        with self._lock:
+            entry = self._cursors.get(cursor_id)
+            if entry and entry[0].closed:
+                del self._cursors[cursor_id]
+
+    def close_all(self):
+        with self._lock:
+            entries = list(self._cursors.values())
+            self._cursors.clear()
+        for cursor, _ in entries:
+            cursor.close()
+
+    def _expire(self):
+        # Caller holds self._lock
+        cutoff = time.time() - self.idle_timeout
+        for cursor_id in [k for k, (_, last_used) in self._cursors.items() if last_used < cutoff]:
+            self._cursors.pop(cursor_id)[0].close()
+
+
+class QueryRegistry:
+    """QueryControls of running queries, by query id, so they can be cancelled.
+
+    The id comes from the client so it can cancel a query before the request
+    that started it has returned. Queries behind an open cursor stay
+    registered until the cursor is closed or expires.
+    """
+
+    def __init__(self, cursors=None):
+        self.cursors = cursors
+        self._queries = {}  # query_id -> (control, cursor_id)
+        self._lock = threading.Lock()
+
+    def start(self, query_id, control):
+        with self._lock:
+            self._expire()
+            if query_id in self._queries:
+                return False
+            self._queries[query_id] = (control, None)
+            return True
+
+    def attach_cursor(self, query_id, cursor_id):
+        with self._lock:
+            if query_id in self._queries:
+                self._queries[query_id] = (self._queries[query_id][0], cursor_id)
+
+    def finish(self, query_id):
+        with self._lock:
+            self._queries.pop(query_id, None)
+
+    def cancel(self, query_id):
+        """Stop a running query and close its cursor. Returns its stats, or None if unknown."""
+        with self._lock:
+            entry = self._queries.pop(query_id, None)
+            self._expire()
+        if not entry:
+            return None
+        control, cursor_id = entry
+        control.cancel()
+        if cursor_id and self.cursors:
+            self.cursors.close(cursor_id)
+        return control.stats()
+
+    def _expire(self):
+        # Caller holds self._lock. Drop cursor queries whose cursor is gone.
+        if not self.cursors:
+            return
+        for query_id, (control, cursor_id) in list(self._queries.items()):
+            if cursor_id and control.status != 'running':
+                del self._queries[query_id]
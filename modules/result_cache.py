@@ -0,0 +1,128 @@
+import re
+import threading
+from collections import OrderedDict
+
+# Tokens of an SQL statement: string literals and quoted identifiers (kept
+# verbatim), comments, whitespace runs, and everything else
+_SQL_TOKENS = re.compile(
+    r"'(?:[^']|'')*'?|\"(?:[^\"]|\"\")*\"?|`[^`]*`?|\[[^\]]*\]?|--[^\n]*|/\*.*?(?:\*/|$)|\s+|[^'\"`\[\s/-]+|.",
+    re.DOTALL,
+)
+
+# Statements that may return different rows from the same bytes. The date and
+# time functions default to 'now' when called without a time value: date(),
+# or strftime() with a format only
+_VOLATILE = re.compile(
+    r"\b(random|randomblob|changes|total_changes|last_insert_rowid)\s*\(|'now'|\bcurrent_(date|time|timestamp)\b"
+    r"|\b(date|time|datetime|julianday|unixepoch)\s*\(\s*\)"
+    r"|\bstrftime\s*\(\s*('(?:[^']|'')*'|[^,()']*)\s*\)",
+    re.IGNORECASE,
+)
+
+
+def normalize_sql(sql):
+    """Collapse whitespace and drop comments and trailing semicolons, so that
+    reformatting a query still finds its cached result. Literals and quoted
+    names are left untouched."""
+    parts = []
+    for token in _SQL_TOKENS.findall(sql):
+        if token.isspace() or token.startswith('--') or token.startswith('/*'):
+            if parts and parts[-1] != ' ':
+                parts.append(' ')
+        else:
+            parts.append(token)
+    return ''.join(parts).strip().rstrip(';').strip()
+
+
+def is_cacheable(sql):
+    """Only plain reads whose result depends on nothing but the snapshot."""
+    normalized = normalize_sql(sql)
+    first = normalized.split(' ', 1)[0].split('(', 1)[0].upper()
+    if first not in ('SELECT', 'WITH', 'VALUES'):
+        return False
+    if ';' in normalized or re.search(r'\bRETURNING\b', normalized, re.IGNORECASE):
+        # Several statements, or a write (WITH ... DELETE ... RETURNING)
+        return False
+    return not _VOLATILE.search(normalized)
+
+
+def estimate_size(rows):
+    """Rough bytes held by a list of rows (tuples, lists or dicts)."""
+    size = 0
+    for row in rows:
+        values = row.values() if isinstance(row, dict) else row
+        size += 64
+        for value in values:
+            size += 16 + len(value) if isinstance(value, (str, bytes)) else 16
+    return size
+
+
+class ResultCache:
+    """Bounded LRU of query results and table pages, sized in bytes.
+
+    Keys start with the snapshot path. Snapshots in the store are named after
+    their content hash, so a Monitor pull of identical bytes lands on the same
+    path and reuses what was cached for the previous one. DBManager adds the
+    file signature to its keys, so anything written to a snapshot afterwards
+    never sees stale results; invalidate() frees them right away.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, max_entry_bytes=8 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        # Larger results are not cached at all (they would evict everything else)
+        self.max_entry_bytes = max_entry_bytes
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size):
+        if size > self.max_entry_bytes:
+            return False
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+        return True
+
+    def invalidate(self, db_path):
+        """Drop everything cached for a snapshot (written to, or evicted)."""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == db_path]:
+                self._bytes -= self._entries.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+                'evictions': self.evictions,
+            }
@@ -0,0 +1,360 @@
+import os
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from modules.db_manager import quote_ident, sqlite_uri
+from modules.metrics import metrics
+
+# Index file layout (one per snapshot, a sidecar of the snapshot object):
+#   docs  FTS5 table, one row per text value: (value, tbl, col, rid)
+#   sigs  per source row: hash of its text values and the docs rowids it owns
+#   keys  per source table: the columns `rid` refers to
+INDEX_SCHEMA = """
+CREATE TABLE sigs (tbl TEXT, rid TEXT, sig INTEGER, first INTEGER, n INTEGER,
+                   PRIMARY KEY (tbl, rid)) WITHOUT ROWID;
+CREATE TABLE keys (tbl TEXT PRIMARY KEY, key_columns TEXT);
+"""
+
+# Queries shorter than this can't use the trigram index and fall back to LIKE
+MIN_MATCH_CHARS = 3
+
+
+def _fts_tokenizer():
+    """'trigram' (substring search) where this SQLite has it, else word tokens."""
+    conn = sqlite3.connect(':memory:')
+    try:
+        conn.execute("CREATE VIRTUAL TABLE t USING fts5(x, tokenize='trigram')")
+        return 'trigram'
+    except sqlite3.Error:
+        return 'unicode61'
+    finally:
+        conn.close()
+
+
+def _encode_key(values):
+    # Same convention as page cursors: BLOB key parts as {'$b': hex}
+    return json.dumps(
+        [{'$b': v.hex()} if isinstance(v, bytes) else v for v in values], separators=(',', ':')
+    )
+
+
+def _signature(texts):
+    digest = hashlib.blake2b(digest_size=8)
+    for col, value in texts:
+        digest.update(f"{col}\x1f{value}\x1e".encode('utf-8', 'surrogatepass'))
+    return int.from_bytes(digest.digest(), 'big', signed=True)
+
+
+def _snippet(value, query, context=40):
+    """Text around the first match of `query` in `value`, with the match's
+    offsets inside the returned snippet (None if it is not found verbatim)."""
+    pos = value.lower().find(query.lower())
+    if pos < 0:
+        return value[:2 * context], None
+    start = max(0, pos - context)
+    end = min(len(value), pos + len(query) + context)
+    prefix = '…' if start else ''
+    snippet = prefix + value[start:end] + ('…' if end < len(value) else '')
+    offset = len(prefix) + pos - start
+    return snippet, [offset, offset + len(query)]
+
+
+def build_index(db_path, index_path, base_index=None, chunk_rows=1000, progress=None):
+    """Write the full-text index of a snapshot to index_path.
+
+    With base_index (the index of an earlier snapshot of the same database)
+    only rows whose text changed are re-indexed, the rest are carried over.
+    The index is built under a temporary name and renamed into place, so
+    index_path never holds a half-built index. Returns build stats.
+    """
+    started = time.time()
+    temp_path = f"{index_path}.tmp"
+    for suffix in ('', '-journal'):
+        if os.path.exists(f"{temp_path}{suffix}"):
+            os.remove(f"{temp_path}{suffix}")
+
+    reused = False
+    if base_index:
+        try:
+            shutil.copyfile(base_index, temp_path)
+            reused = True
+        except OSError as e:
+            # Evicted meanwhile: start from scratch
+            print(f"Search index: cannot reuse {base_index}: {e}")
+
+    stats = {'tables': 0, 'rows': 0, 'indexed': 0, 'removed': 0, 'incremental': reused}
+    src = sqlite3.connect(sqlite_uri(db_path, mode='ro'), uri=True)
+    idx = sqlite3.connect(temp_path)
+    try:
+        idx.execute("PRAGMA journal_mode=OFF")
+        idx.execute("PRAGMA synchronous=OFF")
+        if not reused:
+            idx.execute(
+                "CREATE VIRTUAL TABLE docs USING fts5(value, tbl UNINDEXED, col UNINDEXED, rid UNINDEXED, "
+                f"tokenize='{_fts_tokenizer()}')"
+            )
+            idx.executescript(INDEX_SCHEMA)
+
+        tables = _source_tables(src)
+        next_doc = (idx.execute("SELECT max(rowid) FROM docs").fetchone()[0] or 0) + 1
+
+        # Tables that are gone since the base snapshot
+        for (table,) in idx.execute("SELECT tbl FROM keys").fetchall():
+            if table not in tables:
+                stats['removed'] += _drop_rows(idx, table, None)
+                idx.execute("DELETE FROM keys WHERE tbl = ?", (table,))
+
+        for i, (table, key_columns) in enumerate(tables.items()):
+            previous = idx.execute("SELECT key_columns FROM keys WHERE tbl = ?", (table,)).fetchone()
+            if previous and json.loads(previous[0]) != key_columns:
+                # Primary key changed: old rids mean nothing any more
+                stats['removed'] += _drop_rows(idx, table, None)
+            idx.execute("INSERT OR REPLACE INTO keys VALUES (?, ?)", (table, json.dumps(key_columns)))
+            next_doc = _index_table(src, idx, table, key_columns, next_doc, chunk_rows, stats)
+            stats['tables'] += 1
+            if progress:
+                progress(i + 1, len(tables))
+
+        idx.commit()
+    finally:
+        src.close()
+        idx.close()
+
+    os.replace(temp_path, index_path)
+    stats['elapsed'] = round(time.time() - started, 3)
+    return stats
+
+
+def _source_tables(src):
+    """{table: key columns} for every ordinary table of the snapshot."""
+    src.row_factory = sqlite3.Row
+    tables = {}
+    rows = src.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+    ).fetchall()
+    for row in rows:
+        # Virtual tables (FTS etc.) store their text in shadow tables, which are indexed
+        if (row['sql'] or '').upper().startswith('CREATE VIRTUAL'):
+            continue
+        try:
+            src.execute(f"SELECT rowid FROM {quote_ident(row['name'])} LIMIT 0")
+            tables[row['name']] = ['rowid']
+            continue
+        except sqlite3.Error:
+            pass
+        pk = sorted(
+            (c['pk'], c['name']) for c in src.execute(f"PRAGMA table_info({quote_ident(row['name'])})") if c['pk']
+        )
+        if pk:
+            tables[row['name']] = [name for _, name in pk]
+    src.row_factory = None
+    return tables
+
+
+def _drop_rows(idx, table, rids):
+    """Remove the docs of some rows of a table (all rows if rids is None)."""
+    if rids is None:
+        ranges = idx.execute("SELECT rid, first, n FROM sigs WHERE tbl = ?", (table,)).fetchall()
+    else:
+        ranges = [
+            (rid, first, n) for rid, (_, first, n) in rids.items()
+        ]
+    for rid, first, n in ranges:
+        if n:
+            idx.execute("DELETE FROM docs WHERE rowid >= ? AND rowid < ?", (first, first + n))
+    if rids is None:
+        idx.execute("DELETE FROM sigs WHERE tbl = ?", (table,))
+    else:
+        idx.executemany("DELETE FROM sigs WHERE tbl = ? AND rid = ?", [(table, rid) for rid, _, _ in ranges])
+    return len(ranges)
+
+
+def _index_table(src, idx, table, key_columns, next_doc, chunk_rows, stats):
+    # rid -> (sig, first, n) as of the base snapshot; whatever is left over
+    # after the scan was deleted from the table
+    old = {
+        rid: (sig, first, n)
+        for rid, sig, first, n in idx.execute("SELECT rid, sig, first, n FROM sigs WHERE tbl = ?", (table,))
+    }
+
+    cursor = src.execute(
+        f"SELECT {', '.join(quote_ident(c) for c in key_columns)}, * FROM {quote_ident(table)}"
+    )
+    width = len(key_columns)
+    columns = [d[0] for d in cursor.description][width:]
+
+    while True:
+        rows = cursor.fetchmany(chunk_rows)
+        if not rows:
+            break
+        docs, sigs, stale = [], [], {}
+        for row in rows:
+            stats['rows'] += 1
+            rid = _encode_key(row[:width])
+            texts = [(col, v) for col, v in zip(columns, row[width:]) if isinstance(v, str) and v]
+            sig = _signature(texts) if texts else None
+            previous = old.pop(rid, None)
+            if previous and previous[0] == sig:
+                continue
+            if previous:
+                stale[rid] = previous
+            if sig is None:
+                continue
+            sigs.append((table, rid, sig, next_doc, len(texts)))
+            for col, value in texts:
+                docs.append((next_doc, value, table, col, rid))
+                next_doc += 1
+            stats['indexed'] += 1
+        if stale:
+            _drop_rows(idx, table, stale)
+        idx.executemany("INSERT INTO docs (rowid, value, tbl, col, rid) VALUES (?, ?, ?, ?, ?)", docs)
+        idx.executemany("INSERT OR REPLACE INTO sigs VALUES (?, ?, ?, ?, ?)", sigs)
+
+    if old:
+        stats['removed'] += _drop_rows(idx, table, old)
+    return next_doc
+
+
+def search_index(index_path, query, limit=100):
+    """Find text values containing `query`. Returns (matches, truncated)."""
+    conn = sqlite3.connect(sqlite_uri(index_path, mode='ro'), uri=True)
+    try:
+        if len(query) >= MIN_MATCH_CHARS:
+            # One quoted phrase: FTS5 operators in the input are taken literally
+            phrase = '"' + query.replace('"', '""') + '"'
+            sql = "SELECT tbl, col, rid, value FROM docs WHERE docs MATCH ? LIMIT ?"
+            params = (phrase, limit + 1)
+        else:
+            sql = "SELECT tbl, col, rid, value FROM docs WHERE value LIKE ? ESCAPE '\\' LIMIT ?"
+            pattern = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            params = (f"%{pattern}%", limit + 1)
+        rows = conn.execute(sql, params).fetchall()
+        key_columns = {tbl: json.loads(cols) for tbl, cols in conn.execute("SELECT tbl, key_columns FROM keys")}
+    finally:
+        conn.close()
+
+    matches = []
+    for table, column, rid, value in rows[:limit]:
+        snippet, highlight = _snippet(value, query)
+        matches.append({
+            'table': table,
+            'column': column,
+            'key_columns': key_columns.get(table),
+            'key': json.loads(rid),
+            'snippet': snippet,
+            'highlight': highlight,
+        })
+    return matches, len(rows) > limit
+
+
+class SearchIndexer:
+    """Builds full-text indexes of snapshots in the background.
+
+    An index is built the first time a snapshot is searched. From then on that
+    database counts as "searched": every new snapshot of it is indexed as soon
+    as it is ingested, incrementally from the previous snapshot's index. One
+    worker builds one index at a time, so each build can start from the one
+    before it.
+    """
+
+    def __init__(self, store, chunk_rows=1000):
+        self.store = store
+        self.chunk_rows = chunk_rows
+        self._builds = {}       # content key -> status dict
+        self._searched = set()  # db_keys whose new snapshots are indexed on arrival
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def index_path(self, key):
+        return self.store.sidecar_path(key, 'fts')
+
+    def status(self, token):
+        """{'status': 'ready'|'building'|'queued'|'failed'|'missing', ...} for a token."""
+        key = self.store.content_key(token)
+        if key is None:
+            return {'status': 'missing'}
+        with self._lock:
+            build = self._builds.get(key)
+            if build and build['status'] != 'ready':
+                return dict(build)
+        if os.path.exists(self.index_path(key)):
+            return dict(build or {'status': 'ready'})
+        return {'status': 'missing'}
+
+    def ensure(self, token):
+        """Start indexing a snapshot unless it is indexed or being indexed. Returns its status."""
+        db_key = self.store.db_key(token)
+        key = self.store.content_key(token)
+        if key is None:
+            return {'status': 'missing'}
+        with self._lock:
+            self._searched.add(db_key)
+            build = self._builds.get(key)
+            if build and build['status'] in ('queued', 'building'):
+                return dict(build)
+            if os.path.exists(self.index_path(key)):
+                return dict(build or {'status': 'ready'})
+            build = self._builds[key] = {'status': 'queued', 'progress': 0}
+        self._executor.submit(self._build, token, key, db_key)
+        return dict(build)
+
+    def on_ingest(self, token):
+        """Hook for new snapshots: keep indexes of searched databases current."""
+        if self.store.db_key(token) in self._searched:
+            self.ensure(token)
+
+    def search(self, token, query, limit=100):
+        """Search a snapshot. Returns (status, matches, truncated); matches is
+        None until the snapshot's index is ready."""
+        status = self.ensure(token)
+        if status['status'] != 'ready':
+            return status, None, False
+        key = self.store.content_key(token)
+        matches, truncated = search_index(self.index_path(key), query, limit)
+        return status, matches, truncated
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _build(self, token, key, db_key):
+        build = self._builds[key]
+        build.update(status='building', started=time.time())
+        db_path = self.store.resolve(token)
+        index_path = self.index_path(key)
+
+        # Newest earlier snapshot of the same database that has an index
+        base = next(
+            (self.index_path(k) for k in self.store.object_keys(db_key)
+             if k != key and os.path.exists(self.index_path(k))),
+            None,
+        )
+
+        def on_progress(done, total):
+            build['progress'] = round(done / total, 3) if total else 1
+
+        try:
+            if db_path is None:
+                raise RuntimeError('Snapshot was evicted')
+            with metrics.span('search_index_build', incremental=base is not None) as span:
+                stats = build_index(db_path, index_path, base, self.chunk_rows, on_progress)
+                span.fields.update(stats)
+        except Exception as e:
+            print(f"Search index for {token} failed: {e}")
+            with self._lock:
+                build.update(status='failed', error=str(e))
+            return
+
+        if not self.store.update_size(key):
+            # Snapshot evicted while we were indexing it
+            os.remove(index_path)
+            with self._lock:
+                self._builds.pop(key, None)
+            return
+        print(f"Search index for {token}: {stats}")
+        with self._lock:
+            build.update(status='ready', progress=1, stats=stats)
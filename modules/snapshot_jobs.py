@@ -0,0 +1,167 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+class SnapshotTask:
+    """One database to pull as part of a job."""
+
+    def __init__(self, job, device_id, package_name, db_name):
+        self.job = job
+        self.device_id = device_id
+        self.package_name = package_name
+        self.db_name = db_name
+        self.status = 'pending'  # pending, running, done, failed
+        self.token = None
+        self.bytes = 0
+        self.error = None
+        self.started = None
+        self.finished = None
+
+    def to_dict(self):
+        elapsed = None
+        if self.started:
+            elapsed = round((self.finished or time.time()) - self.started, 3)
+        return {
+            'device_id': self.device_id,
+            'package_name': self.package_name,
+            'db_name': self.db_name,
+            'status': self.status,
+            'token': self.token,
+            'bytes': self.bytes,
+            'elapsed': elapsed,
+            'error': self.error,
+        }
+
+
+class SnapshotJob:
+    def __init__(self, targets, mode):
+        self.id = uuid.uuid4().hex
+        self.mode = mode
+        self.created = time.time()
+        self.finished = None
+        self.tasks = [SnapshotTask(self, *target) for target in targets]
+
+    def to_dict(self, with_tasks=True):
+        counts = {'pending': 0, 'running': 0, 'done': 0, 'failed': 0}
+        for task in self.tasks:
+            counts[task.status] += 1
+        started = [t.started for t in self.tasks if t.started]
+        total_bytes = sum(t.bytes for t in self.tasks)
+        elapsed = (self.finished or time.time()) - min(started) if started else 0
+
+        if counts['pending'] + counts['running']:
+            status = 'running' if started else 'queued'
+        else:
+            status = 'failed' if counts['failed'] == len(self.tasks) else 'done'
+
+        result = {
+            'id': self.id,
+            'status': status,
+            'mode': self.mode,
+            'total': len(self.tasks),
+            **counts,
+            'bytes': total_bytes,
+            'elapsed': round(elapsed, 3),
+            'throughput': round(total_bytes / elapsed) if elapsed > 0 else 0,  # bytes/s
+            'errors': [
+                {'device_id': t.device_id, 'db_name': t.db_name, 'error': t.error}
+                for t in self.tasks if t.status == 'failed'
+            ],
+        }
+        if with_tasks:
+            result['tasks'] = [t.to_dict() for t in self.tasks]
+        return result
+
+
+class SnapshotJobRunner:
+    """Runs snapshot jobs in the background on a bounded set of worker threads.
+
+    At most `max_workers` pulls run at once, and at most `per_device` of them on
+    the same device (adb throughput per device is limited, and a device busy
+    with one app's pulls should not hold up the others).
+
+    pull(device_id, package_name, db_name, mode) must return (token, transfer)
+    or (None, None | {'error'}), like the app's pull_snapshot().
+    """
+
+    def __init__(self, pull, max_workers=4, per_device=2, keep_jobs=50):
+        self.pull = pull
+        self.max_workers = max_workers
+        self.per_device = per_device
+        self.keep_jobs = keep_jobs
+        self._jobs = OrderedDict()
+        self._queue = []
+        self._running = {}  # device_id -> running pulls
+        self._workers = []
+        self._cond = threading.Condition()
+
+    def submit(self, targets, mode='full'):
+        """Queue (device_id, package_name, db_name) targets as one job and return it."""
+        job = SnapshotJob(targets, mode)
+        with self._cond:
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.keep_jobs:
+                self._jobs.popitem(last=False)
+            self._queue.extend(job.tasks)
+            # Workers are started on demand and stay around for later jobs
+            while len(self._workers) < min(self.max_workers, len(self._queue) + self._busy()):
+                worker = threading.Thread(target=self._work, daemon=True)
+                self._workers.append(worker)
+                worker.start()
+            self._cond.notify_all()
+        return job
+
+    def get(self, job_id):
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def jobs(self):
+        with self._cond:
+            return list(self._jobs.values())
+
+    def _busy(self):
+        return sum(self._running.values())
+
+    def _next_task(self):
+        # Caller holds self._cond. First queued task whose device has a free slot.
+        for i, task in enumerate(self._queue):
+            if self._running.get(task.device_id, 0) < self.per_device:
+                return self._queue.pop(i)
+        return None
+
+    def _work(self):
+        while True:
+            with self._cond:
+                task = self._next_task()
+                while task is None:
+                    self._cond.wait()
+                    task = self._next_task()
+                self._running[task.device_id] = self._running.get(task.device_id, 0) + 1
+                task.status = 'running'
+                task.started = time.time()
+            try:
+                self._run(task)
+            finally:
+                with self._cond:
+                    self._running[task.device_id] -= 1
+                    if all(t.status in ('done', 'failed') for t in task.job.tasks):
+                        task.job.finished = time.time()
+                    self._cond.notify_all()
+
+    def _run(self, task):
+        try:
+            token, transfer = self.pull(task.device_id, task.package_name, task.db_name, task.job.mode)
+        except Exception as e:
+            print(f"Snapshot job {task.job.id}: {task.db_name} on {task.device_id} failed: {e}")
+            token, transfer, task.error = None, None, str(e)
+
+        task.finished = time.time()
+        if token:
+            task.token = token
+            task.bytes = (transfer or {}).get('bytes', 0)
+            task.status = 'done'
+        else:
+            task.error = task.error or (transfer or {}).get('error') or 'Failed to pull database'
+            task.status = 'failed'
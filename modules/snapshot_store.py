@@ -0,0 +1,391 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import sqlite3
+import threading
+
+from modules.db_manager import sqlite_uri
+from modules.wal_reader import preserve_wal
+
+
+class SnapshotStore:
+    """Content-addressed storage for pulled database snapshots.
+
+    Layout under root_dir:
+        staging/<token>       pull target (+ -wal/-shm), moved or dropped on ingest
+        objects/<key>.db      one copy per distinct content (+ -wal/-shm and sidecars)
+        objects/<key>.wal     the pulled WAL, and in <key>.walbase the pages it
+                              overwrote (keep_wal, see wal_reader.WalTimeline)
+        work/<token>.db       writable copies made with fork()
+        index.json            token -> object key, object sizes and access times
+
+    Identical pulls map to the same object, so Monitor ticks that see no change
+    cost no extra disk. Each database keeps its `keep_per_db` newest tokens, and
+    objects are evicted least-recently-used once the store exceeds `max_bytes`.
+
+    Objects never change once stored (readers open them immutable), so
+    anything that modifies a database works on a fork: a private copy under
+    its own token. The newest `keep_work` forks are kept, outside the budget.
+    """
+
+    HASH_CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, root_dir, keep_per_db=3, max_bytes=2 * 1024 ** 3, prepare=None, on_evict=None, keep_work=5,
+                 keep_wal=False, on_forget=None):
+        self.root_dir = root_dir
+        self.keep_per_db = keep_per_db
+        self.max_bytes = max_bytes
+        self.keep_work = keep_work
+        # Save the WAL of each pull before prepare() checkpoints it
+        self.keep_wal = keep_wal
+        # prepare(path): run once on every new object before it becomes visible
+        # on_evict(path): called before an object's files are deleted
+        # on_forget(db_key): called once the last token of a database is gone
+        self.prepare = prepare
+        self.on_evict = on_evict
+        self.on_forget = on_forget
+        self.staging_dir = os.path.join(root_dir, 'staging')
+        self.objects_dir = os.path.join(root_dir, 'objects')
+        self.work_dir = os.path.join(root_dir, 'work')
+        self.index_path = os.path.join(root_dir, 'index.json')
+        self._lock = threading.RLock()
+        # Files we could not delete yet (still open somewhere, e.g. on Windows)
+        self._pending_deletes = set()
+
+        # Leftovers from an interrupted pull are useless
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+        os.makedirs(self.staging_dir, exist_ok=True)
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.work_dir, exist_ok=True)
+        self._index = self._load_index()
+
+    # --- Paths ---
+
+    def staging_path(self, token):
+        """Where a pull for `token` should write before calling ingest()."""
+        return os.path.join(self.staging_dir, token)
+
+    def object_path(self, key):
+        return os.path.join(self.objects_dir, f"{key}.db")
+
+    def work_path(self, token):
+        return os.path.join(self.work_dir, f"{token}.db")
+
+    def sidecar_path(self, key, extension):
+        """A derived file (e.g. a search index) stored and evicted with an object."""
+        return os.path.join(self.objects_dir, f"{key}.{extension}")
+
+    # --- Public API ---
+
+    def ingest(self, db_key, token, staging_path):
+        """Register a finished pull under `token` and return the snapshot path.
+
+        db_key identifies the source database (device, package, name) for the
+        per-database retention policy.
+        """
+        key = self._content_hash(staging_path)
+        now = time.time()
+
+        with self._lock:
+            objects = self._index['objects']
+            if key in objects and os.path.exists(self.object_path(key)):
+                # Same bytes as an existing snapshot: keep the stored copy
+                self._remove_files(staging_path)
+            else:
+                target = self.object_path(key)
+                try:
+                    for suffix in ('', '-wal', '-shm'):
+                        src = f"{staging_path}{suffix}"
+                        if os.path.exists(src):
+                            os.replace(src, f"{target}{suffix}")
+                    if self.keep_wal:
+                        try:
+                            preserve_wal(target, self.sidecar_path(key, 'wal'), self.sidecar_path(key, 'walbase'))
+                        except OSError as e:
+                            print(f"Cannot keep the WAL of {token}: {e}")
+                    if self.prepare:
+                        self.prepare(target)
+                except Exception:
+                    # Half-stored objects are not in the index: don't leave their files behind
+                    self._delete_object_files(key)
+                    raise
+                objects[key] = {'size': self._object_size(key), 'last_access': now}
+
+            objects[key]['last_access'] = now
+            self._index['tokens'][token] = {'key': key, 'db': db_key, 'created': now}
+
+            self._apply_retention(db_key)
+            self._apply_budget(protect=key)
+            self._retry_pending_deletes()
+            self._save_index()
+            return self.object_path(key)
+
+    def discard_staging(self, token):
+        """Delete what a failed pull left at staging_path(token)."""
+        path = self.staging_path(token)
+        with self._lock:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(f"{path}{suffix}"):
+                    self._delete(f"{path}{suffix}")
+
+    def resolve(self, token):
+        """Return the snapshot path for a token, or None if it is unknown or evicted."""
+        with self._lock:
+            if token in self._index['work']:
+                path = self.work_path(token)
+                return path if os.path.exists(path) else None
+            entry = self._index['tokens'].get(token)
+            if not entry:
+                return None
+            obj = self._index['objects'].get(entry['key'])
+            path = self.object_path(entry['key'])
+            if obj is None or not os.path.exists(path):
+                return None
+            obj['last_access'] = time.time()
+            return path
+
+    def content_key(self, token):
+        """The content hash a token points to (same bytes -> same key)."""
+        with self._lock:
+            entry = self._index['tokens'].get(token)
+            return entry['key'] if entry else None
+
+    def db_key(self, token):
+        """The source database (db_key given to ingest) of a token."""
+        with self._lock:
+            entry = self._index['tokens'].get(token) or self._index['work'].get(token)
+            return entry['db'] if entry else None
+
+    # --- Writable copies ---
+
+    def fork(self, token):
+        """Copy a snapshot (or another fork) to a new writable fork. Returns its token, or None."""
+        with self._lock:
+            source = self.resolve(token)
+            db_key = self.db_key(token)
+        if source is None:
+            return None
+
+        fork_token = f"{db_key}_work_{int(time.time() * 1000)}"
+        target = self.work_path(fork_token)
+        # The backup API copies a consistent state even if the source is a fork
+        # that is being written to
+        try:
+            src = sqlite3.connect(sqlite_uri(source, mode='ro'), uri=True)
+            dst = sqlite3.connect(target)
+            try:
+                src.backup(dst)
+            finally:
+                src.close()
+                dst.close()
+        except sqlite3.Error as e:
+            print(f"Cannot fork {token}: {e}")
+            self._delete(target)
+            return None
+        with self._lock:
+            self._index['work'][fork_token] = {'db': db_key, 'source': token, 'created': time.time()}
+            forks = sorted((e['created'], t) for t, e in self._index['work'].items())
+            for _, old_token in forks[:-self.keep_work] if self.keep_work > 0 else []:
+                self._drop_fork(old_token)
+            self._save_index()
+        return fork_token
+
+    def is_fork(self, token):
+        with self._lock:
+            return token in self._index['work']
+
+    def drop_fork(self, token):
+        with self._lock:
+            if token not in self._index['work']:
+                return False
+            self._drop_fork(token)
+            self._save_index()
+            return True
+
+    def _drop_fork(self, token):
+        del self._index['work'][token]
+        path = self.work_path(token)
+        if self.on_evict:
+            self.on_evict(path)
+        for suffix in ('', '-journal', '-wal', '-shm'):
+            if os.path.exists(f"{path}{suffix}"):
+                self._delete(f"{path}{suffix}")
+
+    def object_keys(self, db_key):
+        """Content keys of a source database's snapshots, newest first."""
+        with self._lock:
+            entries = sorted(
+                ((e['created'], e['key']) for e in self._index['tokens'].values() if e['db'] == db_key),
+                reverse=True,
+            )
+            return list(dict.fromkeys(key for _, key in entries))
+
+    def update_size(self, key):
+        """Recount an object's bytes after a sidecar was added, and enforce the budget.
+
+        Returns False if the object was evicted in the meantime (the caller
+        should then delete its sidecar, nothing else will).
+        """
+        with self._lock:
+            obj = self._index['objects'].get(key)
+            if obj is None:
+                return False
+            obj['size'] = self._object_size(key)
+            self._apply_budget(protect=key)
+            self._save_index()
+            return True
+
+    def db_keys(self):
+        """Source databases that still have snapshots."""
+        with self._lock:
+            return {e['db'] for e in self._index['tokens'].values()}
+
+    def latest_token(self, db_key):
+        """Newest token for a source database, or None."""
+        with self._lock:
+            tokens = [(e['created'], t) for t, e in self._index['tokens'].items() if e['db'] == db_key]
+            return max(tokens)[1] if tokens else None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'tokens': len(self._index['tokens']),
+                'objects': len(self._index['objects']),
+                'forks': len(self._index['work']),
+                'bytes': sum(o['size'] for o in self._index['objects'].values()),
+                'max_bytes': self.max_bytes,
+            }
+
+    # --- Eviction ---
+
+    def _apply_retention(self, db_key):
+        tokens = sorted(
+            (e['created'], t) for t, e in self._index['tokens'].items() if e['db'] == db_key
+        )
+        for _, token in tokens[:-self.keep_per_db] if self.keep_per_db > 0 else tokens:
+            del self._index['tokens'][token]
+        self._drop_unreferenced()
+        self._forget_if_gone({db_key})
+
+    def _apply_budget(self, protect=None):
+        objects = self._index['objects']
+        total = sum(o['size'] for o in objects.values())
+        for key in sorted(objects, key=lambda k: objects[k]['last_access']):
+            if total <= self.max_bytes:
+                break
+            if key == protect:
+                continue
+            total -= objects[key]['size']
+            self._evict_object(key)
+
+    def _drop_unreferenced(self):
+        referenced = {e['key'] for e in self._index['tokens'].values()}
+        for key in list(self._index['objects']):
+            if key not in referenced:
+                self._evict_object(key)
+
+    def _evict_object(self, key):
+        self._index['objects'].pop(key, None)
+        if self.on_evict:
+            self.on_evict(self.object_path(key))
+        tokens = [t for t, e in self._index['tokens'].items() if e['key'] == key]
+        db_keys = {self._index['tokens'][t]['db'] for t in tokens}
+        for token in tokens:
+            del self._index['tokens'][token]
+        self._forget_if_gone(db_keys)
+        self._delete_object_files(key)
+
+    def _delete_object_files(self, key):
+        # The object file, its -wal/-shm and any sidecar files named <key>.*
+        prefix = f"{key}."
+        for filename in os.listdir(self.objects_dir):
+            if filename.startswith(prefix):
+                self._delete(os.path.join(self.objects_dir, filename))
+
+    def _forget_if_gone(self, db_keys):
+        if not self.on_forget:
+            return
+        remaining = {e['db'] for e in self._index['tokens'].values()}
+        for db_key in db_keys - remaining:
+            self.on_forget(db_key)
+
+    def _delete(self, path):
+        try:
+            os.remove(path)
+            self._pending_deletes.discard(path)
+        except FileNotFoundError:
+            self._pending_deletes.discard(path)
+        except OSError as e:
+            # Still open (Windows locks open files); try again on a later ingest
+            print(f"Snapshot cleanup deferred for {path}: {e}")
+            self._pending_deletes.add(path)
+
+    def _retry_pending_deletes(self):
+        for path in list(self._pending_deletes):
+            self._delete(path)
+
+    # --- Helpers ---
+
+    def _content_hash(self, staging_path):
+        """sha256 over the main file and WAL. The -shm is only an index rebuilt from
+        the WAL, and differs between otherwise identical pulls, so it is left out."""
+        digest = hashlib.sha256()
+        for suffix in ('', '-wal'):
+            path = f"{staging_path}{suffix}"
+            digest.update(suffix.encode('ascii') + b'\0')
+            if not os.path.exists(path):
+                continue
+            with open(path, 'rb') as f:
+                while True:
+                    chunk = f.read(self.HASH_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+        return digest.hexdigest()
+
+    def _object_size(self, key):
+        prefix = f"{key}."
+        return sum(
+            os.path.getsize(os.path.join(self.objects_dir, f))
+            for f in os.listdir(self.objects_dir) if f.startswith(prefix)
+        )
+
+    @staticmethod
+    def _remove_files(path):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(f"{path}{suffix}"):
+                os.remove(f"{path}{suffix}")
+
+    def _load_index(self):
+        index = {'tokens': {}, 'objects': {}, 'work': {}}
+        try:
+            with open(self.index_path, 'r') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+        # Drop entries whose files disappeared (manual cleanup, crash...)
+        objects = {k: o for k, o in index.get('objects', {}).items() if os.path.exists(self.object_path(k))}
+        tokens = {t: e for t, e in index.get('tokens', {}).items() if e.get('key') in objects}
+        work = {t: e for t, e in index.get('work', {}).items() if os.path.exists(self.work_path(t))}
+
+        # ...and files the index does not know about (e.g. index lost in a crash)
+        for filename in os.listdir(self.objects_dir):
+            if filename.split('.', 1)[0] not in objects:
+                self._delete(os.path.join(self.objects_dir, filename))
+        for filename in os.listdir(self.work_dir):
+            # Tokens may contain dots (app.db), so strip the known suffixes
+            token = filename
+            for suffix in ('-journal', '-wal', '-shm', '.db'):
+                token = token[:-len(suffix)] if token.endswith(suffix) else token
+            if token not in work:
+                self._delete(os.path.join(self.work_dir, filename))
+        return {'tokens': tokens, 'objects': objects, 'work': work}
+
+    def _save_index(self):
+        temp_path = f"{self.index_path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(self._index, f)
+        os.replace(temp_path, self.index_path)
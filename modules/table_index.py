@@ -0,0 +1,196 @@
+import os
+import sqlite3
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from modules.db_manager import DBManager, quote_ident, sqlite_uri
+from modules.metrics import metrics
+
+
+def _index_name(table_name, column):
+    digest = hashlib.blake2b(f"{table_name}\0{column}".encode('utf-8'), digest_size=6).hexdigest()
+    return f"adbv_auto_{digest}"
+
+
+def needs_index(conn, table_name, column):
+    """False if a lookup or ORDER BY on `column` can already use an index (the
+    column is the rowid alias, or the first column of an index or of the
+    primary key of a WITHOUT ROWID table), or can't get one (views)."""
+    row = conn.execute("SELECT type FROM sqlite_master WHERE name = ?", (table_name,)).fetchone()
+    if not row or row[0] != 'table':
+        return False
+    table = quote_ident(table_name)
+    info = conn.execute(f"PRAGMA table_info({table})").fetchall()
+    pk = [row[1] for row in sorted(info, key=lambda row: row[5]) if row[5]]
+    if pk and pk[0] == column:
+        return False
+    for index in conn.execute(f"PRAGMA index_list({table})").fetchall():
+        first = conn.execute(f"PRAGMA index_info({quote_ident(index[1])})").fetchone()
+        if first and first[2] == column:
+            return False
+    return True
+
+
+class TableIndexer:
+    """Indexes columns that table views keep sorting or filtering on.
+
+    Snapshots never change, so indexes go into a working copy of the
+    snapshot, a sidecar `<key>.idx` of its store object (stored, counted and
+    evicted with it). Once a (table, column) of a snapshot has been sorted or
+    filtered on `min_uses` times, the worker adds an index for it to the copy
+    and the table views of that snapshot read from the copy from then on.
+
+    Copies are never written in place: new indexes are built in a fresh
+    copy that then replaces the old one, and on_replace(path) is called so
+    pooled connections and cached results of the old file are dropped. All
+    indexes queued for a snapshot by the time the worker gets to it are built
+    in the same copy.
+    """
+
+    def __init__(self, store, min_uses=2, min_rows=10000, max_indexes=8, on_replace=None):
+        self.store = store
+        self.min_uses = min_uses
+        # Scanning a small table is cheaper than copying the snapshot
+        self.min_rows = min_rows
+        self.max_indexes = max_indexes
+        self.on_replace = on_replace
+        self._uses = {}        # (key, table, column) -> count
+        self._handled = set()  # (key, table, column) queued, built or not worth an index
+        self._built = {}       # key -> number of indexes in its copy
+        self._pending = {}     # key -> (token, [(table, column)]) waiting for the worker
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def copy_path(self, key):
+        return self.store.sidecar_path(key, 'idx')
+
+    def read_path(self, token):
+        """The file table views of `token` should read: its indexed working copy
+        if there is one, else the snapshot itself (None if unknown or evicted)."""
+        db_path = self.store.resolve(token)
+        key = self.store.content_key(token)
+        if db_path is None or key is None:
+            return db_path
+        copy = self.copy_path(key)
+        return copy if os.path.exists(copy) else db_path
+
+    def note_use(self, token, table_name, columns):
+        """Record a sort/filter on `columns`; queue an index for those used often enough."""
+        key = self.store.content_key(token)
+        if key is None:
+            # Writable copies change under us: not worth indexing
+            return
+        for column in columns:
+            entry = (key, table_name, column)
+            with self._lock:
+                if entry in self._handled:
+                    continue
+                self._uses[entry] = self._uses.get(entry, 0) + 1
+                queued = len(self._pending[key][1]) if key in self._pending else 0
+                if self._uses[entry] < self.min_uses or self._built.get(key, 0) + queued >= self.max_indexes:
+                    continue
+                self._handled.add(entry)
+                del self._uses[entry]
+                schedule = key not in self._pending
+                self._pending.setdefault(key, (token, []))[1].append((table_name, column))
+            if schedule:
+                self._executor.submit(self._build, key)
+
+    def status(self, token):
+        """Columns indexed in the working copy of `token`, as {table: [columns]}."""
+        key = self.store.content_key(token)
+        if key is None or not os.path.exists(self.copy_path(key)):
+            return {}
+        try:
+            conn = sqlite3.connect(sqlite_uri(self.copy_path(key), mode='ro', immutable=1), uri=True)
+            try:
+                rows = conn.execute(
+                    "SELECT tbl_name, name FROM sqlite_master WHERE type = 'index' AND name LIKE 'adbv_auto_%'"
+                ).fetchall()
+                indexed = {}
+                for table_name, index_name in rows:
+                    first = conn.execute(f"PRAGMA index_info({quote_ident(index_name)})").fetchone()
+                    indexed.setdefault(table_name, []).append(first[2])
+                return indexed
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return {}
+
+    def forget(self, key):
+        """Drop the bookkeeping of an evicted object."""
+        with self._lock:
+            self._handled = {e for e in self._handled if e[0] != key}
+            self._uses = {e: n for e, n in self._uses.items() if e[0] != key}
+            self._built.pop(key, None)
+            self._pending.pop(key, None)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _build(self, key):
+        with self._lock:
+            token, columns = self._pending.pop(key, (None, []))
+        copy = self.copy_path(key)
+        source = copy if os.path.exists(copy) else self.store.resolve(token) if token else None
+        if source is None:
+            return
+        temp = f"{copy}.tmp"
+        try:
+            src = sqlite3.connect(sqlite_uri(source, mode='ro', immutable=1), uri=True)
+            try:
+                columns = [(t, c) for t, c in columns if needs_index(src, t, c)]
+            finally:
+                src.close()
+            db = DBManager(source)
+            row_counts = {t: db.get_row_count(t)[0] for t in {t for t, _ in columns}}
+            columns = [(t, c) for t, c in columns if row_counts[t] >= self.min_rows]
+            if not columns:
+                return
+            names = ', '.join(f"{t}.{c}" for t, c in columns)
+
+            with metrics.span('table_index_build', copy='update' if source == copy else 'new') as span:
+                span.fields.update(indexes=names, rows=sum(row_counts[t] for t in {t for t, _ in columns}))
+                src = sqlite3.connect(sqlite_uri(source, mode='ro', immutable=1), uri=True)
+                dst = sqlite3.connect(temp)
+                try:
+                    src.backup(dst)
+                    for table_name, column in columns:
+                        dst.execute(
+                            f"CREATE INDEX IF NOT EXISTS {_index_name(table_name, column)} "
+                            f"ON {quote_ident(table_name)} ({quote_ident(column)})"
+                        )
+                    has_stats = dst.execute(
+                        "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'"
+                    ).fetchone()
+                    if has_stats:
+                        # The planner weighs indexes by their statistics: give the new ones some
+                        for table_name, column in columns:
+                            dst.execute(f"ANALYZE {_index_name(table_name, column)}")
+                    dst.commit()
+                finally:
+                    dst.close()
+                    src.close()
+
+            # Close pooled handles of the old copy before (Windows can't replace
+            # an open file) and after (anything opened in between)
+            if self.on_replace:
+                self.on_replace(copy)
+            os.replace(temp, copy)
+            if self.on_replace:
+                self.on_replace(copy)
+        except (sqlite3.Error, OSError) as e:
+            print(f"Auto indexes on {', '.join(f'{t}.{c}' for t, c in columns)} for {token} failed: {e}")
+            if os.path.exists(temp):
+                os.remove(temp)
+            return
+
+        if not self.store.update_size(key):
+            # Snapshot evicted while we were copying it
+            os.remove(copy)
+            self.forget(key)
+            return
+        with self._lock:
+            self._built[key] = self._built.get(key, 0) + len(columns)
+        print(f"Auto indexes on {names} added to the working copy of {token}")
@@ -0,0 +1,333 @@
+import os
+import shutil
+import struct
+import sqlite3
+import threading
+
+from modules.db_manager import sqlite_uri
+from modules.metrics import metrics
+
+# WAL layout (https://www.sqlite.org/fileformat2.html#walformat):
+#   32-byte header: magic, version, page size, checkpoint seq, salt-1, salt-2, checksum-1, checksum-2
+#   frames: 24-byte header (page number, db size in pages after commit or 0,
+#           salt-1, salt-2, checksum-1, checksum-2) followed by one page
+WAL_HEADER_SIZE = 32
+FRAME_HEADER_SIZE = 24
+WAL_MAGIC_LE = 0x377f0682  # checksums over little-endian words
+WAL_MAGIC_BE = 0x377f0683  # ... over big-endian words
+
+# Pages of the main file that a WAL overwrites, saved before the checkpoint:
+#   magic, page size, page count, page numbers (uint32 each), then the pages
+BASE_MAGIC = b'ADBVWB01'
+
+
+def _checksum(data, s0, s1, big_endian):
+    words = struct.unpack(f"{'>' if big_endian else '<'}{len(data) // 4}I", data)
+    for i in range(0, len(words), 2):
+        s0 = (s0 + words[i] + s1) & 0xffffffff
+        s1 = (s1 + words[i + 1] + s0) & 0xffffffff
+    return s0, s1
+
+
+def parse_wal(wal_path):
+    """Valid frames and commits of a WAL file, as SQLite's recovery sees them.
+
+    Frames are read while their salts match the header and the checksum chain
+    holds; a torn or stale tail (frames of an older WAL generation, a frame
+    being written during the pull) ends the log. Frames after the last commit
+    belong to an unfinished transaction and are dropped.
+
+    Returns None if there is no valid WAL, else {'page_size', 'header',
+    'frames': [(page, offset of the page data)], 'commits': [{'frame_end',
+    'db_pages', 'checksum'}]} where frame_end is one past the commit frame.
+    """
+    try:
+        f = open(wal_path, 'rb')
+    except OSError:
+        return None
+    with f:
+        header = f.read(WAL_HEADER_SIZE)
+        if len(header) < WAL_HEADER_SIZE:
+            return None
+        magic, _, page_size, _, salt1, salt2, c0, c1 = struct.unpack('>8I', header)
+        if magic not in (WAL_MAGIC_LE, WAL_MAGIC_BE) or page_size < 512 or page_size & (page_size - 1):
+            return None
+        big_endian = magic == WAL_MAGIC_BE
+        if _checksum(header[:24], 0, 0, big_endian) != (c0, c1):
+            return None
+
+        frames, commits = [], []
+        s0, s1 = c0, c1
+        offset = WAL_HEADER_SIZE
+        while True:
+            frame = f.read(FRAME_HEADER_SIZE + page_size)
+            if len(frame) < FRAME_HEADER_SIZE + page_size:
+                break
+            page, db_pages, fsalt1, fsalt2, fc0, fc1 = struct.unpack('>6I', frame[:FRAME_HEADER_SIZE])
+            if (fsalt1, fsalt2) != (salt1, salt2) or page == 0:
+                break
+            s0, s1 = _checksum(frame[:8], s0, s1, big_endian)
+            s0, s1 = _checksum(frame[FRAME_HEADER_SIZE:], s0, s1, big_endian)
+            if (s0, s1) != (fc0, fc1):
+                break
+            frames.append((page, offset + FRAME_HEADER_SIZE))
+            if db_pages:
+                commits.append({'frame_end': len(frames), 'db_pages': db_pages, 'checksum': (s0, s1)})
+            offset += FRAME_HEADER_SIZE + page_size
+
+    if not commits:
+        return None
+    del frames[commits[-1]['frame_end']:]
+    return {'page_size': page_size, 'header': header, 'big_endian': big_endian,
+            'frames': frames, 'commits': commits}
+
+
+def preserve_wal(db_path, wal_sidecar, base_sidecar):
+    """Keep a pulled WAL and the main-file pages it overwrites, before
+    prepare_snapshot() checkpoints it away.
+
+    The WAL is copied as is; the base file holds only the pages of db_path
+    that the checkpoint will replace or cut off, so any commit in the WAL
+    can later be rebuilt on top of the checkpointed snapshot (see
+    WalTimeline). Returns False if there is no usable WAL.
+    """
+    wal_path = f"{db_path}-wal"
+    wal = parse_wal(wal_path)
+    if wal is None:
+        return False
+    page_size = wal['page_size']
+    base_pages = os.path.getsize(db_path) // page_size
+    final_pages = wal['commits'][-1]['db_pages']
+    # Overwritten by a frame, or truncated away by the last commit
+    pages = sorted(
+        {page for page, _ in wal['frames'] if page <= base_pages}
+        | set(range(final_pages + 1, base_pages + 1))
+    )
+    temp_path = f"{base_sidecar}.tmp"
+    with open(db_path, 'rb') as src, open(temp_path, 'wb') as dst:
+        dst.write(BASE_MAGIC + struct.pack('>II', page_size, len(pages)))
+        dst.write(struct.pack(f'>{len(pages)}I', *pages))
+        for page in pages:
+            src.seek((page - 1) * page_size)
+            dst.write(src.read(page_size))
+    os.replace(temp_path, base_sidecar)
+    shutil.copyfile(wal_path, wal_sidecar)
+    return True
+
+
+def _read_base(base_sidecar):
+    """{page: offset in base_sidecar} of a file written by preserve_wal()."""
+    with open(base_sidecar, 'rb') as f:
+        head = f.read(len(BASE_MAGIC) + 8)
+        if head[:len(BASE_MAGIC)] != BASE_MAGIC:
+            raise ValueError(f"{base_sidecar} is not a WAL base file")
+        page_size, count = struct.unpack('>II', head[len(BASE_MAGIC):])
+        pages = struct.unpack(f'>{count}I', f.read(4 * count))
+    start = len(head) + 4 * count
+    return {page: start + i * page_size for i, page in enumerate(pages)}
+
+
+class WalTimeline:
+    """Every commit of a snapshot's preserved WAL, as a read-only database.
+
+    A commit view is a directory holding a hard link to the (checkpointed)
+    snapshot plus a small WAL built for that commit: the original frames up
+    to the commit, then one more transaction that puts back the base version
+    of pages changed only by later commits. SQLite reads a -wal next to a
+    rollback-mode file when it is not opened immutable, so the view shows
+    the database exactly as of that commit without copying it. Views must
+    be opened with db_manager.connect_wal_view() (links share an inode).
+
+    View tokens are "<snapshot token>~wal<n>" (n = commit number from 1).
+    """
+
+    SEPARATOR = '~wal'
+
+    def __init__(self, store, view_dir):
+        self.store = store
+        self.view_dir = view_dir
+        self._parsed = {}     # content key -> parse_wal() result
+        self._page_maps = {}  # content key -> {page: table} of the checkpointed snapshot
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        # Views are cheap to rebuild; leftovers may point at evicted snapshots
+        shutil.rmtree(view_dir, ignore_errors=True)
+        os.makedirs(view_dir, exist_ok=True)
+
+    def wal_path(self, key):
+        return self.store.sidecar_path(key, 'wal')
+
+    def base_path(self, key):
+        return self.store.sidecar_path(key, 'walbase')
+
+    # --- Tokens ---
+
+    def view_token(self, token, commit):
+        return f"{token}{self.SEPARATOR}{commit}"
+
+    def split_token(self, view_token):
+        """(snapshot token, commit number) of a view token, or (None, None)."""
+        token, sep, commit = view_token.rpartition(self.SEPARATOR)
+        if not sep or not commit.isdigit():
+            return None, None
+        return token, int(commit)
+
+    def is_view(self, token):
+        return self.split_token(token)[0] is not None
+
+    # --- Timeline ---
+
+    def _wal(self, key):
+        with self._lock:
+            if key in self._parsed:
+                return self._parsed[key]
+        wal = parse_wal(self.wal_path(key)) if os.path.exists(self.base_path(key)) else None
+        with self._lock:
+            self._parsed[key] = wal
+        return wal
+
+    def commits(self, token):
+        """The commits in a snapshot's WAL, oldest first, with the pages and
+        tables each one changed. None if the token is unknown; [] if the
+        snapshot was pulled without a WAL."""
+        key = self.store.content_key(token)
+        if key is None or self.store.resolve(token) is None:
+            return None
+        wal = self._wal(key)
+        if wal is None:
+            return []
+        page_map = self._page_map(key)
+        result, start = [], 0
+        for n, commit in enumerate(wal['commits'], 1):
+            pages = sorted({page for page, _ in wal['frames'][start:commit['frame_end']]})
+            tables = {}
+            for page in pages:
+                name = page_map.get(page, '(free)')
+                tables[name] = tables.get(name, 0) + 1
+            result.append({
+                'commit': n,
+                'token': self.view_token(token, n),
+                'frames': commit['frame_end'] - start,
+                'db_pages': commit['db_pages'],
+                'pages': pages,
+                'tables': tables,
+            })
+            start = commit['frame_end']
+        return result
+
+    def _page_map(self, key):
+        """{page: table or index} of the snapshot (the state after the last commit)."""
+        with self._lock:
+            if key in self._page_maps:
+                return self._page_maps[key]
+        page_map = {1: 'sqlite_schema'}
+        conn = sqlite3.connect(sqlite_uri(self.store.object_path(key), mode='ro', immutable=1), uri=True)
+        try:
+            try:
+                # Every page, overflow pages included (needs SQLITE_ENABLE_DBSTAT_VTAB)
+                for name, page in conn.execute("SELECT name, pageno FROM dbstat"):
+                    page_map[page] = name
+            except sqlite3.Error:
+                # Without dbstat only the root page of each b-tree is known
+                for name, page in conn.execute("SELECT name, rootpage FROM sqlite_master WHERE rootpage > 0"):
+                    page_map[page] = name
+        finally:
+            conn.close()
+        with self._lock:
+            self._page_maps[key] = page_map
+        return page_map
+
+    # --- Views ---
+
+    def resolve(self, view_token):
+        """Path of the database file of a commit view (built on first use), or None."""
+        token, commit = self.split_token(view_token)
+        if token is None:
+            return None
+        key = self.store.content_key(token)
+        db_path = self.store.resolve(token) if key else None
+        wal = self._wal(key) if db_path else None
+        if wal is None or not 1 <= commit <= len(wal['commits']):
+            return None
+
+        view_path = os.path.join(self.view_dir, f"{key}_{commit}", 'view.db')
+        with self._build_lock:
+            if os.path.exists(f"{view_path}-wal"):
+                return view_path
+            with metrics.span('wal_view_build') as span:
+                try:
+                    self._build_view(key, db_path, wal, commit, view_path)
+                except (OSError, ValueError) as e:
+                    print(f"Cannot build WAL view {view_token}: {e}")
+                    span.fail(e)
+                    shutil.rmtree(os.path.dirname(view_path), ignore_errors=True)
+                    return None
+        return view_path
+
+    def _build_view(self, key, db_path, wal, commit, view_path):
+        os.makedirs(os.path.dirname(view_path), exist_ok=True)
+        try:
+            # Readers open views read-only, so the shared file is never written
+            os.link(db_path, view_path)
+        except OSError:
+            shutil.copyfile(db_path, view_path)
+
+        page_size = wal['page_size']
+        frame_size = FRAME_HEADER_SIZE + page_size
+        target = wal['commits'][commit - 1]
+        frame_end = target['frame_end']
+        # Pages that exist at this commit but were not written up to it, and
+        # were either written by a later commit (the snapshot holds their later
+        # version) or cut off when a later commit shrank the database
+        written = {page for page, _ in wal['frames'][:frame_end]}
+        snapshot_pages = os.path.getsize(db_path) // page_size
+        restore = sorted({
+            page for page, _ in wal['frames'][frame_end:]
+            if page not in written and page <= target['db_pages']
+        } | {
+            page for page in range(snapshot_pages + 1, target['db_pages'] + 1)
+            if page not in written
+        })
+        base = _read_base(self.base_path(key)) if restore else {}
+
+        temp_path = f"{view_path}-wal.tmp"
+        with open(self.wal_path(key), 'rb') as src, open(temp_path, 'wb') as dst:
+            # Original header and frames: their checksum chain stays valid
+            remaining = WAL_HEADER_SIZE + frame_end * frame_size
+            while remaining:
+                chunk = src.read(min(remaining, 1024 * 1024))
+                if not chunk:
+                    raise ValueError('WAL sidecar is shorter than its index')
+                dst.write(chunk)
+                remaining -= len(chunk)
+
+            _, _, _, _, salt1, salt2, _, _ = struct.unpack('>8I', wal['header'])
+            s0, s1 = target['checksum']
+            with open(self.base_path(key), 'rb') as base_file:
+                for i, page in enumerate(restore):
+                    if page not in base:
+                        raise ValueError(f"Base version of page {page} is missing")
+                    base_file.seek(base[page])
+                    data = base_file.read(page_size)
+                    db_pages = target['db_pages'] if i == len(restore) - 1 else 0
+                    head = struct.pack('>2I', page, db_pages)
+                    s0, s1 = _checksum(head, s0, s1, wal['big_endian'])
+                    s0, s1 = _checksum(data, s0, s1, wal['big_endian'])
+                    dst.write(head + struct.pack('>4I', salt1, salt2, s0, s1) + data)
+        os.replace(temp_path, f"{view_path}-wal")
+
+    def drop(self, key):
+        """Forget an evicted snapshot and delete its views."""
+        with self._lock:
+            self._parsed.pop(key, None)
+            self._page_maps.pop(key, None)
+        for name in os.listdir(self.view_dir):
+            if name.startswith(f"{key}_"):
+                shutil.rmtree(os.path.join(self.view_dir, name), ignore_errors=True)
+
+    def view_paths(self, key):
+        """Database files of the views of a snapshot (to close pooled handles)."""
+        return [
+            os.path.join(self.view_dir, name, 'view.db')
+            for name in os.listdir(self.view_dir) if name.startswith(f"{key}_")
+        ]
@@ -4,7 +4,7 @@ document.addEventListener('DOMContentLoaded', function() {
         deviceId: null,
         package: null,
         dbToken: null,
-        openTabs: {}, // table_name -> { offset, limit, intervalId }
+        openTabs: {}, // table_name -> { cursor, limit, monitor }
     };
 
     // UI Elements
@@ -17,6 +17,9 @@ document.addEventListener('DOMContentLoaded', function() {
     const dbList = document.getElementById('db-list');
     const tableCard = document.getElementById('table-card');
     const tableList = document.getElementById('table-list');
+    const dbSearch = document.getElementById('db-search');
+    const searchResults = document.getElementById('search-results');
+    const writableBadge = document.getElementById('writable-badge');
     
     // Tabs
     const mainTabs = document.getElementById('main-tabs');
@@ -30,6 +33,7 @@ document.addEventListener('DOMContentLoaded', function() {
     let historyCount = 0;
     let isServerOnline = true;
     let healthCheckInterval = null;
+    let watchSource = null; // Shared Monitor EventSource for the open database
 
     // Init CodeMirror
     const editor = CodeMirror.fromTextArea(document.getElementById('sql-editor'), {
@@ -59,6 +63,8 @@ document.addEventListener('DOMContentLoaded', function() {
     // --- Server Health Check ---
 
     async function checkServerHealth() {
+        // While the Monitor event stream is open it tells us about disconnects
+        if (watchSource && watchSource.readyState !== EventSource.CLOSED) return;
         try {
             const controller = new AbortController();
             const timeoutId = setTimeout(() => controller.abort(), 2000); // 2s timeout
@@ -124,11 +130,17 @@ document.addEventListener('DOMContentLoaded', function() {
 
         // Initialize state
         state.openTabs[tableName] = {
-            offset: 0,
+            cursor: '',         // Keyset cursor of the current page ('' = first page)
+            prevCursors: [],    // Cursors of the pages before this one, for "Previous"
+            nextCursor: null,
             limit: 50,
-            intervalId: null,
+            sort: null,         // Column the server sorts by (null = row order)
+            order: 'asc',
+            filters: [],        // [{column, op, value}], applied by the server
             monitor: false,
-            lastRows: null // Store last data for comparison
+            lastRows: null, // Store last data for comparison
+            lastKeys: null, // Row keys of lastRows (null for views)
+            lastToken: null // Snapshot lastRows were read from, the base for /api/diff
         };
 
         // Create Tab Button
@@ -159,15 +171,41 @@ document.addEventListener('DOMContentLoaded', function() {
             <div class="mb-3 d-flex justify-content-between align-items-center bg-light p-2 rounded">
                 <div class="d-flex align-items-center gap-3">
                     <h5 class="mb-0 text-primary">${tableName}</h5>
-                    <div class="form-check form-switch mb-0" title="Auto-refresh every 3 seconds">
+                    <div class="form-check form-switch mb-0" title="Update live when the database changes on the device">
                         <input class="form-check-input" type="checkbox" id="monitor-${tableName}">
                         <label class="form-check-label" for="monitor-${tableName}">Monitor</label>
                     </div>
                 </div>
-                <div>
+                <div class="d-flex gap-2">
+                    <div class="btn-group">
+                        <button class="btn btn-sm btn-outline-secondary dropdown-toggle" type="button" data-bs-toggle="dropdown">Export</button>
+                        <ul class="dropdown-menu dropdown-menu-end">
+                            <li><a class="dropdown-item" href="#" onclick="exportTable('${tableName}', 'csv'); return false;">CSV</a></li>
+                            <li><a class="dropdown-item" href="#" onclick="exportTable('${tableName}', 'jsonl'); return false;">JSON Lines</a></li>
+                            <li><a class="dropdown-item" href="#" onclick="exportTable('${tableName}', 'xlsx'); return false;">Excel (XLSX)</a></li>
+                            <li><a class="dropdown-item" href="#" onclick="exportTable('${tableName}', 'sql'); return false;">SQL dump</a></li>
+                        </ul>
+                    </div>
                     <button class="btn btn-sm btn-outline-secondary" onclick="refreshTab('${tableName}')">Refresh</button>
                 </div>
             </div>
+            <div class="d-flex gap-2 mb-2 align-items-center" id="filter-bar-${tableName}">
+                <select class="form-select form-select-sm w-auto" id="filter-column-${tableName}"></select>
+                <select class="form-select form-select-sm w-auto" id="filter-op-${tableName}">
+                    <option value="contains">contains</option>
+                    <option value="=">=</option>
+                    <option value="!=">&ne;</option>
+                    <option value="<">&lt;</option>
+                    <option value="<=">&le;</option>
+                    <option value=">">&gt;</option>
+                    <option value=">=">&ge;</option>
+                    <option value="is_null">is NULL</option>
+                    <option value="not_null">is not NULL</option>
+                </select>
+                <input type="text" class="form-control form-control-sm w-auto" id="filter-value-${tableName}" placeholder="Value">
+                <button class="btn btn-sm btn-outline-primary" onclick="addTableFilter('${tableName}')">Filter</button>
+                <div class="d-flex gap-1 flex-wrap" id="filter-chips-${tableName}"></div>
+            </div>
             <div class="table-responsive" id="data-${tableName}">
                 <div class="p-3">Loading data...</div>
             </div>
@@ -181,6 +219,10 @@ document.addEventListener('DOMContentLoaded', function() {
         `;
         tabContent.appendChild(div);
 
+        div.querySelector(`#filter-value-${tableName}`).addEventListener('keyup', (e) => {
+            if (e.key === 'Enter') addTableFilter(tableName);
+        });
+
         // Bind Monitor Event
         const monitorCheck = div.querySelector(`#monitor-${tableName}`);
         monitorCheck.addEventListener('change', (e) => {
@@ -197,11 +239,10 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     window.closeTab = function(tableName) {
-        // Clear interval
-        if (state.openTabs[tableName].intervalId) {
-            clearInterval(state.openTabs[tableName].intervalId);
-        }
         delete state.openTabs[tableName];
+        if (monitoredTabs().length === 0) {
+            stopWatching();
+        }
 
         // Remove DOM
         const tabBtn = document.getElementById(`tab-${tableName}`);
@@ -227,15 +268,111 @@ document.addEventListener('DOMContentLoaded', function() {
         pullAndFetch(tableName);
     };
 
+    // The server streams the file; the browser saves it as a normal download
+    window.exportTable = function(tableName, format) {
+        const link = document.createElement('a');
+        link.href = `/api/export/${state.dbToken}/${encodeURIComponent(tableName)}?format=${format}`;
+        document.body.appendChild(link);
+        link.click();
+        link.remove();
+    };
+
+    // Sorting and filtering run on the server; both restart from the first page
+    function resetPaging(tabState) {
+        tabState.cursor = '';
+        tabState.prevCursors = [];
+        tabState.nextCursor = null;
+        tabState.lastRows = null;
+    }
+
+    window.sortTable = function(tableName, column) {
+        const tabState = state.openTabs[tableName];
+        if (!tabState) return;
+        // Cycle: ascending -> descending -> unsorted
+        if (tabState.sort !== column) {
+            tabState.sort = column;
+            tabState.order = 'asc';
+        } else if (tabState.order === 'asc') {
+            tabState.order = 'desc';
+        } else {
+            tabState.sort = null;
+            tabState.order = 'asc';
+        }
+        resetPaging(tabState);
+        fetchTableData(tableName);
+    };
+
+    window.addTableFilter = function(tableName) {
+        const tabState = state.openTabs[tableName];
+        if (!tabState) return;
+        const column = document.getElementById(`filter-column-${tableName}`).value;
+        const op = document.getElementById(`filter-op-${tableName}`).value;
+        const input = document.getElementById(`filter-value-${tableName}`);
+        if (!column) return;
+        let value = input.value;
+        // Numbers compare as numbers (SQLite converts them for TEXT columns)
+        if (op !== 'contains' && value.trim() !== '' && !isNaN(Number(value))) {
+            value = Number(value);
+        }
+        tabState.filters.push({column, op, value});
+        input.value = '';
+        resetPaging(tabState);
+        renderFilterChips(tableName);
+        fetchTableData(tableName);
+    };
+
+    window.removeTableFilter = function(tableName, index) {
+        const tabState = state.openTabs[tableName];
+        if (!tabState) return;
+        tabState.filters.splice(index, 1);
+        resetPaging(tabState);
+        renderFilterChips(tableName);
+        fetchTableData(tableName);
+    };
+
+    function renderFilterChips(tableName) {
+        const tabState = state.openTabs[tableName];
+        const chips = document.getElementById(`filter-chips-${tableName}`);
+        chips.innerHTML = '';
+        tabState.filters.forEach((f, idx) => {
+            const chip = document.createElement('span');
+            chip.className = 'badge bg-secondary d-flex align-items-center gap-1';
+            chip.textContent = ['is_null', 'not_null'].includes(f.op)
+                ? `${f.column} ${f.op === 'is_null' ? 'is NULL' : 'is not NULL'}`
+                : `${f.column} ${f.op} ${f.value}`;
+            const close = document.createElement('span');
+            close.className = 'close-tab';
+            close.innerHTML = '&times;';
+            close.onclick = () => removeTableFilter(tableName, idx);
+            chip.appendChild(close);
+            chips.appendChild(chip);
+        });
+    }
+
+    function fillFilterColumns(tableName, columns) {
+        const select = document.getElementById(`filter-column-${tableName}`);
+        if (!select || select.options.length || !columns) return;
+        columns.forEach(col => {
+            const option = document.createElement('option');
+            option.value = col;
+            option.textContent = col;
+            select.appendChild(option);
+        });
+    }
+
     window.changePage = function(tableName, direction) {
         const tabState = state.openTabs[tableName];
         if (!tabState) return;
 
-        if (direction === -1 && tabState.offset > 0) {
-            tabState.offset -= tabState.limit;
-        } else if (direction === 1) {
-            tabState.offset += tabState.limit;
+        if (direction === -1 && tabState.prevCursors.length > 0) {
+            tabState.cursor = tabState.prevCursors.pop();
+        } else if (direction === 1 && tabState.nextCursor) {
+            tabState.prevCursors.push(tabState.cursor);
+            tabState.cursor = tabState.nextCursor;
+        } else {
+            return;
         }
+        tabState.lastRows = null; // New page, nothing to compare against
         fetchTableData(tableName); // Don't pull on page change, just read
     };
 
@@ -245,17 +382,76 @@ document.addEventListener('DOMContentLoaded', function() {
 
         tabState.monitor = enabled;
         if (enabled) {
-            // Initial pull
-            pullAndFetch(tableName);
-            // Poll
-            tabState.intervalId = setInterval(() => {
-                pullAndFetch(tableName);
-            }, 3000);
-        } else {
-            if (tabState.intervalId) {
-                clearInterval(tabState.intervalId);
-                tabState.intervalId = null;
+            // The server watches the database and pushes new snapshots
+            startWatching();
+            syncTableData(tableName);
+        } else if (monitoredTabs().length === 0) {
+            stopWatching();
+        }
+    }
+
+    function monitoredTabs() {
+        return Object.keys(state.openTabs).filter(name => state.openTabs[name].monitor);
+    }
+
+    // One event stream per database, shared by all monitored tabs. The server
+    // stats the file on the device and only pulls when it changed.
+    function startWatching() {
+        if (watchSource || !state.currentDbName) return;
+        const path = [state.deviceId, state.package, state.currentDbName].map(encodeURIComponent).join('/');
+        watchSource = new EventSource(`/api/watch/${path}`);
+
+        watchSource.addEventListener('snapshot', (e) => {
+            const data = JSON.parse(e.data);
+            state.dbToken = data.token;
+            writableBadge.style.display = 'none';
+            monitoredTabs().forEach(name => syncTableData(name));
+        });
+        watchSource.addEventListener('error', (e) => {
+            if (e.data) {
+                // Sent by the server: the database cannot be read anymore
+                const error = JSON.parse(e.data).error;
+                monitoredTabs().forEach(name => stopMonitor(name, error));
+                return;
+            }
+            // Connection lost; EventSource reconnects by itself
+            if (isServerOnline) {
+                isServerOnline = false;
+                updateServerStatus(false);
             }
+        });
+        watchSource.onopen = () => {
+            if (!isServerOnline) {
+                isServerOnline = true;
+                updateServerStatus(true);
+                fetchDevices(true);
+            }
+        };
+    }
+
+    function stopWatching() {
+        if (watchSource) {
+            watchSource.close();
+            watchSource = null;
+        }
+    }
+
+    function stopMonitor(tableName, error) {
+        const tabState = state.openTabs[tableName];
+        if (!tabState || !tabState.monitor) return;
+
+        toggleMonitor(tableName, false);
+        // Uncheck the UI box
+        const monitorCheck = document.getElementById(`monitor-${tableName}`);
+        if (monitorCheck) monitorCheck.checked = false;
+
+        // Replace the table content with the error
+        const container = document.getElementById(`data-${tableName}`);
+        if (container) {
+            container.innerHTML = `<div class="alert alert-warning">
+                <strong>Monitor Stopped:</strong> Failed to pull database (Device disconnected?). 
+                <br><small>${error || 'Unknown error'}</small>
+            </div>`;
         }
     }
 
@@ -274,7 +470,8 @@ document.addEventListener('DOMContentLoaded', function() {
                     body: JSON.stringify({
                         device_id: state.deviceId,
                         package_name: state.package,
-                        db_name: state.currentDbName
+                        db_name: state.currentDbName,
+                        mode: 'delta'
                     })
                 });
 
@@ -284,27 +481,9 @@ document.addEventListener('DOMContentLoaded', function() {
                     const data = await res.json();
                     console.error("Auto-refresh pull failed:", data.error);
                     
-                    // Check for specific errors to stop monitor
                     // Usually 500 means device issues or permissions
                     if (res.status === 500 || res.status === 404) {
-                        const tabState = state.openTabs[tableName];
-                        if (tabState && tabState.monitor) {
-                            // Stop monitoring
-                            toggleMonitor(tableName, false);
-                            // Uncheck the UI box
-                            const monitorCheck = document.getElementById(`monitor-${tableName}`);
-                            if (monitorCheck) monitorCheck.checked = false;
-                            
-                            // Show toast or alert? Maybe just a console log or small UI indication.
-                            // Let's replace the table content with error
-                            const container = document.getElementById(`data-${tableName}`);
-                            if (container) {
-                                container.innerHTML = `<div class="alert alert-warning">
-                                    <strong>Monitor Stopped:</strong> Failed to pull database (Device disconnected?). 
-                                    <br><small>${data.error || 'Unknown error'}</small>
-                                </div>`;
-                            }
-                        }
+                        stopMonitor(tableName, data.error);
                     }
                     return; // Don't fetch data if pull failed
                 }
@@ -313,19 +492,15 @@ document.addEventListener('DOMContentLoaded', function() {
                 const data = await res.json();
                 if (data.success && data.token) {
                     state.dbToken = data.token;
+                    writableBadge.style.display = 'none';
                 }
             }
-            // After pull (or fail), fetch data
-            fetchTableData(tableName);
+            // After pull (or fail), fetch what changed
+            syncTableData(tableName);
         } catch (e) {
             console.error("Auto-refresh pull failed", e);
             // Network error, also stop monitor
-            const tabState = state.openTabs[tableName];
-            if (tabState && tabState.monitor) {
-                toggleMonitor(tableName, false);
-                const monitorCheck = document.getElementById(`monitor-${tableName}`);
-                if (monitorCheck) monitorCheck.checked = false;
-            }
+            stopMonitor(tableName, e.message);
         }
     }
 
@@ -411,11 +586,28 @@ document.addEventListener('DOMContentLoaded', function() {
             // The backend now returns a list of objects {name: '...', debuggable: null}
             const packages = await res.json();
             renderPackages(packages);
+            fetchDebuggableFlags(deviceId, packages);
         } catch (e) {
             packageList.innerHTML = '<div class="text-danger p-2">Error loading packages</div>';
         }
     }
 
+    // One request (and one device-side pass) for the debug badge of every package
+    async function fetchDebuggableFlags(deviceId, packages) {
+        try {
+            const res = await fetch(`/api/packages-debuggable/${deviceId}`);
+            if (!res.ok) return;
+            const flags = await res.json();
+            if (allPackages !== packages) return; // Package list was reloaded meanwhile
+            packages.forEach(p => {
+                p.debuggable = flags[p.name] === true;
+            });
+            filterPackages();
+        } catch (e) {
+            console.error('Error loading debuggable flags', e);
+        }
+    }
+
     async function fetchDatabases(deviceId, pkg) {
         dbList.innerHTML = '<div class="p-2">Loading databases...</div>';
         dbCard.style.display = 'block';
@@ -433,7 +625,20 @@ document.addEventListener('DOMContentLoaded', function() {
         tableList.innerHTML = '<div class="p-2">Pulling database...</div>';
         tableCard.style.display = 'block';
         state.currentDbName = dbName; // Store for auto-refresh
+        stopWatching(); // The event stream belongs to the previous database
         
+        // Show transfer progress for large databases while the pull is running
+        const progressInterval = setInterval(async () => {
+            try {
+                const res = await fetch(`/api/pull/progress/${deviceId}/${pkg}/${dbName}`);
+                const p = await res.json();
+                if (p.active && p.total) {
+                    const pct = Math.floor(p.done * 100 / p.total);
+                    tableList.innerHTML = `<div class="p-2">Pulling ${p.file}... ${pct}% (${(p.done / 1048576).toFixed(1)} / ${(p.total / 1048576).toFixed(1)} MB)</div>`;
+                }
+            } catch (ignore) {}
+        }, 500);
+
         try {
             const res = await fetch('/api/pull', {
                 method: 'POST',
@@ -447,60 +652,116 @@ document.addEventListener('DOMContentLoaded', function() {
             const data = await res.json();
             if (data.success) {
                 state.dbToken = data.token;
+                writableBadge.style.display = 'none';
                 fetchTables(data.token);
+                // Results belong to the previous database
+                dbSearch.value = '';
+                searchDatabase('');
+                if (monitoredTabs().length) {
+                    startWatching();
+                }
             } else {
                 tableList.innerHTML = `<div class="text-danger p-2">${data.error}</div>`;
             }
         } catch (e) {
             tableList.innerHTML = '<div class="text-danger p-2">Error pulling database</div>';
+        } finally {
+            clearInterval(progressInterval);
         }
     }
 
     async function fetchTables(token) {
         try {
-            const res = await fetch(`/api/tables/${token}`);
-            const tables = await res.json();
-            renderTables(tables);
+            // One request for tables, columns, indexes and row counts
+            const res = await fetch(`/api/schema/${token}`);
+            const schema = await res.json();
+            const entries = schema.tables || [];
+            renderTables(entries.filter(t => t.type === 'table').map(t => t.name));
             
-            // Populate autocomplete hints
+            // Populate autocomplete hints (views are queryable too)
             const hintTables = {};
-            // Fetch columns for each table to improve hints
-            // Note: This might be heavy if there are many tables. 
-            // We can do it lazily or just for top tables. 
-            // For now, let's just add table names.
-            tables.forEach(t => {
-                hintTables[t] = [];
+            entries.forEach(t => {
+                hintTables[t.name] = t.columns.map(c => c.name);
             });
             
             // Update editor hints
             editor.setOption("hintOptions", {
                 tables: hintTables
             });
-            
-            // Try to fetch columns for better autocomplete (in background)
-            tables.forEach(async t => {
-                try {
-                    // Reuse the existing table data endpoint with limit=1 to get columns quickly
-                    const res = await fetch(`/api/table/${token}/${t}?limit=1`);
-                    const data = await res.json();
-                    if (data.columns) {
-                        hintTables[t] = data.columns;
-                        // Update hints again with columns
-                        editor.setOption("hintOptions", {
-                            tables: hintTables
-                        });
-                    }
-                } catch(ignore) {}
-            });
 
         } catch (e) {
             tableList.innerHTML = '<div class="text-danger p-2">Error loading tables</div>';
         }
     }
 
-    async function fetchTableData(tableName) {
+    // Ask the server what changed since the snapshot on screen instead of
+    // re-reading the page and comparing it row by row
+    async function syncTableData(tableName) {
+        const tabState = state.openTabs[tableName];
+        if (!tabState) return;
+        const token = state.dbToken;
+        if (!tabState.lastToken || !tabState.lastKeys || tabState.lastToken === token) {
+            return fetchTableData(tableName);
+        }
+
+        const keyOf = key => JSON.stringify(key);
+        // A sorted or filtered page is not a key range the server can diff:
+        // reload it and compare it with the rows on screen by key
+        const reordered = tabState.sort || tabState.filters.length;
+        if (reordered) {
+            const previous = new Map(tabState.lastKeys.map((key, idx) => [keyOf(key), JSON.stringify(tabState.lastRows[idx])]));
+            return fetchTableData(tableName, previous);
+        }
+
+        let diff;
+        try {
+            // Only the keys of the page on screen, however big the table is
+            const res = await fetch(`/api/diff/${tabState.lastToken}/${token}/${encodeURIComponent(tableName)}` +
+                `?page=${tabState.limit}&cursor=${encodeURIComponent(tabState.cursor)}`);
+            diff = await res.json();
+            if (!res.ok) throw new Error(diff.error);
+        } catch (e) {
+            // Old snapshot evicted or no key to compare on: plain reload
+            return fetchTableData(tableName);
+        }
+        tabState.lastToken = token;
+        if (!diff.inserted.length && !diff.updated.length && !diff.deleted.length) {
+            return;
+        }
+
+        const tabBtn = document.getElementById(`tab-${tableName}`);
+        if (tabBtn && !tabBtn.classList.contains('active')) {
+            showTabNotification(tableName);
+        }
+
+        if (!diff.truncated && !diff.schema_changed && !diff.inserted.length && !diff.deleted.length) {
+            // Only updates: patch the rows on screen in place, no page reload
+            const positions = new Map(tabState.lastKeys.map((key, idx) => [keyOf(key), idx]));
+            const changedIndices = [];
+            diff.updated.forEach(u => {
+                const idx = positions.get(keyOf(u.key));
+                if (idx !== undefined) {
+                    tabState.lastRows[idx] = u.row;
+                    changedIndices.push(idx);
+                }
+            });
+            if (changedIndices.length) {
+                const container = document.getElementById(`data-${tableName}`);
+                renderTableData(diff.columns, tabState.lastRows, container, changedIndices, tableName);
+            }
+            return;
+        }
+
+        // Rows were added or removed, so the page moved: reload it and
+        // highlight the changed rows by key, not by position
+        const changedKeys = diff.truncated ? null : new Set(diff.inserted.concat(diff.updated).map(r => keyOf(r.key)));
+        fetchTableData(tableName, changedKeys);
+    }
+
+    async function fetchTableData(tableName, changedKeys = null) {
         const tabState = state.openTabs[tableName];
         if (!tabState) return;
+        const token = state.dbToken;
 
         const container = document.getElementById(`data-${tableName}`);
         // Only show loading if not monitoring (to avoid flicker)
@@ -512,12 +773,22 @@ document.addEventListener('DOMContentLoaded', function() {
             const controller = new AbortController();
             const timeoutId = setTimeout(() => controller.abort(), 10000); // 10s timeout for heavy data
 
-            const res = await fetch(`/api/table/${state.dbToken}/${tableName}?limit=${tabState.limit}&offset=${tabState.offset}`, {
+            let url = `/api/table/${token}/${tableName}?limit=${tabState.limit}&cursor=${encodeURIComponent(tabState.cursor)}`;
+            if (tabState.sort) {
+                url += `&sort=${encodeURIComponent(tabState.sort)}&order=${tabState.order}`;
+            }
+            if (tabState.filters.length) {
+                url += `&filters=${encodeURIComponent(JSON.stringify(tabState.filters))}`;
+            }
+            const res = await fetch(url, {
                 signal: controller.signal
             });
             clearTimeout(timeoutId);
             
             const data = await res.json();
+            if (!res.ok && data.error) {
+                throw new Error(data.error);
+            }
 
             // Check if data is valid
             if (!data || typeof data.rows === 'undefined') {
@@ -528,8 +799,23 @@ document.addEventListener('DOMContentLoaded', function() {
             let changedIndices = [];
             let hasGlobalChange = false;
 
-            if (tabState.lastRows && tabState.monitor) {
-                // Simple index-based comparison
+            if (changedKeys instanceof Map && data.keys) {
+                // Previous rows by key (sorted/filtered pages): new or different rows changed
+                data.keys.forEach((key, idx) => {
+                    if (changedKeys.get(JSON.stringify(key)) !== JSON.stringify(data.rows[idx])) {
+                        changedIndices.push(idx);
+                    }
+                });
+                hasGlobalChange = changedIndices.length > 0 || data.keys.length !== changedKeys.size;
+            } else if (changedKeys && data.keys) {
+                data.keys.forEach((key, idx) => {
+                    if (changedKeys.has(JSON.stringify(key))) {
+                        changedIndices.push(idx);
+                    }
+                });
+                hasGlobalChange = true;
+            } else if (tabState.lastRows && tabState.monitor && !data.keys) {
+                // Views have no row keys: simple index-based comparison
                 if (data.rows && Array.isArray(data.rows)) {
                     data.rows.forEach((row, idx) => {
                         const oldRow = tabState.lastRows[idx];
@@ -550,6 +836,8 @@ document.addEventListener('DOMContentLoaded', function() {
             
             // Update lastRows
             tabState.lastRows = data.rows; // Clone? data.rows is fresh from JSON, so it's fine.
+            tabState.lastKeys = data.keys;
+            tabState.lastToken = token;
 
             // Handle Tab Notification
             if (hasGlobalChange) {
@@ -560,7 +848,9 @@ document.addEventListener('DOMContentLoaded', function() {
                 }
             }
 
-            renderTableData(data.columns, data.rows, container, changedIndices);
+            tabState.nextCursor = data.next_cursor;
+            fillFilterColumns(tableName, data.columns);
+            renderTableData(data.columns, data.rows, container, changedIndices, tableName);
             updatePagination(tableName, data.total);
         } catch (e) {
             console.error(e);
@@ -590,17 +880,49 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
-    async function executeQuery() {
+    // Switch the open database to a private writable copy of the current snapshot
+    async function createWritableCopy() {
+        try {
+            const res = await fetch(`/api/fork/${state.dbToken}`, {method: 'POST'});
+            const data = await res.json();
+            if (!data.success) {
+                alert(data.error || 'Failed to create a writable copy');
+                return false;
+            }
+            // A new pull (Refresh, Monitor) replaces the copy with a fresh snapshot
+            stopWatching();
+            state.dbToken = data.token;
+            writableBadge.style.display = 'inline';
+            fetchTables(data.token);
+            return true;
+        } catch (e) {
+            alert('Failed to create a writable copy');
+            return false;
+        }
+    }
+
+    async function executeQuery(queryText) {
         if (!state.dbToken) {
             alert('Please select a database first.');
             return;
         }
         
-        const query = editor.getValue();
+        const query = queryText || editor.getValue();
         // Don't clear previous result immediately, maybe? 
         // Or we use the history as the main display.
         // Let's clear the "current result" container but add to history.
-        queryResultContainer.innerHTML = '<div class="p-3">Executing...</div>';
+        // The id is ours, so the query can be cancelled while the request is still running
+        const queryId = `q${Date.now()}${Math.random().toString(16).slice(2, 8)}`;
+        queryResultContainer.innerHTML = `
+            <div class="p-3 d-flex align-items-center gap-2">
+                <span>Executing...</span>
+                <button class="btn btn-sm btn-outline-danger">Cancel</button>
+            </div>`;
+        const cancelBtn = queryResultContainer.querySelector('button');
+        cancelBtn.onclick = () => {
+            cancelBtn.disabled = true;
+            fetch(`/api/query/${queryId}/cancel`, {method: 'POST'});
+        };
         
         const startTime = new Date();
 
@@ -608,7 +930,8 @@ document.addEventListener('DOMContentLoaded', function() {
             const res = await fetch(`/api/query/${state.dbToken}`, {
                 method: 'POST',
                 headers: {'Content-Type': 'application/json'},
-                body: JSON.stringify({query: query})
+                // Server-side cursor: first page now, "Load more" reads the rest
+                body: JSON.stringify({query: query, mode: 'cursor', page_size: 200, query_id: queryId})
             });
             const data = await res.json();
             
@@ -634,6 +957,13 @@ document.addEventListener('DOMContentLoaded', function() {
         if (data.error) {
             statusClass = 'text-danger';
             statusText = 'Error';
+            if (data.stats && (data.stats.status === 'cancelled' || data.stats.status === 'timeout')) {
+                statusClass = 'text-warning';
+                statusText = data.stats.status === 'timeout' ? 'Timed out' : 'Cancelled';
+            }
+        }
+        if (data.stats) {
+            statusText += ` (${data.stats.elapsed_ms} ms)`;
         }
 
         const item = document.createElement('div');
@@ -662,18 +992,78 @@ document.addEventListener('DOMContentLoaded', function() {
         const resultContainer = item.querySelector(`#result-${id}`);
         if (data.error) {
             resultContainer.innerHTML = `<div class="alert alert-danger">${data.error}</div>`;
+            if (data.readonly) {
+                // Snapshots are immutable: offer to run the statement on a writable copy
+                const forkBtn = document.createElement('button');
+                forkBtn.className = 'btn btn-sm btn-warning';
+                forkBtn.textContent = 'Create writable copy and run';
+                forkBtn.onclick = async () => {
+                    forkBtn.disabled = true;
+                    if (await createWritableCopy()) {
+                        executeQuery(query);
+                    } else {
+                        forkBtn.disabled = false;
+                    }
+                };
+                resultContainer.appendChild(forkBtn);
+            }
         } else if (data.message) {
             resultContainer.innerHTML = `<div class="alert alert-success">${data.message}</div>`;
         } else {
-            renderTableData(data.columns, data.rows, resultContainer);
+            renderQueryResult(resultContainer, data.columns, data.rows, data);
         }
         
         // Keep history size manageable (e.g. max 10)
         if (queryHistoryContainer.children.length > 10) {
-            queryHistoryContainer.lastElementChild.remove();
+            const removed = queryHistoryContainer.lastElementChild;
+            // Release the server-side cursor of a result nobody can page anymore
+            if (removed.dataset.cursorId) {
+                fetch(`/api/query/cursor/${removed.dataset.cursorId}`, {method: 'DELETE'});
+            }
+            removed.remove();
         }
     }
 
+    function renderQueryResult(container, columns, rows, page) {
+        const item = container.closest('.accordion-item');
+        renderTableData(columns, rows, container);
+
+        const status = document.createElement('div');
+        status.className = 'd-flex align-items-center gap-2 mt-2';
+        let text = `${page.row_count} rows`;
+        if (page.truncated) text += ' (row limit reached)';
+        status.innerHTML = `<small class="text-muted">${text}</small>`;
+
+        if (page.cursor_id) {
+            item.dataset.cursorId = page.cursor_id;
+            const moreBtn = document.createElement('button');
+            moreBtn.className = 'btn btn-sm btn-outline-primary';
+            moreBtn.textContent = 'Load more';
+            moreBtn.onclick = async () => {
+                moreBtn.disabled = true;
+                try {
+                    const res = await fetch(`/api/query/cursor/${page.cursor_id}`, {
+                        method: 'POST',
+                        headers: {'Content-Type': 'application/json'},
+                        body: JSON.stringify({page_size: 200})
+                    });
+                    const next = await res.json();
+                    if (next.error) {
+                        status.innerHTML = `<small class="text-danger">${next.error}</small>`;
+                        return;
+                    }
+                    renderQueryResult(container, columns, rows.concat(next.rows), next);
+                } catch (e) {
+                    moreBtn.disabled = false;
+                }
+            };
+            status.appendChild(moreBtn);
+        } else {
+            delete item.dataset.cursorId;
+        }
+        container.appendChild(status);
+    }
+
     // --- Render Helpers ---
 
     let allPackages = [];
@@ -701,6 +1091,7 @@ document.addEventListener('DOMContentLoaded', function() {
         toRender.forEach(p => {
             const item = document.createElement('a');
             item.className = 'list-group-item list-group-item-action d-flex justify-content-between align-items-center';
+            if (p.name === state.package) item.classList.add('active');
             item.id = `pkg-${p.name}`;
             
             const nameSpan = document.createElement('span');
@@ -724,18 +1115,8 @@ document.addEventListener('DOMContentLoaded', function() {
             };
             packageList.appendChild(item);
             
-            // Trigger check if not known
-            if (p.debuggable === null) {
-                // Check status
-                fetch(`/api/package-debuggable/${state.deviceId}/${p.name}`)
-                    .then(res => res.json())
-                    .then(data => {
-                        p.debuggable = data.debuggable;
-                        updatePackageBadge(badge, data.debuggable);
-                    });
-            } else {
-                updatePackageBadge(badge, p.debuggable);
-            }
+            // Unknown (null) until fetchDebuggableFlags() has answered
+            updatePackageBadge(badge, p.debuggable);
         });
     }
     
@@ -787,15 +1168,143 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
-    function renderTableData(columns, rows, container, changedIndices = []) {
+    // --- Full-text search across all tables ---
+
+    let searchSeq = 0; // Only the latest search may render its results
+
+    async function searchDatabase(text) {
+        const seq = ++searchSeq;
+        const token = state.dbToken;
+        if (!text || !token) {
+            searchResults.innerHTML = '';
+            return;
+        }
+        searchResults.innerHTML = '<div class="p-1 text-muted">Searching...</div>';
+        try {
+            while (true) {
+                const res = await fetch(`/api/search/${token}?q=${encodeURIComponent(text)}`);
+                const data = await res.json();
+                if (seq !== searchSeq) return;
+                if (res.status === 202) {
+                    // The snapshot is being indexed in the background
+                    const pct = Math.floor((data.status.progress || 0) * 100);
+                    searchResults.innerHTML = `<div class="p-1 text-muted">Indexing database... ${pct}%</div>`;
+                    await new Promise(resolve => setTimeout(resolve, 500));
+                    if (seq !== searchSeq) return;
+                    continue;
+                }
+                if (data.error) {
+                    searchResults.innerHTML = '<div class="p-1 text-danger"></div>';
+                    searchResults.firstChild.textContent = data.error;
+                    return;
+                }
+                renderSearchResults(data.matches, data.truncated);
+                return;
+            }
+        } catch (e) {
+            if (seq === searchSeq) {
+                searchResults.innerHTML = '<div class="p-1 text-danger">Search failed</div>';
+            }
+        }
+    }
+
+    function renderSearchResults(matches, truncated) {
+        searchResults.innerHTML = '';
+        if (!matches.length) {
+            searchResults.innerHTML = '<div class="p-1 text-muted">No matches</div>';
+            return;
+        }
+        matches.forEach(m => {
+            const item = document.createElement('a');
+            item.className = 'list-group-item list-group-item-action px-1 py-1';
+            const title = document.createElement('div');
+            title.className = 'fw-bold';
+            title.textContent = `${m.table}.${m.column} `;
+            const key = document.createElement('span');
+            key.className = 'text-muted fw-normal';
+            key.textContent = m.key_columns.map((c, i) => `${c}=${m.key[i]}`).join(', ');
+            title.appendChild(key);
+
+            const snippet = document.createElement('div');
+            snippet.className = 'text-truncate';
+            if (m.highlight) {
+                const [start, end] = m.highlight;
+                const mark = document.createElement('mark');
+                mark.textContent = m.snippet.slice(start, end);
+                snippet.append(m.snippet.slice(0, start), mark, m.snippet.slice(end));
+            } else {
+                snippet.textContent = m.snippet;
+            }
+            item.append(title, snippet);
+            item.title = m.snippet;
+            item.onclick = () => openTableTab(m.table);
+            searchResults.appendChild(item);
+        });
+        if (truncated) {
+            searchResults.insertAdjacentHTML('beforeend', `<div class="p-1 text-muted">First ${matches.length} matches shown</div>`);
+        }
+    }
+
+    dbSearch.addEventListener('keydown', (e) => {
+        if (e.key === 'Enter') {
+            searchDatabase(dbSearch.value.trim());
+        }
+    });
+    // The clear (x) button of the search field
+    dbSearch.addEventListener('search', () => {
+        if (!dbSearch.value) searchDatabase('');
+    });
+
+    // Row key as /api/blob expects it: the rowid, or the key as a cursor ({"k": key})
+    function encodeRowKey(key) {
+        if (key.length === 1 && Number.isInteger(key[0])) return String(key[0]);
+        let binary = '';
+        new TextEncoder().encode(JSON.stringify({k: key})).forEach(b => binary += String.fromCharCode(b));
+        return btoa(binary).replace(/\+/g, '-').replace(/\//g, '_').replace(/=+$/, '');
+    }
+
+    function formatSize(bytes) {
+        if (bytes < 1024) return `${bytes} B`;
+        if (bytes < 1048576) return `${(bytes / 1024).toFixed(1)} KB`;
+        return `${(bytes / 1048576).toFixed(1)} MB`;
+    }
+
+    // BLOBs arrive as {$blob: size, type, sha1} stubs; the bytes are only
+    // fetched when a link is opened (raw, hex dump or protobuf decode)
+    function renderBlobCell(stub, rowKey, tableName, column) {
+        const label = `[${stub.type}, ${formatSize(stub.$blob)}]`;
+        if (!rowKey) {
+            return `<span class="text-muted" title="SHA-1 ${stub.sha1}">${label}</span>`;
+        }
+        const url = `/api/blob/${state.dbToken}/${encodeURIComponent(tableName)}/${encodeRowKey(rowKey)}/${encodeURIComponent(column)}`;
+        let html = `<a href="${url}" target="_blank" title="SHA-1 ${stub.sha1}">${label}</a>`;
+        html += ` <a href="${url}?preview=hex" target="_blank" class="small">hex</a>`;
+        if (stub.type === 'binary') {
+            html += ` <a href="${url}?preview=protobuf" target="_blank" class="small">pb</a>`;
+        }
+        return html;
+    }
+
+    function renderTableData(columns, rows, container, changedIndices = [], tableName = null) {
         if (!rows || rows.length === 0) {
             container.innerHTML = '<div class="p-3 text-muted">No data found.</div>';
             return;
         }
 
+        // Table tabs (tableName given) sort on the server when a header is clicked
+        const tabState = tableName ? state.openTabs[tableName] : null;
+        // Row keys let BLOB cells link to /api/blob (table tabs of tables with a key)
+        const keys = tabState ? tabState.lastKeys : null;
+
+        // Rows are either objects keyed by column or arrays in column order
         let html = '<table class="table table-bordered table-hover table-sm"><thead><tr>';
-        columns.forEach(col => {
-            html += `<th>${col}</th>`;
+        columns.forEach((col, i) => {
+            if (tabState) {
+                const arrow = tabState.sort === col ? (tabState.order === 'asc' ? ' &#9650;' : ' &#9660;') : '';
+                html += `<th role="button" data-col="${i}" title="Sort by ${col}">${col}${arrow}</th>`;
+            } else {
+                html += `<th>${col}</th>`;
+            }
         });
         html += '</tr></thead><tbody>';
         
@@ -804,13 +1313,23 @@ document.addEventListener('DOMContentLoaded', function() {
             const rowClass = isChanged ? 'row-changed' : '';
             
             html += `<tr class="${rowClass}">`;
-            columns.forEach(col => {
-                html += `<td>${row[col] !== null ? row[col] : '<span class="text-muted">NULL</span>'}</td>`;
+            columns.forEach((col, i) => {
+                const value = Array.isArray(row) ? row[i] : row[col];
+                if (value !== null && typeof value === 'object' && '$blob' in value) {
+                    html += `<td>${renderBlobCell(value, keys && keys[idx], tableName, col)}</td>`;
+                } else {
+                    html += `<td>${value !== null ? value : '<span class="text-muted">NULL</span>'}</td>`;
+                }
             });
             html += '</tr>';
         });
         html += '</tbody></table>';
         container.innerHTML = html;
+        if (tabState) {
+            container.querySelectorAll('th[data-col]').forEach(th => {
+                th.onclick = () => sortTable(tableName, columns[Number(th.dataset.col)]);
+            });
+        }
     }
 
     function updatePagination(tableName, total) {
@@ -820,13 +1339,13 @@ document.addEventListener('DOMContentLoaded', function() {
         const prevPage = pagination.querySelector('li:first-child');
         const nextPage = pagination.querySelector('li:last-child');
 
-        if (total > tabState.limit) {
+        if (total > tabState.limit || tabState.prevCursors.length > 0) {
             pagination.style.display = 'block';
-            const currentPage = Math.floor(tabState.offset / tabState.limit) + 1;
+            const currentPage = tabState.prevCursors.length + 1;
             pageInfo.textContent = `Page ${currentPage} (Total: ${total})`;
             
-            prevPage.classList.toggle('disabled', tabState.offset === 0);
-            nextPage.classList.toggle('disabled', tabState.offset + tabState.limit >= total);
+            prevPage.classList.toggle('disabled', tabState.prevCursors.length === 0);
+            nextPage.classList.toggle('disabled', !tabState.nextCursor);
         } else {
             pagination.style.display = 'none';
         }
@@ -884,7 +1403,7 @@ document.addEventListener('DOMContentLoaded', function() {
 
     packageSearch.onkeyup = filterPackages;
 
-    runQueryBtn.onclick = executeQuery;
+    runQueryBtn.onclick = () => executeQuery();
 
     // Initial load
     fetchDevices();
@@ -0,0 +1,61 @@
+import json
+import os
+import types
+
+import pytest
+
+from modules import adb_transport
+from modules.adb_transport import ADBTransport
+
+FAKE_ADB = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench', 'fake_adb.py')
+SERIAL = 'test-0001'
+
+pytestmark = pytest.mark.skipif(os.name == 'nt', reason='bench/fake_adb.py needs a POSIX shell')
+
+
+@pytest.fixture
+def transport(tmp_path, monkeypatch):
+    """An ADBTransport talking to an empty fake device (see bench/fake_adb.py)."""
+    os.makedirs(tmp_path / SERIAL)
+    with open(tmp_path / SERIAL / 'device.json', 'w') as f:
+        json.dump({'state': 'device', 'rooted': False, 'debuggable': []}, f)
+    monkeypatch.setenv('FAKE_ADB_ROOT', str(tmp_path))
+    transport = ADBTransport(FAKE_ADB, default_timeout=10)
+    yield transport
+    transport.close_all()
+
+
+def test_exit_codes_and_output_framing(transport):
+    assert transport.run(SERIAL, "echo one; echo two") == (0, b'one\ntwo\n', '')
+    # No trailing newline: the marker still gets a line of its own
+    assert transport.run(SERIAL, "printf 'no newline'; exit 3")[:2] == (3, b'no newline')
+    assert transport.run(SERIAL, "printf ''")[:2] == (0, b'')
+    assert transport.run(SERIAL, "echo oops >&2; false") == (1, b'', 'oops')
+
+
+def test_output_that_looks_like_a_marker(transport):
+    # A marker of an earlier command (or a stray one in a file) is plain output
+    output = b'__ADBT_0123456789abcdef0123456789abcdef__:0\nafter'
+    assert transport.run(SERIAL, f"printf '{output.decode()}'")[:2] == (0, output)
+    assert transport.run(SERIAL, "echo next") == (0, b'next\n', '')
+
+
+def test_output_containing_its_own_marker(transport, monkeypatch):
+    marker = '__ADBT_feedfacefeedfacefeedfacefeedface__'
+    monkeypatch.setattr(adb_transport, 'uuid', types.SimpleNamespace(uuid4=lambda: types.SimpleNamespace(
+        hex='feedfacefeedfacefeedfacefeedface')))
+
+    # Only a marker at the start of a line ends the frame
+    exit_code, output, _ = transport.run(SERIAL, f"echo 'x {marker}:9'; printf 'tail {marker}:7'; exit 4")
+    assert (exit_code, output) == (4, f"x {marker}:9\ntail {marker}:7".encode())
+
+
+def test_commands_cannot_read_the_following_frames(transport):
+    # stdin is detached, so `cat` can't swallow the next command
+    assert transport.run(SERIAL, "cat")[:2] == (0, b'')
+    assert transport.run(SERIAL, "echo still in sync") == (0, b'still in sync\n', '')
+
+
+def test_timeout_resets_the_session(transport):
+    assert transport.run(SERIAL, "sleep 2", timeout=0.5)[0] is None
+    assert transport.run(SERIAL, "echo fresh") == (0, b'fresh\n', '')
@@ -0,0 +1,97 @@
+import os
+import sqlite3
+
+import pytest
+
+from modules.db_manager import DBManager, encode_cursor, decode_cursor, decode_row_key
+
+
+def _database(tmp_path, sql, rows):
+    path = os.path.join(tmp_path, 'test.db')
+    conn = sqlite3.connect(path)
+    conn.execute(sql)
+    conn.executemany(f"INSERT INTO t VALUES ({', '.join('?' for _ in rows[0])})", rows)
+    conn.commit()
+    conn.close()
+    return DBManager(path)
+
+
+def _all_pages(db, limit, **kwargs):
+    """Keys of every page, following next_cursor to the end."""
+    keys, cursor = [], None
+    while True:
+        page = db.get_table_page('t', limit, cursor, **kwargs)
+        assert 'error' not in page
+        assert len(page['keys']) <= limit
+        keys.extend(page['keys'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            return keys
+
+
+def _expected(db, clause):
+    conn = sqlite3.connect(db.db_path)
+    try:
+        return [list(row) for row in conn.execute(f"SELECT rowid FROM t {clause}")]
+    finally:
+        conn.close()
+
+
+# Duplicates straddle every page boundary, and NULLs sort apart from values
+SORT_VALUES = [3, None, 1, 3, None, 2, 3, 1, None, 3, 2, 3, None, 1, 3]
+
+
+@pytest.mark.parametrize('limit', [1, 2, 3, 4, 15, 16])
+@pytest.mark.parametrize('descending', [False, True])
+def test_sorted_pages_with_duplicate_and_null_keys(tmp_path, limit, descending):
+    db = _database(str(tmp_path), "CREATE TABLE t (v, note TEXT)", [(v, f"n{i}") for i, v in enumerate(SORT_VALUES)])
+    order = 'v DESC, rowid DESC' if descending else 'v, rowid'
+
+    assert _all_pages(db, limit, sort='v', descending=descending) == _expected(db, f"ORDER BY {order}")
+
+
+@pytest.mark.parametrize('limit', [1, 3, 7])
+def test_filtered_sorted_pages(tmp_path, limit):
+    db = _database(str(tmp_path), "CREATE TABLE t (v, note TEXT)", [(v, f"n{i}") for i, v in enumerate(SORT_VALUES)])
+    filters = [{'column': 'v', 'op': '!=', 'value': 2}]
+
+    assert _all_pages(db, limit, sort='v', filters=filters) == _expected(db, "WHERE v != 2 ORDER BY v, rowid")
+
+
+@pytest.mark.parametrize('limit', [1, 2, 5, 9])
+def test_composite_primary_key_pages(tmp_path, limit):
+    rows = [(g, n, None if n % 3 else n) for g in ('a', 'b', 'c') for n in (2, 1, 3)]
+    db = _database(str(tmp_path), "CREATE TABLE t (g TEXT, n INTEGER, v, PRIMARY KEY (g, n)) WITHOUT ROWID", rows)
+    conn = sqlite3.connect(db.db_path)
+    expected = [list(row) for row in conn.execute("SELECT g, n FROM t ORDER BY g, n")]
+    sorted_expected = [list(row) for row in conn.execute("SELECT g, n FROM t ORDER BY v, g, n")]
+    conn.close()
+
+    assert _all_pages(db, limit) == expected
+    assert _all_pages(db, limit, sort='v') == sorted_expected
+
+
+@pytest.mark.parametrize('data', [
+    {'k': [1]},
+    {'k': ['text', -5, 2.5, None]},
+    {'k': [b'\x00\xffbinary', 7], 's': b'\x01\x02'},
+    {'s': None, 'k': [42]},
+    {'s': 'café', 'k': [3]},
+    {'o': 300},
+])
+def test_cursor_round_trip(data):
+    token = encode_cursor(data)
+
+    assert token.isascii() and '=' not in token
+    assert decode_cursor(token) == data
+
+
+@pytest.mark.parametrize('token', [None, '', '!!!', 'bm90IGpzb24'])
+def test_malformed_cursors_decode_to_none(token):
+    assert decode_cursor(token) is None
+
+
+def test_row_keys_from_urls():
+    assert decode_row_key('42') == [42]
+    assert decode_row_key(encode_cursor({'k': ['a', b'\x01']})) == ['a', b'\x01']
+    assert decode_row_key('not a key') is None
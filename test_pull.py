@@ -23,8 +23,7 @@ def test_pull_and_read():
     # 2. Check files on device (Debug info)
     print("\n--- Checking remote files ---")
     # We use run-as ls -l to see sizes
-    cmd = f"-s {device_id} shell \"run-as {pkg} ls -l databases/\""
-    print(adb._run_command(cmd))
+    print(adb._run_command(['-s', device_id, 'shell', f"run-as {pkg} ls -l databases/"]))
     
     # 3. Pull
     print("\n--- Pulling Database ---")
@@ -46,8 +45,9 @@ def test_pull_and_read():
             
         # 4. Read Data
         print("\n--- Reading Data ---")
+        # Merge the pulled WAL once; DBManager then opens the file read-only
+        DBManager.prepare_snapshot(local_path)
         db = DBManager(local_path)
-        # Checkpoint is done inside get_connection() now
         
         conn = db.get_connection()
         if conn:
@@ -0,0 +1,96 @@
+import os
+import sqlite3
+
+import pytest
+
+from modules.db_manager import DBManager
+from modules.result_cache import ResultCache, is_cacheable
+
+
+def _database(tmp_path, name='test.db'):
+    path = os.path.join(tmp_path, name)
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, v TEXT)")
+    conn.executemany("INSERT INTO t (v) VALUES (?)", [(f"v{i}",) for i in range(5)])
+    conn.commit()
+    conn.close()
+    return path
+
+
+def test_reads_are_served_from_the_cache(tmp_path):
+    cache = ResultCache()
+    db = DBManager(_database(str(tmp_path)), cache=cache)
+
+    first = db.execute_query("SELECT * FROM t")
+    second = db.execute_query("SELECT *\n  FROM t; -- again")
+
+    assert 'cached' not in first
+    assert second['cached'] and second['rows'] == first['rows']
+    assert cache.stats()['hits'] == 1
+
+
+def test_writes_invalidate_the_snapshot_entries(tmp_path):
+    cache = ResultCache()
+    db = DBManager(_database(str(tmp_path)), cache=cache, writable=True)
+    other = DBManager(_database(str(tmp_path), 'other.db'), cache=cache)
+    db.execute_query("SELECT count(*) FROM t")
+    db.get_table_page('t', 2)
+    other.execute_query("SELECT count(*) FROM t")
+
+    db.execute_query("INSERT INTO t (v) VALUES ('new')")
+
+    assert cache.stats()['entries'] == 1
+    assert db.execute_query("SELECT count(*) FROM t")['rows'] == [[6]]
+    assert db.get_table_page('t', 2)['total'] == 6
+    assert 'cached' in other.execute_query("SELECT count(*) FROM t")
+
+
+def test_changed_file_is_not_served_stale_results(tmp_path):
+    # Written behind the cache's back: the file signature in the key changes
+    path = _database(str(tmp_path))
+    db = DBManager(path, cache=ResultCache())
+    assert db.execute_query("SELECT count(*) FROM t")['rows'] == [[5]]
+
+    conn = sqlite3.connect(path)
+    conn.executemany("INSERT INTO t (v) VALUES (?)", [('a',), ('b',)])
+    conn.commit()
+    conn.close()
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1))
+
+    assert db.execute_query("SELECT count(*) FROM t")['rows'] == [[7]]
+
+
+def test_invalidate_and_eviction_by_size():
+    cache = ResultCache(max_bytes=100, max_entry_bytes=60)
+    cache.put(('a.db', 1), 'a1', 40)
+    cache.put(('b.db', 1), 'b1', 40)
+    assert not cache.put(('a.db', 2), 'too big', 61)
+
+    cache.invalidate('a.db')
+    assert cache.get(('a.db', 1)) is None
+    assert cache.get(('b.db', 1)) == 'b1'
+
+    cache.put(('a.db', 3), 'a3', 50)
+    cache.put(('a.db', 4), 'a4', 50)
+    # Least recently used goes first
+    assert cache.get(('b.db', 1)) is None
+    assert cache.stats()['bytes'] == 100
+
+
+@pytest.mark.parametrize('sql, cacheable', [
+    ("SELECT * FROM t", True),
+    ("WITH x AS (SELECT 1) SELECT * FROM x", True),
+    ("SELECT date(created), strftime('%Y', created) FROM t", True),
+    ("SELECT * FROM t WHERE d > date('2020-01-01')", True),
+    ("DELETE FROM t", False),
+    ("SELECT 1; DELETE FROM t", False),
+    ("WITH x AS (SELECT 1) DELETE FROM t RETURNING *", False),
+    ("SELECT random()", False),
+    ("SELECT datetime('now', '-1 day')", False),
+    ("SELECT date()", False),
+    ("SELECT julianday( )", False),
+    ("SELECT strftime('%s')", False),
+    ("SELECT CURRENT_TIMESTAMP", False),
+])
+def test_volatile_statements_are_not_cached(sql, cacheable):
+    assert is_cacheable(sql) == cacheable
@@ -0,0 +1,77 @@
+import os
+import sqlite3
+
+from modules.snapshot_store import SnapshotStore
+
+
+def _pull(store, token, rows, db_key='device.db'):
+    """Ingest a database of `rows` rows the way pull_snapshot() does."""
+    staging = store.staging_path(token)
+    conn = sqlite3.connect(staging)
+    conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, body TEXT)")
+    conn.executemany("INSERT INTO t (body) VALUES (?)", [("x" * 100,) for _ in range(rows)])
+    conn.commit()
+    conn.close()
+    return store.ingest(db_key, token, staging)
+
+
+def test_identical_pulls_share_one_object(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    first = _pull(store, 'a', 10)
+    second = _pull(store, 'b', 10)
+    third = _pull(store, 'c', 11)
+
+    assert first == second != third
+    assert store.content_key('a') == store.content_key('b')
+    assert store.stats()['tokens'] == 3
+    assert store.stats()['objects'] == 2
+    # The duplicate's staging file was dropped, not kept next to the object
+    assert os.listdir(store.staging_dir) == []
+
+
+def test_retention_evicts_objects_no_token_points_to(tmp_path):
+    evicted, forgotten = [], []
+    store = SnapshotStore(str(tmp_path), keep_per_db=2, on_evict=evicted.append, on_forget=forgotten.append)
+    paths = [_pull(store, f"t{i}", i + 1) for i in range(3)]
+
+    assert store.resolve('t0') is None
+    assert [store.resolve(t) for t in ('t1', 't2')] == paths[1:]
+    assert evicted == [paths[0]]
+    assert not os.path.exists(paths[0])
+    # Other tokens of the database remain, so it is not forgotten
+    assert forgotten == []
+
+
+def test_shared_object_survives_until_its_last_token_goes(tmp_path):
+    evicted = []
+    store = SnapshotStore(str(tmp_path), keep_per_db=2, on_evict=evicted.append)
+    shared = _pull(store, 'a', 5)
+    _pull(store, 'b', 5)
+    _pull(store, 'c', 6)
+
+    # 'a' fell out of retention, but 'b' still holds the same bytes
+    assert store.resolve('a') is None
+    assert store.resolve('b') == shared
+    assert evicted == []
+
+    _pull(store, 'd', 7)
+    assert store.resolve('b') is None
+    assert evicted == [shared]
+    assert not os.path.exists(shared)
+
+
+def test_budget_evicts_least_recently_used_and_forgets_the_database(tmp_path):
+    evicted, forgotten = [], []
+    store = SnapshotStore(str(tmp_path), on_evict=evicted.append, on_forget=forgotten.append)
+    old = _pull(store, 'old', 50, db_key='one.db')
+    recent = _pull(store, 'recent', 51, db_key='two.db')
+    store.resolve('old')
+    store.resolve('recent')  # now the most recently used
+    store.max_bytes = os.path.getsize(recent) * 2
+
+    newest = _pull(store, 'new', 60, db_key='three.db')
+
+    assert evicted == [old]
+    assert forgotten == ['one.db']
+    assert store.resolve('recent') == recent
+    assert store.resolve('new') == newest
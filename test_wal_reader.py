@@ -0,0 +1,69 @@
+import os
+import sqlite3
+
+from modules.db_manager import DBManager, connect_wal_view
+from modules.snapshot_store import SnapshotStore
+from modules.wal_reader import WalTimeline
+
+
+def _pull_with_wal(tmp_path, build, seed=0):
+    """A database of `seed` checkpointed rows, left in WAL mode with every
+    commit of build(conn) still in its -wal, ingested into a store the way
+    pull_snapshot() does."""
+    src = os.path.join(tmp_path, 'device.db')
+    conn = sqlite3.connect(src, isolation_level=None)
+    conn.execute("PRAGMA auto_vacuum = FULL")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA wal_autocheckpoint = 0")
+    conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, body TEXT)")
+    conn.executemany("INSERT INTO t (body) VALUES (?)", [("s" * 500,) for _ in range(seed)])
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    expected = build(conn)
+
+    store = SnapshotStore(os.path.join(tmp_path, 'snapshots'), prepare=DBManager.prepare_snapshot, keep_wal=True)
+    staging = store.staging_path('tok')
+    for suffix in ('', '-wal'):
+        with open(f"{src}{suffix}", 'rb') as f, open(f"{staging}{suffix}", 'wb') as out:
+            out.write(f.read())
+    conn.close()
+    store.ingest('device.db', 'tok', staging)
+    return WalTimeline(store, os.path.join(tmp_path, 'views')), expected
+
+
+def _check_views(timeline, expected):
+    commits = timeline.commits('tok')
+    assert len(commits) == len(expected)
+    for commit, rows in zip(commits, expected):
+        view = connect_wal_view(timeline.resolve(commit['token']))
+        try:
+            assert view.execute("PRAGMA integrity_check").fetchone()[0] == 'ok'
+            assert view.execute("SELECT id, body FROM t ORDER BY id").fetchall() == rows
+        finally:
+            view.close()
+
+
+def test_views_of_a_growing_database(tmp_path):
+    def build(conn):
+        expected = []
+        for i in range(3):
+            conn.execute("BEGIN")
+            conn.executemany("INSERT INTO t (body) VALUES (?)", [(f"{i}-{n}" * 50,) for n in range(40)])
+            conn.execute("UPDATE t SET body = 'x' WHERE id = 1")
+            conn.execute("COMMIT")
+            expected.append(conn.execute("SELECT id, body FROM t ORDER BY id").fetchall())
+        return expected
+
+    _check_views(*_pull_with_wal(str(tmp_path), build))
+
+
+def test_views_before_the_database_shrinks(tmp_path):
+    # auto_vacuum truncates the file on the delete: checkpointed pages that
+    # the first commit did not touch are in no frame and not in the snapshot
+    def build(conn):
+        conn.execute("INSERT INTO t (body) VALUES ('a')")
+        first = conn.execute("SELECT id, body FROM t ORDER BY id").fetchall()
+        conn.execute("DELETE FROM t WHERE id > 10")
+        second = conn.execute("SELECT id, body FROM t ORDER BY id").fetchall()
+        return [first, second]
+
+    _check_views(*_pull_with_wal(str(tmp_path), build, seed=200))